@@ -0,0 +1,43 @@
+"""composite indexes for keyset pagination and list filters
+
+Revision ID: 0002_keyset_pagination_indexes
+Revises: 0001_user_token_version
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002_keyset_pagination_indexes'
+down_revision: Union[str, Sequence[str], None] = '0001_user_token_version'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ("ix_users_company_id_id", "users", "company_id, id"),
+    ("ix_department_users_department_created", "department_users", "department_id, created_at, id"),
+    ("ix_tasks_department_created", "tasks", "department_id, created_at, id"),
+    ("ix_tasks_department_status_created", "tasks", "department_id, status, created_at, id"),
+    ("ix_tasks_assignee_created", "tasks", "assigned_to_id, created_at, id"),
+    ("ix_tasks_department_deadline", "tasks", "department_id, deadline"),
+    ("ix_subtasks_task_created", "subtasks", "task_id, created_at, id"),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY: katta jadvallarda yozishni bloklamaslik uchun, tranzaksiyadan tashqarida
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, _, _ in reversed(INDEXES):
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
@@ -0,0 +1,35 @@
+"""ws_payloads table for oversized LISTEN/NOTIFY websocket messages
+
+Revision ID: 0003_ws_payloads
+Revises: 0002_keyset_pagination_indexes
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003_ws_payloads'
+down_revision: Union[str, Sequence[str], None] = '0002_keyset_pagination_indexes'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS ws_payloads (
+            id SERIAL PRIMARY KEY,
+            payload VARCHAR NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_ws_payloads_created_at ON ws_payloads (created_at)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('ws_payloads')
@@ -0,0 +1,36 @@
+"""messages.sender_id and (chat_type, room, created_at, id) history index
+
+Revision ID: 0004_message_history
+Revises: 0003_ws_payloads
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004_message_history'
+down_revision: Union[str, Sequence[str], None] = '0003_ws_payloads'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # nullable, default'siz ustun: jadval qayta yozilmaydi; eski xabarlarda sender_id NULL
+    op.execute("ALTER TABLE messages ADD COLUMN IF NOT EXISTS sender_id INTEGER REFERENCES users(id) ON DELETE SET NULL")
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_type_room_created "
+            "ON messages (chat_type, room, created_at, id)"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_messages_type_room_created")
+    op.execute("ALTER TABLE messages DROP COLUMN IF EXISTS sender_id")
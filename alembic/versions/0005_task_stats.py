@@ -0,0 +1,44 @@
+"""task_stats summary table (department, assignee, status) -> count
+
+Revision ID: 0005_task_stats
+Revises: 0004_message_history
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005_task_stats'
+down_revision: Union[str, Sequence[str], None] = '0004_message_history'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS task_stats (
+            department_id INTEGER NOT NULL REFERENCES departments(id) ON DELETE CASCADE,
+            assignee_id INTEGER NOT NULL DEFAULT 0,
+            status taskstatusenum NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (department_id, assignee_id, status)
+        )
+    """)
+    # boshlang'ich to'ldirish: bitta GROUP BY (keyin ilova reconcile job'i ham tekshiradi)
+    op.execute("""
+        INSERT INTO task_stats (department_id, assignee_id, status, count)
+        SELECT department_id, COALESCE(assigned_to_id, 0), COALESCE(status, 'to_do'), count(*)
+        FROM tasks
+        GROUP BY 1, 2, 3
+        ON CONFLICT (department_id, assignee_id, status) DO UPDATE SET count = EXCLUDED.count
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('task_stats')
@@ -0,0 +1,34 @@
+"""resource_versions: per-scope change counters behind list/detail ETags
+
+Revision ID: 0006_resource_versions
+Revises: 0005_task_stats
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006_resource_versions'
+down_revision: Union[str, Sequence[str], None] = '0005_task_stats'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # bo'sh jadval: yo'q scope 0-versiya deb hisoblanadi
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS resource_versions (
+            scope VARCHAR PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('resource_versions')
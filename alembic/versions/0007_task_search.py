@@ -0,0 +1,91 @@
+"""tasks.search_vector: full-text search over title, description and subtask titles
+
+Revision ID: 0007_task_search
+Revises: 0006_resource_versions
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007_task_search'
+down_revision: Union[str, Sequence[str], None] = '0006_resource_versions'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH_SIZE = 5000
+
+SEARCH_DDL = """
+CREATE OR REPLACE FUNCTION task_search_document(task_title text, task_description text, target_id integer)
+RETURNS tsvector LANGUAGE sql STABLE AS $$
+    SELECT setweight(to_tsvector('simple', coalesce(task_title, '')), 'A')
+        || setweight(to_tsvector('simple', coalesce(task_description, '')), 'B')
+        || setweight(to_tsvector('simple', coalesce(
+               (SELECT string_agg(s.title, ' ' ORDER BY s.id) FROM subtasks s WHERE s.task_id = target_id), '')), 'C')
+$$;
+
+CREATE OR REPLACE FUNCTION tasks_search_vector_refresh() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.search_vector := task_search_document(NEW.title, NEW.description, NEW.id);
+    RETURN NEW;
+END $$;
+
+CREATE OR REPLACE FUNCTION subtasks_search_vector_refresh() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE tasks SET search_vector = task_search_document(title, description, id)
+    WHERE id IN (OLD.task_id, NEW.task_id);
+    RETURN NULL;
+END $$;
+
+DROP TRIGGER IF EXISTS tasks_search_vector ON tasks;
+CREATE TRIGGER tasks_search_vector BEFORE INSERT OR UPDATE OF title, description ON tasks
+    FOR EACH ROW EXECUTE FUNCTION tasks_search_vector_refresh();
+
+DROP TRIGGER IF EXISTS subtasks_search_vector ON subtasks;
+CREATE TRIGGER subtasks_search_vector AFTER INSERT OR DELETE OR UPDATE OF title, task_id ON subtasks
+    FOR EACH ROW EXECUTE FUNCTION subtasks_search_vector_refresh();
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # nullable, default'siz ustun: jadval qayta yozilmaydi
+    op.execute("ALTER TABLE tasks ADD COLUMN IF NOT EXISTS search_vector tsvector")
+    # trigger'lar backfill'dan oldin: shu paytdan yozilgan qatorlar o'zi to'ladi
+    op.execute(SEARCH_DDL)
+    with op.get_context().autocommit_block():
+        # har bir partiya alohida tranzaksiya: qator lock'lari qisqa, VACUUM ulguradi
+        bind = op.get_bind()
+        last_id = 0
+        while True:
+            last_id = bind.execute(sa.text("""
+                WITH batch AS (
+                    SELECT id FROM tasks WHERE id > :last_id ORDER BY id LIMIT :batch_size
+                ), updated AS (
+                    UPDATE tasks t SET search_vector = task_search_document(t.title, t.description, t.id)
+                    FROM batch WHERE t.id = batch.id AND t.search_vector IS NULL
+                )
+                SELECT max(id) FROM batch
+            """), {"last_id": last_id, "batch_size": BACKFILL_BATCH_SIZE}).scalar()
+            if last_id is None:
+                break
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tasks_search_vector "
+            "ON tasks USING GIN (search_vector)"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_tasks_search_vector")
+    op.execute("DROP TRIGGER IF EXISTS subtasks_search_vector ON subtasks")
+    op.execute("DROP TRIGGER IF EXISTS tasks_search_vector ON tasks")
+    op.execute("DROP FUNCTION IF EXISTS subtasks_search_vector_refresh()")
+    op.execute("DROP FUNCTION IF EXISTS tasks_search_vector_refresh()")
+    op.execute("DROP FUNCTION IF EXISTS task_search_document(text, text, integer)")
+    op.execute("ALTER TABLE tasks DROP COLUMN IF EXISTS search_vector")
@@ -0,0 +1,44 @@
+"""outbox_events: change events written with every task/subtask/department mutation
+
+Revision ID: 0009_outbox_events
+Revises: 0008_task_deadline_index
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0009_outbox_events'
+down_revision: Union[str, Sequence[str], None] = '0008_task_deadline_index'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # yangi jadval: indekslarni CONCURRENTLY qurish shart emas
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS outbox_events (
+            id BIGSERIAL PRIMARY KEY,
+            position BIGINT UNIQUE,
+            topic VARCHAR NOT NULL,
+            entity VARCHAR NOT NULL,
+            entity_id INTEGER NOT NULL,
+            op VARCHAR NOT NULL,
+            payload TEXT NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_outbox_events_pending ON outbox_events (id) WHERE position IS NULL")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_outbox_events_topic_position ON outbox_events (topic, position)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_outbox_events_entity ON outbox_events (entity, entity_id, topic, position)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('outbox_events')
+    op.execute("DELETE FROM resource_versions WHERE scope = 'outbox:retained'")
@@ -0,0 +1,121 @@
+"""company_id on departments, tasks, subtasks and messages with company-leading indexes
+
+Revision ID: 0010_company_id
+Revises: 0009_outbox_events
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0010_company_id'
+down_revision: Union[str, Sequence[str], None] = '0009_outbox_events'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH_SIZE = 5000
+
+TABLES = ("departments", "tasks", "subtasks", "messages")
+
+# tartib muhim: tasks departments'dan, subtasks tasks'dan oladi
+BACKFILLS = [
+    # bo'lim: menejerining kompaniyasi, menejersiz bo'lsa — a'zolaridan birining
+    ("departments", """
+        UPDATE departments d SET company_id = coalesce(
+            (SELECT u.company_id FROM users u WHERE u.id = d.manager_id),
+            (SELECT min(u.company_id) FROM department_users du JOIN users u ON u.id = du.user_id
+             WHERE du.department_id = d.id))
+        FROM batch WHERE d.id = batch.id AND d.company_id IS NULL
+    """),
+    ("tasks", """
+        UPDATE tasks t SET company_id = d.company_id
+        FROM batch, departments d WHERE t.id = batch.id AND d.id = t.department_id AND t.company_id IS NULL
+    """),
+    ("subtasks", """
+        UPDATE subtasks s SET company_id = t.company_id
+        FROM batch, tasks t WHERE s.id = batch.id AND t.id = s.task_id AND s.company_id IS NULL
+    """),
+    # bo'lim xonasi — bo'limning, shaxsiy xona — yuboruvchining kompaniyasi
+    ("messages", """
+        UPDATE messages m SET company_id = CASE WHEN m.chat_type = 'department'
+            THEN (SELECT d.company_id FROM departments d
+                  WHERE d.id = CASE WHEN m.room ~ '^[0-9]{1,9}$' THEN m.room::integer END)
+            ELSE (SELECT u.company_id FROM users u WHERE u.id = m.sender_id) END
+        FROM batch WHERE m.id = batch.id AND m.company_id IS NULL
+    """),
+]
+
+INDEXES = [
+    ("ix_departments_company_id_id", "departments", "company_id, id"),
+    ("ix_tasks_company_department_created", "tasks", "company_id, department_id, created_at, id"),
+    ("ix_tasks_company_department_status_created", "tasks", "company_id, department_id, status, created_at, id"),
+    ("ix_tasks_company_department_deadline", "tasks", "company_id, department_id, deadline"),
+    ("ix_subtasks_company_task", "subtasks", "company_id, task_id"),
+    ("ix_messages_company_type_room_created", "messages", "company_id, chat_type, room, created_at, id"),
+]
+
+# yangi indekslar prefiks sifatida qoplaydi
+REPLACED_INDEXES = [
+    ("ix_tasks_department_created", "tasks", "department_id, created_at, id"),
+    ("ix_tasks_department_status_created", "tasks", "department_id, status, created_at, id"),
+    ("ix_tasks_department_deadline", "tasks", "department_id, deadline"),
+    ("ix_messages_type_room_created", "messages", "chat_type, room, created_at, id"),
+]
+
+
+def backfill(bind, table: str, update: str) -> None:
+    last_id = 0
+    while True:
+        last_id = bind.execute(sa.text(f"""
+            WITH batch AS (
+                SELECT id FROM {table} WHERE id > :last_id ORDER BY id LIMIT :batch_size
+            ), updated AS ({update})
+            SELECT max(id) FROM batch
+        """), {"last_id": last_id, "batch_size": BACKFILL_BATCH_SIZE}).scalar()
+        if last_id is None:
+            break
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # nullable, default'siz ustun + NOT VALID FK: jadval qayta yozilmaydi va skan qilinmaydi;
+    # shu paytdan yangi ilova qatorlarni company_id bilan yozadi
+    for table in TABLES:
+        op.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS company_id INTEGER")
+        op.execute(f"""
+            DO $$ BEGIN
+                ALTER TABLE {table} ADD CONSTRAINT {table}_company_id_fkey
+                    FOREIGN KEY (company_id) REFERENCES companies (id) NOT VALID;
+            EXCEPTION WHEN duplicate_object THEN NULL;
+            END $$
+        """)
+    with op.get_context().autocommit_block():
+        # har bir partiya alohida tranzaksiya: qator lock'lari qisqa, VACUUM ulguradi.
+        # Qayta ishga tushirsa bo'ladi: faqat company_id IS NULL qatorlar yangilanadi
+        bind = op.get_bind()
+        for table, update in BACKFILLS:
+            backfill(bind, table, update)
+        for table in TABLES:
+            # SHARE UPDATE EXCLUSIVE: yozishni bloklamaydi
+            op.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {table}_company_id_fkey")
+        for name, table, columns in INDEXES:
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})")
+        for name, _, _ in REPLACED_INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        for table in TABLES:
+            op.execute(f"ANALYZE {table}")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, columns in REPLACED_INDEXES:
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})")
+        for name, _, _ in reversed(INDEXES):
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    for table in reversed(TABLES):
+        op.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS company_id")
@@ -0,0 +1,216 @@
+"""optional: partition tasks and messages by company_id (PARTITION_BY_COMPANY)
+
+Revision ID: 0011_partition_by_company
+Revises: 0010_company_id
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+import os
+import re
+import time
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0011_partition_by_company'
+down_revision: Union[str, Sequence[str], None] = '0010_company_id'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# "" — bo'linmaydi (migratsiya hech narsa qilmaydi); "hash:16" — 16 ta HASH bo'lak;
+# "list:3,17" — shu kompaniyalarga alohida bo'lak, qolganlari tasks_default/messages_default'da
+PARTITION_BY_COMPANY = os.getenv("PARTITION_BY_COMPANY", "")
+COPY_BATCH_SIZE = 5000
+# almashtirish ACCESS EXCLUSIVE lock oladi: kutib qolmasin, qayta urinadi
+SWAP_LOCK_TIMEOUT = "5s"
+SWAP_ATTEMPTS = 10
+
+TABLES = ("tasks", "messages")
+
+# bo'lishdan oldin bo'sh yoki mos kelmaydigan company_id bo'lmasligi kerak
+CHECKS = {
+    "tasks": [
+        "SELECT id FROM departments WHERE company_id IS NULL",
+        "SELECT id FROM tasks WHERE company_id IS NULL",
+        "SELECT s.id FROM subtasks s JOIN tasks t ON t.id = s.task_id WHERE s.company_id IS DISTINCT FROM t.company_id",
+    ],
+    "messages": [
+        "SELECT id FROM messages WHERE company_id IS NULL",
+    ],
+}
+
+_INDEX = re.compile(r"^CREATE (UNIQUE )?INDEX (\S+) ON (?:ONLY )?\S+ ")
+_SIMPLE_FK = re.compile(r"FOREIGN KEY \((\w+)\) REFERENCES (\S+)\(id\)")
+_COMPANY_FK = re.compile(r"FOREIGN KEY \(company_id, (\w+)\) REFERENCES (\S+)\(company_id, id\)")
+
+
+def partition_clause(spec: str, table: str) -> tuple[str, list[str]]:
+    """``PARTITION BY`` clause and the ``CREATE TABLE ... PARTITION OF`` statements for ``spec``."""
+    kind, _, arg = spec.partition(":")
+    shadow = f"{table}_rebuild"
+    if kind == "hash" and arg.isdigit() and int(arg) > 0:
+        modulus = int(arg)
+        return "HASH (company_id)", [
+            f"CREATE TABLE {table}_p{i} PARTITION OF {shadow} FOR VALUES WITH (MODULUS {modulus}, REMAINDER {i})"
+            for i in range(modulus)
+        ]
+    if kind == "list" and arg:
+        companies = [int(company_id) for company_id in arg.split(",")]
+        return "LIST (company_id)", [
+            *(f"CREATE TABLE {table}_company_{c} PARTITION OF {shadow} FOR VALUES IN ({c})" for c in companies),
+            f"CREATE TABLE {table}_default PARTITION OF {shadow} DEFAULT",
+        ]
+    raise ValueError(f"PARTITION_BY_COMPANY: expected 'hash:N' or 'list:id,id,...', got {spec!r}")
+
+
+def rewrite_fk(definition: str, partitioned: bool) -> str:
+    # bo'lingan jadvalning unikal kaliti (company_id, id): unga ishora qiluvchi FK ham company_id bilan
+    if partitioned:
+        return _SIMPLE_FK.sub(r"FOREIGN KEY (company_id, \1) REFERENCES \2(company_id, id)", definition)
+    return _COMPANY_FK.sub(r"FOREIGN KEY (\1) REFERENCES \2(id)", definition)
+
+
+def is_partitioned(bind, table: str) -> bool:
+    return bind.execute(
+        sa.text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table))"),
+        {"table": table},
+    ).scalar()
+
+
+def rebuild(bind, table: str, partition_by: str | None, partitions: list[str]) -> None:
+    """Rewrite ``table`` into a new (partitioned or plain) table while it stays writable.
+
+    A trigger mirrors every write into ``{table}_rebuild`` while existing rows
+    are copied in short batches; then one transaction under a short
+    ACCESS EXCLUSIVE lock drops the old table and renames the new one in.
+    Indexes, foreign keys, triggers and the id sequence carry over; foreign
+    keys pointing at ``table`` gain/lose ``company_id``.
+    """
+    shadow, mirror = f"{table}_rebuild", f"{table}_rebuild_mirror"
+    params = {"table": table}
+    pkey = bind.execute(sa.text(
+        "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(:table) AND contype = 'p'"), params).scalar()
+    indexes = bind.execute(sa.text(
+        "SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = :table "
+        "AND indexname <> :pkey"), {**params, "pkey": pkey}).all()
+    outgoing = bind.execute(sa.text(
+        "SELECT conname, pg_get_constraintdef(oid) AS definition FROM pg_constraint "
+        "WHERE conrelid = to_regclass(:table) AND contype = 'f'"), params).all()
+    incoming = bind.execute(sa.text(
+        "SELECT conrelid::regclass::text AS source, conname, pg_get_constraintdef(oid) AS definition FROM pg_constraint "
+        "WHERE confrelid = to_regclass(:table) AND contype = 'f' AND conrelid <> confrelid"), params).all()
+    triggers = bind.execute(sa.text(
+        "SELECT pg_get_triggerdef(oid) FROM pg_trigger WHERE tgrelid = to_regclass(:table) AND NOT tgisinternal "
+        "AND tgname <> :mirror"), {**params, "mirror": mirror}).scalars().all()
+    sequence = bind.execute(sa.text("SELECT pg_get_serial_sequence(:table, 'id')"), params).scalar()
+
+    # oldingi muvaffaqiyatsiz urinishdan qolganlar
+    op.execute(f"DROP TRIGGER IF EXISTS {mirror} ON {table}")
+    op.execute(f"DROP TABLE IF EXISTS {shadow}")
+
+    # 1. bo'sh nusxa: ustunlar tartibi bir xil (LIKE), indeks va FK'lar bo'sh jadvalda darhol quriladi
+    op.execute(
+        f"CREATE TABLE {shadow} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        + (f" PARTITION BY {partition_by}" if partition_by else "")
+    )
+    if partition_by:
+        op.execute(f"ALTER TABLE {shadow} ADD CONSTRAINT {pkey}_rebuild PRIMARY KEY (company_id, id)")
+    else:
+        op.execute(f"ALTER TABLE {shadow} ALTER COLUMN company_id DROP NOT NULL")
+        op.execute(f"ALTER TABLE {shadow} ADD CONSTRAINT {pkey}_rebuild PRIMARY KEY (id)")
+    for statement in partitions:
+        op.execute(statement)
+    for name, definition in indexes:
+        op.execute(_INDEX.sub(lambda m: f"CREATE {m.group(1) or ''}INDEX {name}_rebuild ON {shadow} ", definition))
+    for name, definition in outgoing:
+        op.execute(f"ALTER TABLE {shadow} ADD CONSTRAINT {name} {definition}")
+
+    # 2. shu paytdan har bir yozuv nusxaga ham tushadi (UPDATE: o'chirib qayta qo'yish, company_id o'zgarsa ham)
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION {mirror}() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                DELETE FROM {shadow} WHERE company_id = OLD.company_id AND id = OLD.id;
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                INSERT INTO {shadow} SELECT (NEW).*;
+            END IF;
+            RETURN NULL;
+        END $$
+    """)
+    op.execute(f"CREATE TRIGGER {mirror} AFTER INSERT OR UPDATE OR DELETE ON {table} FOR EACH ROW EXECUTE FUNCTION {mirror}()")
+
+    # 3. mavjud qatorlar partiyalab; FOR SHARE: partiya yozilguncha qator o'zgarmaydi,
+    # trigger allaqachon ko'chirgan (yangiroq) qatorlar ON CONFLICT'da qoladi
+    last_id = 0
+    while True:
+        last_id = bind.execute(sa.text(f"""
+            WITH batch AS (
+                SELECT * FROM {table} WHERE id > :last_id ORDER BY id LIMIT :batch_size FOR SHARE
+            ), copied AS (
+                INSERT INTO {shadow} SELECT * FROM batch ON CONFLICT DO NOTHING
+            )
+            SELECT max(id) FROM batch
+        """), {"last_id": last_id, "batch_size": COPY_BATCH_SIZE}).scalar()
+        if last_id is None:
+            break
+
+    # 4. almashtirish: bitta tranzaksiya (DO bloki), yozuvchilar faqat shu vaqt kutadi
+    swap = [
+        f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'",
+        f"LOCK TABLE {', '.join([*(fk.source for fk in incoming), table])} IN ACCESS EXCLUSIVE MODE",
+        *(f"ALTER TABLE {fk.source} DROP CONSTRAINT {fk.conname}" for fk in incoming),
+        f"ALTER SEQUENCE {sequence} OWNED BY NONE",
+        f"DROP TABLE {table}",
+        f"ALTER TABLE {shadow} RENAME TO {table}",
+        f"ALTER TABLE {table} RENAME CONSTRAINT {pkey}_rebuild TO {pkey}",
+        *(f"ALTER INDEX {name}_rebuild RENAME TO {name}" for name, _ in indexes),
+        f"ALTER SEQUENCE {sequence} OWNED BY {table}.id",
+        *triggers,
+        *(f"ALTER TABLE {fk.source} ADD CONSTRAINT {fk.conname} {rewrite_fk(fk.definition, bool(partition_by))} NOT VALID" for fk in incoming),
+    ]
+    body = ";\n".join(swap)
+    for attempt in range(1, SWAP_ATTEMPTS + 1):
+        try:
+            op.execute(f"DO $swap$ BEGIN\n{body};\nEND $swap$")
+            break
+        except sa.exc.OperationalError:
+            # lock_timeout yoki deadlock: hech narsa o'zgarmagan, trigger ishlashda davom etadi
+            if attempt == SWAP_ATTEMPTS:
+                raise
+            time.sleep(attempt)
+    op.execute(f"DROP FUNCTION IF EXISTS {mirror}()")
+    for fk in incoming:
+        op.execute(f"ALTER TABLE {fk.source} VALIDATE CONSTRAINT {fk.conname}")
+    op.execute(f"ANALYZE {table}")
+
+
+def check_company_ids(bind, table: str) -> None:
+    for query in CHECKS[table]:
+        if bind.execute(sa.text(f"{query} LIMIT 1")).first() is not None:
+            raise RuntimeError(f"{table}: can't partition by company_id, fix these rows first: {query}")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if not PARTITION_BY_COMPANY:
+        return
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        for table in TABLES:
+            if is_partitioned(bind, table):
+                continue
+            check_company_ids(bind, table)
+            rebuild(bind, table, *partition_clause(PARTITION_BY_COMPANY, table))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        for table in reversed(TABLES):
+            if is_partitioned(bind, table):
+                rebuild(bind, table, None, [])
@@ -0,0 +1,93 @@
+from dataclasses import dataclass
+from fastapi import HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .cache import access_cache
+from .models import RoleEnum, Department, DepartmentUser, User
+from .schemas import TokenClaims
+
+
+@dataclass(frozen=True)
+class AccessSet:
+    user_id: int
+    role: RoleEnum
+    company_id: int | None
+    managed: frozenset[int]
+    member: frozenset[int]
+    # company_admin uchun: kompaniyaning barcha bo'limlari (boshqalarda bo'sh)
+    company_departments: frozenset[int] = frozenset()
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role == RoleEnum.company_admin
+
+    def can_view(self, department_id: int) -> bool:
+        return self.can_manage(department_id) or department_id in self.member
+
+    def can_manage(self, department_id: int) -> bool:
+        return department_id in self.managed or department_id in self.company_departments
+
+
+async def get_access_set(db: AsyncSession, user: TokenClaims) -> AccessSet:
+    """Departments the user manages or belongs to (for a company_admin, all of the company's), cached per user.
+
+    crud invalidates the entry whenever department managers or memberships
+    change, and for the company's admins whenever a department is created or
+    deleted; other workers catch up within ACCESS_CACHE_TTL.
+    """
+    cached = access_cache.get(user.id)
+    if cached is not None and cached.role == user.role and cached.company_id == user.company_id:
+        return cached
+    managed = (await db.scalars(select(Department.id).filter(Department.manager_id == user.id))).all()
+    member = (await db.scalars(select(DepartmentUser.department_id).filter(DepartmentUser.user_id == user.id))).all()
+    company_departments = []
+    if user.role == RoleEnum.company_admin and user.company_id is not None:
+        company_departments = (await db.scalars(select(Department.id).filter(Department.company_id == user.company_id))).all()
+    access = AccessSet(user.id, user.role, user.company_id, frozenset(managed), frozenset(member), frozenset(company_departments))
+    access_cache.set(user.id, access)
+    return access
+
+
+def visible_departments(access: AccessSet) -> frozenset[int]:
+    """Departments the user may read, for ``Department.id.in_()`` style filters.
+
+    A company_admin sees the departments of their company.
+    """
+    return access.managed | access.member | access.company_departments
+
+
+async def authorize_department(db: AsyncSession, user: TokenClaims, department_id: int,
+                               manage: bool = False, detail: str = "Sizda ushbu bo'lim uchun huquq yo'q") -> AccessSet:
+    """Set lookup; the DB is only asked whether the department exists when a non-admin is denied.
+
+    A company_admin's set holds every department of their company, so anything
+    else (another company's or a missing one) is reported as missing.
+    """
+    access = await get_access_set(db, user)
+    if (access.can_manage(department_id) if manage else access.can_view(department_id)):
+        return access
+    if access.is_admin or await db.scalar(select(Department.id).filter(Department.id == department_id)) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Department not found")
+    raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=detail)
+
+
+def private_peer(room: str, user_id: int) -> int | None:
+    """The other participant of a private room named ``"{user_id}-{user_id}"``, or None if ``user_id`` isn't one."""
+    first, sep, second = room.partition("-")
+    if not (sep and first.isdigit() and second.isdigit()):
+        return None
+    first, second = int(first), int(second)
+    if user_id not in (first, second):
+        return None
+    return second if user_id == first else first
+
+
+async def authorize_private_room(db: AsyncSession, user: TokenClaims, room: str,
+                                 detail: str = "Siz bu xona ishtirokchisi emassiz") -> None:
+    """Only the two users named in the room id, and only within one company."""
+    peer = private_peer(room, user.id)
+    if peer is None:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=detail)
+    row = (await db.execute(select(User.company_id).filter(User.id == peer))).first()
+    if row is None or row.company_id is None or row.company_id != user.company_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=detail)
@@ -1,16 +1,16 @@
 from datetime import datetime, timedelta
 from jose import JWTError, jwt, ExpiredSignatureError
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, WebSocket, WebSocketException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select, inspect as sa_inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 from datetime import timedelta
-from . import crud, models
-from .database import get_db
+from . import crud, models, schemas, hashing
+from .database import get_db, db_session
+from .cache import user_cache, token_version_cache, invalidate_user
 import os
 from dotenv import load_dotenv
-from passlib.context import CryptContext
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 REFRESH_TOKEN_EXPIRE_DAYS = 30
 
@@ -22,10 +22,18 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
-def authenticate_user(db: Session, email: str, password: str):
-    user = crud.get_user_by_email(db, email)
-    if not user or not crud.verify_password(password, user.hashed_password):
+async def authenticate_user(db: AsyncSession, email: str, password: str):
+    user = await crud.get_user_by_email(db, email)
+    if not user:
+        return False
+    ok, new_hash = await hashing.verify_and_update(password, user.hashed_password)
+    if not ok:
         return False
+    if new_hash:
+        # BCRYPT_ROUNDS o'zgargan: hash yangi cost bilan saqlanadi
+        user.hashed_password = new_hash
+        await db.commit()
+        invalidate_user(user.id)
     return user
 
 from datetime import datetime, timedelta
@@ -57,7 +65,47 @@ def create_refresh_token(data: dict, expires_delta: timedelta | None = None) ->
     to_encode["exp"] = expire
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def snapshot_user(user: models.User) -> models.User:
+    # sessiyaga bog'lanmagan nusxa: keshda requestlar orasida ulashiladi
+    snapshot = models.User(**{attr.key: getattr(user, attr.key) for attr in sa_inspect(models.User).column_attrs})
+    make_transient_to_detached(snapshot)
+    return snapshot
+
+async def load_user(db: AsyncSession, user_id: int) -> models.User | None:
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        # load=False: DB'ga so'rov yubormasdan sessiyaga biriktiradi
+        return await db.merge(cached, load=False)
+    user = await db.get(models.User, user_id)
+    if user is not None:
+        user_cache.set(user_id, snapshot_user(user))
+    return user
+
+def token_claims(user: models.User) -> dict:
+    # require_role va ruxsat tekshiruvlari DB'siz ishlashi uchun
+    return {
+        "sub": user.id,
+        "role": user.role.value if user.role is not None else None,
+        "company_id": user.company_id,
+        "ver": user.token_version or 0,
+    }
+
+def revoked_token_error() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Token has been revoked",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+async def get_token_version(db: AsyncSession, user_id: int) -> int | None:
+    version = token_version_cache.get(user_id)
+    if version is None:
+        version = await db.scalar(select(models.User.token_version).filter(models.User.id == user_id))
+        if version is not None:
+            token_version_cache.set(user_id, version)
+    return version
+
+def decode_access_token(token: str) -> tuple[int, dict]:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("sub")
@@ -87,19 +135,59 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
             detail=f"Invalid token: {str(e)}",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    return user_id, payload
 
-    user = db.query(models.User).get(user_id)
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    user_id, payload = decode_access_token(token)
+
+    user = await load_user(db, user_id)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"User with id {user_id} not found",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if "ver" in payload and payload["ver"] != (user.token_version or 0):
+        raise revoked_token_error()
 
     return user
 
+async def get_current_claims(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> schemas.TokenClaims:
+    """Authorize from the token alone; only the token version is checked, from cache.
+
+    Tokens issued before role/company claims existed fall back to loading the user.
+    """
+    user_id, payload = decode_access_token(token)
+    if "role" not in payload or "ver" not in payload:
+        user = await get_current_user(token, db)
+        return schemas.TokenClaims(id=user.id, role=user.role, company_id=user.company_id, token_version=user.token_version or 0)
+
+    version = await get_token_version(db, user_id)
+    if version is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=f"User with id {user_id} not found",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if version != payload["ver"]:
+        raise revoked_token_error()
+    return schemas.TokenClaims(id=user_id, role=payload["role"], company_id=payload.get("company_id"), token_version=version)
+
+async def get_ws_claims(ws: WebSocket, token: str | None = Query(None)) -> schemas.TokenClaims:
+    # brauzer WebSocket'i sarlavha yubora olmaydi: token ?token= orqali ham qabul qilinadi
+    scheme, _, header_token = ws.headers.get("authorization", "").partition(" ")
+    token = token or (header_token if scheme.lower() == "bearer" else None)
+    if not token:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason="Not authenticated")
+    try:
+        # Depends(get_db) sessiyasi socket yopilguncha ulanishni band qilib turardi
+        async with db_session() as db:
+            return await get_current_claims(token, db)
+    except HTTPException as e:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason=str(e.detail))
+
 async def get_current_user_from_refresh_token(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)
 ):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -107,18 +195,14 @@ async def get_current_user_from_refresh_token(
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid token")
 
-        user = db.query(models.User).get(int(user_id))
+        user = await load_user(db, int(user_id))
         if user is None:
             raise HTTPException(status_code=401, detail="User not found")
+        if "ver" in payload and payload["ver"] != (user.token_version or 0):
+            raise HTTPException(status_code=401, detail="Refresh token revoked")
 
         return user
     except ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Refresh token expired")
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid refresh token")
-    
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
\ No newline at end of file
@@ -0,0 +1,117 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Bounded in-process LRU cache whose entries expire after ``ttl`` seconds.
+
+    Each uvicorn worker has its own copy, so writers must invalidate locally
+    and accept up to ``ttl`` seconds of staleness in the other workers.
+    """
+
+    def __init__(self, name: str, maxsize: int = 10000, ttl: float = 30.0):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        caches[name] = self
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING or item[0] < now:
+                if item is not _MISSING:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            if self._data.pop(key, _MISSING) is not _MISSING:
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+# nomi bo'yicha barcha keshlar (/debug/caches uchun)
+caches: dict[str, TTLCache] = {}
+
+
+def cache_stats() -> dict:
+    return {name: cache.stats() for name, cache in caches.items()}
+
+
+# get_current_user uchun: user id -> detached User snapshot
+user_cache = TTLCache(
+    "users",
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("USER_CACHE_TTL", "30")),
+)
+
+
+# user id -> token_version (JWT bekor qilinganini tekshirish uchun)
+token_version_cache = TTLCache(
+    "token_versions",
+    maxsize=int(os.getenv("TOKEN_VERSION_CACHE_SIZE", "50000")),
+    ttl=float(os.getenv("TOKEN_VERSION_CACHE_TTL", "30")),
+)
+
+
+def invalidate_user(user_id: int) -> None:
+    user_cache.invalidate(user_id)
+    token_version_cache.invalidate(user_id)
+
+
+# user id -> AccessSet (boshqaradigan/a'zo bo'lgan bo'limlar), ruxsat tekshiruvlari uchun
+access_cache = TTLCache(
+    "access_sets",
+    maxsize=int(os.getenv("ACCESS_CACHE_SIZE", "50000")),
+    ttl=float(os.getenv("ACCESS_CACHE_TTL", "30")),
+)
+
+
+def invalidate_access(*user_ids: int | None) -> None:
+    for user_id in user_ids:
+        if user_id is not None:
+            access_cache.invalidate(user_id)
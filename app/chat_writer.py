@@ -0,0 +1,114 @@
+import os
+import asyncio
+import logging
+from dotenv import load_dotenv
+from . import crud
+from .database import db_session
+from .utils import manager
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# N ta xabar yig'ilsa yoki M ms o'tsa bitta INSERT bilan yoziladi
+CHAT_FLUSH_MAX_MESSAGES = int(os.getenv("CHAT_FLUSH_MAX_MESSAGES", "200"))
+CHAT_FLUSH_INTERVAL_MS = float(os.getenv("CHAT_FLUSH_INTERVAL_MS", "20"))
+CHAT_WRITE_QUEUE_SIZE = int(os.getenv("CHAT_WRITE_QUEUE_SIZE", "10000"))
+# strict: xabar DB'ga yozilmaguncha boshqalarga tarqatilmaydi
+CHAT_WRITE_STRICT = os.getenv("CHAT_WRITE_STRICT", "0").lower() not in ("0", "false", "no")
+
+
+class ChatWriter:
+    """Group-commit writer: many chat messages, one INSERT and one commit.
+
+    ``submit`` returns a future that resolves to the message id once the
+    batch holding it is committed, or fails with the flush error.
+    """
+
+    def __init__(self, max_messages: int = CHAT_FLUSH_MAX_MESSAGES,
+                 interval_ms: float = CHAT_FLUSH_INTERVAL_MS, queue_size: int = CHAT_WRITE_QUEUE_SIZE):
+        self.max_messages = max_messages
+        self.interval = interval_ms / 1000
+        self.queue_size = queue_size
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self.flushes = 0
+        self.written = 0
+        self.failed = 0
+
+    async def start(self):
+        self._queue = asyncio.Queue(self.queue_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # navbatdagi xabarlar yozib bo'lingach to'xtaydi
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, content: str, chat_type, room: str, sender_id: int | None = None,
+                     company_id: int | None = None) -> asyncio.Future:
+        if self._task is None:
+            await self.start()
+        future = asyncio.get_running_loop().create_future()
+        # navbat to'lsa yuboruvchi kutadi (backpressure)
+        await self._queue.put((dict(content=content, chat_type=chat_type, room=room, sender_id=sender_id, company_id=company_id), future))
+        return future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            try:
+                async with asyncio.timeout_at(loop.time() + self.interval):
+                    while len(batch) < self.max_messages:
+                        item = await self._queue.get()
+                        if item is None:
+                            stopping = True
+                            break
+                        batch.append(item)
+            except TimeoutError:
+                pass
+            await self._flush(batch)
+
+    async def _flush(self, batch: list):
+        try:
+            async with db_session() as db:
+                written = await crud.create_messages(db, [row for row, _ in batch])
+        except Exception as e:
+            logger.exception("chat flush failed (%d messages)", len(batch))
+            self.failed += len(batch)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.flushes += 1
+        self.written += len(batch)
+        records = []
+        for (row, future), (message_id, created_at) in zip(batch, written):
+            records.append({**row, "id": message_id, "created_at": created_at})
+            if not future.done():
+                future.set_result(message_id)
+        try:
+            await manager.publish_history(records)
+        except Exception:
+            logger.exception("chat history publish failed")
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "flushes": self.flushes,
+            "written": self.written,
+            "failed": self.failed,
+            "avg_batch": round(self.written / self.flushes, 2) if self.flushes else 0,
+            "strict": CHAT_WRITE_STRICT,
+        }
+
+
+chat_writer = ChatWriter()
@@ -0,0 +1,39 @@
+import hashlib
+from fastapi import Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from .crud import get_versions
+
+
+def compute_etag(versions: dict, request: Request, viewer_id: int | None = None) -> str:
+    # sahifa (cursor/limit/filtrlar) va ko'ruvchi ham kalitga kiradi
+    key = "|".join([
+        request.url.path,
+        str(request.url.query),
+        str(viewer_id),
+        *(f"{scope}={version}" for scope, version in sorted(versions.items())),
+    ])
+    return 'W/"%s"' % hashlib.sha1(key.encode()).hexdigest()
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # weak comparison (RFC 9110): W/ prefiksi hisobga olinmaydi
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+async def not_modified(db: AsyncSession, request: Request, response: Response, scopes: list[str], viewer_id: int | None = None) -> Response | None:
+    """Returns a 304 if the client's copy is current, otherwise tags ``response`` with the ETag.
+
+    Call it before reading the rows: versions are read first, so a write that
+    lands in between only makes the ETag older than the body, never newer.
+    """
+    etag = compute_etag(await get_versions(db, scopes), request, viewer_id)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
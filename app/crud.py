@@ -1,23 +1,91 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
-from . import models, schemas
-from passlib.context import CryptContext
+from sqlalchemy.ext.asyncio import AsyncSession
+import re
+from collections import Counter
+from sqlalchemy import select, delete, insert, update, values, column, cast, func, text, literal_column, literal, tuple_, and_, or_, Float
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import selectinload, joinedload
+from . import models, schemas, hashing
+from .cache import invalidate_user, invalidate_access
 from typing import List
-from sqlalchemy.orm import Session
-from .models import Department, Task, Subtask, Message, DepartmentUser, User
+from datetime import datetime
+from .pagination import PageParams, paginate, paginate_window, encode_cursor, decode_cursor
+from .serialization import TASK_SHAPE, USER_SHAPE
+from .database import engine
+from .reminders import deadline_scheduler
+from .outbox import outbox_dispatcher, outbox_event, dept_topic, company_topic, retained_offset
+from .models import Department, Task, Subtask, Message, DepartmentUser, User, TaskStat, TaskStatusEnum, ResourceVersion, OutboxEvent
 from .schemas import (DepartmentCreate, DepartmentUpdate, DepartmentUserCreate, TaskCreate, TaskUpdate, SubtaskCreate, SubtaskUpdate)
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# --- Resource versions (ETag) ---
 
-def get_password_hash(password: str):
-    return pwd_context.hash(password)
+def dialect_insert(model):
+    # ON CONFLICT uchun: postgres va sqlite insert'lari bir xil API'ga ega
+    return (pg_insert if engine.dialect.name == "postgresql" else sqlite_insert)(model)
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+def tasks_scope(department_id: int) -> str:
+    return f"tasks:{department_id}"
 
-def create_user(db: Session, user: schemas.UserCreate, role: models.RoleEnum = models.RoleEnum.company_admin):
-    hashed_pw = get_password_hash(user.password)
+def users_scope(company_id: int | None) -> str:
+    return f"users:{company_id}"
+
+def departments_scope(company_id: int | None) -> str:
+    return f"departments:{company_id}"
+
+async def bump_versions(db: AsyncSession, *scopes: str) -> None:
+    """Increment the given scopes in the caller's transaction (sorted, so writers can't deadlock)."""
+    rows = [dict(scope=scope, version=1) for scope in sorted(set(scopes))]
+    if not rows:
+        return
+    stmt = dialect_insert(ResourceVersion)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ResourceVersion.scope],
+        set_={"version": ResourceVersion.version + 1},
+    )
+    await db.execute(stmt, rows)
+
+async def get_versions(db: AsyncSession, scopes: list[str]) -> dict:
+    rows = (await db.execute(
+        select(ResourceVersion.scope, ResourceVersion.version).filter(ResourceVersion.scope.in_(scopes))
+    )).all()
+    versions = dict.fromkeys(scopes, 0)
+    versions.update({row.scope: row.version for row in rows})
+    return versions
+
+
+# --- Outbox ---
+
+async def add_outbox(db: AsyncSession, events: list[dict]) -> None:
+    """Insert change events in the caller's transaction; the dispatcher publishes them after commit."""
+    if events:
+        await db.execute(insert(OutboxEvent), events)
+
+def department_events(entity: str, op: str, entity_id: int, department_ids, **data) -> list[dict]:
+    # bo'lim o'zgargan bo'lsa eski va yangi bo'lim obunachilari ham xabar oladi
+    return [outbox_event(entity, op, entity_id, dept_topic(d), **data) for d in sorted(set(department_ids) - {None})]
+
+def company_events(op: str, department_id: int, company_id: int | None, **data) -> list[dict]:
+    return [outbox_event("department", op, department_id, company_topic(company_id), **data)] if company_id is not None else []
+
+async def subtask_events(db: AsyncSession, op: str, subtasks, fields: dict | None = None) -> list[dict]:
+    """Events for ``(subtask_id, task_id)`` pairs, on the topic of each parent task's department.
+
+    ``fields`` maps a subtask id to the names of the changed columns.
+    """
+    subtasks = set(subtasks)
+    if not subtasks:
+        return []
+    departments = await get_task_department_ids(db, {task_id for _, task_id in subtasks})
+    return [
+        outbox_event("subtask", op, subtask_id, dept_topic(departments[task_id]), task_id=task_id,
+                     **({"fields": fields[subtask_id]} if fields else {}))
+        for subtask_id, task_id in sorted(subtasks) if task_id in departments
+    ]
+
+
+async def create_user(db: AsyncSession, user: schemas.UserCreate, role: models.RoleEnum = models.RoleEnum.company_admin):
+    hashed_pw = await hashing.hash_password(user.password)
     db_user = models.User(
         first_name=user.first_name,
         last_name=user.last_name,
@@ -27,42 +95,55 @@ def create_user(db: Session, user: schemas.UserCreate, role: models.RoleEnum = m
         role=role
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 # get user by email
-def get_user_by_email(db: Session, email: str):
-    return db.query(models.User).filter(models.User.email == email).first()
+async def get_user_by_email(db: AsyncSession, email: str):
+    return await db.scalar(select(models.User).filter(models.User.email == email).limit(1))
 
 # get user by phone
-def get_user_by_phone(db: Session, phone: str):
-    return db.query(models.User).filter(models.User.phone == phone).first()
+async def get_user_by_phone(db: AsyncSession, phone: str):
+    return await db.scalar(select(models.User).filter(models.User.phone == phone).limit(1))
 
 
 # create company
-def create_company(db: Session, company: schemas.CompanyCreate, admin_user: models.User):
+async def create_company(db: AsyncSession, company: schemas.CompanyCreate, admin_user: models.User):
     db_company = models.Company(
         name=company.name,
         address=company.address,
         phone=company.phone
     )
     db.add(db_company)
-    db.commit()
-    db.refresh(db_company)
+    await db.commit()
+    await db.refresh(db_company)
     admin_user.company_id = db_company.id
     admin_user.role = models.RoleEnum.company_admin
-    db.commit()
-    db.refresh(admin_user)
+    await bump_versions(db, users_scope(db_company.id))
+    await db.commit()
+    invalidate_user(admin_user.id)
+    await db.refresh(admin_user)
     return db_company
 
-def get_company_by_name(db: Session, name: str):
-    return db.query(models.Company).filter(models.Company.name == name).first()
+async def get_company_users(db: AsyncSession, company_id: int, exclude_user_id: int, page: PageParams) -> dict:
+    stmt = select(models.User).filter(
+        models.User.company_id == company_id,
+        models.User.id != exclude_user_id,
+    )
+    return await paginate(db, stmt, [models.User.id], page)
+
+async def get_company_user_rows(db: AsyncSession, company_id: int, exclude_user_id: int, page: PageParams) -> dict:
+    stmt = select(*USER_SHAPE.columns).filter(User.company_id == company_id, User.id != exclude_user_id)
+    return await paginate(db, stmt, [User.id], page, scalars=False)
 
+async def get_company_by_name(db: AsyncSession, name: str):
+    return await db.scalar(select(models.Company).filter(models.Company.name == name).limit(1))
 
 
-def create_user_for_company(db: Session, user_in: schemas.UserCreateByAdmin, company_id: int):
-    hashed = get_password_hash(user_in.password)
+
+async def create_user_for_company(db: AsyncSession, user_in: schemas.UserCreateByAdmin, company_id: int):
+    hashed = await hashing.hash_password(user_in.password)
     db_user = models.User(
         first_name=user_in.first_name,
         last_name=user_in.last_name,
@@ -73,133 +154,680 @@ def create_user_for_company(db: Session, user_in: schemas.UserCreateByAdmin, com
         company_id=company_id,
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await bump_versions(db, users_scope(company_id))
+    await db.commit()
+    invalidate_user(db_user.id)
+    await db.refresh(db_user)
     return db_user
 
+# --- Tenant (company_id) ---
+
+# department/task/subtask/message'dagi company_id denormalizatsiya: shu yordamchilar bilan to'ldiriladi
+def department_company(department_id):
+    # skalyar subquery: bitta INSERT/UPDATE va filtrlarda alohida so'rovsiz
+    return select(Department.company_id).filter(Department.id == department_id).scalar_subquery()
+
+def task_company(task_id):
+    return select(Task.company_id).filter(Task.id == task_id).scalar_subquery()
+
+async def department_companies(db: AsyncSession, department_ids) -> dict:
+    rows = (await db.execute(select(Department.id, Department.company_id).filter(Department.id.in_(set(department_ids))))).all()
+    return {row.id: row.company_id for row in rows}
+
+async def task_companies(db: AsyncSession, task_ids) -> dict:
+    rows = (await db.execute(select(Task.id, Task.company_id).filter(Task.id.in_(set(task_ids))))).all()
+    return {row.id: row.company_id for row in rows}
+
+async def company_admin_ids(db: AsyncSession, company_ids) -> list[int]:
+    # admin AccessSet'ida kompaniyaning barcha bo'limlari: bo'lim qo'shilsa/o'chsa ularniki ham eskiradi
+    company_ids = {company_id for company_id in company_ids if company_id is not None}
+    if not company_ids:
+        return []
+    return (await db.scalars(select(User.id).filter(
+        User.company_id.in_(company_ids), User.role == models.RoleEnum.company_admin
+    ))).all()
+
+
 # ---Department---
-def create_department(db: Session, dept_in: DepartmentCreate) -> Department:
+async def create_department(db: AsyncSession, dept_in: DepartmentCreate, company_id: int | None) -> Department:
     dept = Department(
         name=dept_in.name,
         description=dept_in.description,
-        manager_id=dept_in.manager_id
+        manager_id=dept_in.manager_id,
+        company_id=company_id,
     )
     db.add(dept)
-    db.commit()
-    db.refresh(dept)
+    await db.flush()
+    await add_outbox(db, company_events("created", dept.id, company_id))
+    await bump_versions(db, departments_scope(company_id))
+    admin_ids = await company_admin_ids(db, [company_id])
+    await db.commit()
+    await outbox_dispatcher.notify()
+    invalidate_access(dept.manager_id, *admin_ids)
+    await db.refresh(dept)
     return dept
 
 
-def get_departments(db: Session) -> List[Department]:
-    return db.query(Department).all()
+async def get_departments(db: AsyncSession, company_id: int | None, page: PageParams) -> dict:
+    stmt = select(Department).filter(Department.company_id == company_id)
+    return await paginate(db, stmt, [Department.id], page)
 
 
-def update_department(db: Session, dept_id: int, dept_in: DepartmentUpdate) -> Department:
-    dept = db.query(Department).get(dept_id)
-    for key, value in dept_in.dict(exclude_unset=True).items():
+async def update_department(db: AsyncSession, dept_id: int, dept_in: DepartmentUpdate) -> Department:
+    dept = await db.get(Department, dept_id)
+    old_manager_id = dept.manager_id
+    changes = dept_in.dict(exclude_unset=True)
+    for key, value in changes.items():
         setattr(dept, key, value)
-    db.commit()
-    db.refresh(dept)
+    await add_outbox(db, company_events("updated", dept_id, dept.company_id, fields=sorted(changes)))
+    await bump_versions(db, departments_scope(dept.company_id))
+    await db.commit()
+    await outbox_dispatcher.notify()
+    if dept.manager_id != old_manager_id:
+        invalidate_access(old_manager_id, dept.manager_id)
+    await db.refresh(dept)
     return dept
 
 
-def delete_department(db: Session, dept_id: int) -> None:
-    db.query(Department).filter(Department.id == dept_id).delete()
-    db.commit()
-    
+async def delete_department(db: AsyncSession, dept_id: int) -> None:
+    member_ids = (await db.scalars(select(DepartmentUser.user_id).filter(DepartmentUser.department_id == dept_id))).all()
+    rows = (await db.execute(
+        delete(Department).filter(Department.id == dept_id).returning(Department.manager_id, Department.company_id)
+    )).all()
+    manager_ids = [row.manager_id for row in rows]
+    await add_outbox(db, [event for row in rows for event in company_events("deleted", dept_id, row.company_id)])
+    await bump_versions(db, *(departments_scope(row.company_id) for row in rows))
+    admin_ids = await company_admin_ids(db, [row.company_id for row in rows])
+    await db.commit()
+    await outbox_dispatcher.notify()
+    invalidate_access(*manager_ids, *member_ids, *admin_ids)
+
 # --- DepartmentUser CRUD ---
 
-def create_department_user(db: Session, dept_user_in: DepartmentUserCreate) -> DepartmentUser:
+# DepartmentUserRead user va department'ni ham qaytaradi; many-to-one: bitta JOIN'li so'rov
+def department_user_query():
+    return select(DepartmentUser).options(
+        joinedload(DepartmentUser.user, innerjoin=True),
+        joinedload(DepartmentUser.department, innerjoin=True),
+    )
+
+async def get_department_user(db: AsyncSession, department_user_id: int) -> DepartmentUser | None:
+    return await db.scalar(department_user_query().filter(DepartmentUser.id == department_user_id))
+
+async def create_department_user(db: AsyncSession, dept_user_in: DepartmentUserCreate) -> DepartmentUser:
     department_user = DepartmentUser(department_id=dept_user_in.department_id,user_id=dept_user_in.user_id)
     db.add(department_user)
-    db.commit()
-    db.refresh(department_user)
-    return department_user
+    await db.flush()
+    await add_outbox(db, department_events(
+        "department_user", "created", department_user.id, [department_user.department_id], user_id=department_user.user_id,
+    ))
+    await db.commit()
+    await outbox_dispatcher.notify()
+    invalidate_access(department_user.user_id)
+    return await get_department_user(db, department_user.id)
+
+async def get_department_users(db: AsyncSession, department_id: int, page: PageParams) -> dict:
+    stmt = department_user_query().filter(DepartmentUser.department_id == department_id)
+    return await paginate(db, stmt, [DepartmentUser.created_at, DepartmentUser.id], page)
+
+async def update_department_user(db: AsyncSession, department_user_id: int, du_in: DepartmentUser) -> DepartmentUser:
+    department_user = await db.get(DepartmentUser, department_user_id)
+    old_user_id, old_department_id = department_user.user_id, department_user.department_id
+    changes = du_in.dict(exclude_unset=True)
+    for key, value in changes.items():
+        setattr(department_user, key, value)
+    await add_outbox(db, department_events(
+        "department_user", "updated", department_user_id, [old_department_id, department_user.department_id],
+        user_id=department_user.user_id, fields=sorted(changes),
+    ))
+    await db.commit()
+    await outbox_dispatcher.notify()
+    invalidate_access(old_user_id, department_user.user_id)
+    return await db.scalar(
+        department_user_query()
+        .filter(DepartmentUser.id == department_user_id)
+        .execution_options(populate_existing=True)
+    )
+
+async def delete_department_user(db: AsyncSession, department_user_id: int) -> None:
+    rows = (await db.execute(
+        delete(DepartmentUser).filter(DepartmentUser.id == department_user_id)
+        .returning(DepartmentUser.user_id, DepartmentUser.department_id)
+    )).all()
+    await add_outbox(db, [
+        event for row in rows
+        for event in department_events("department_user", "deleted", department_user_id, [row.department_id], user_id=row.user_id)
+    ])
+    await db.commit()
+    await outbox_dispatcher.notify()
+    invalidate_access(*(row.user_id for row in rows))
 
-def get_department_users(db: Session, department_id: int) -> List[DepartmentUser]:
-    return db.query(DepartmentUser).filter(DepartmentUser.department_id == department_id).all()
+# --- Task CRUD ---
 
-def update_department_user(db: Session, department_user_id: int, du_in: DepartmentUser) -> DepartmentUser:
-    department_user_id = db.query(DepartmentUser).get(department_user_id)
-    for key, value in du_in.dict(exclude_unset=True).items():
-        setattr(department_user_id, key, value)
-    db.commit()
-    db.refresh(department_user_id)
-    return department_user_id
+# TaskRead assigned_to va department'ni ham qaytaradi
+def task_query():
+    return select(Task).options(
+        joinedload(Task.assigned_to),
+        joinedload(Task.department, innerjoin=True),
+    )
 
-def delete_department_user(db: Session, department_user_id: int) -> None:
-    db.query(DepartmentUser).filter(DepartmentUser.id == department_user_id).delete()
-    db.commit()
+# daraxt: vazifa + subtasklar + ijrochi qisqacha; sahifa hajmidan qat'i nazar 2 ta so'rov
+def task_tree_query():
+    return select(Task).options(
+        joinedload(Task.assigned_to).load_only(User.id, User.first_name, User.last_name),
+        selectinload(Task.subtasks),
+    )
 
-# --- Task CRUD ---
+async def get_task(db: AsyncSession, task_id: int) -> Task | None:
+    return await db.scalar(task_query().filter(Task.id == task_id))
 
-def create_task(db: Session, t_in: TaskCreate) -> Task:
+async def create_task(db: AsyncSession, t_in: TaskCreate) -> Task:
     task = Task(
         title=t_in.title,
         description=t_in.description if t_in.description else None,
         assigned_to_id=t_in.assigned_to if t_in.assigned_to else None,
         department_id=t_in.department_id if t_in.department_id else None,
+        company_id=department_company(t_in.department_id),
         deadline=t_in.deadline if t_in.deadline else None,
+        status=TaskStatusEnum.to_do,
     )
     db.add(task)
-    db.commit()
-    db.refresh(task)
-    return task
-
-def read_tasks(db: Session, department_id: int) -> List[models.Task]:
-    return db.query(models.Task).filter(
-            models.Task.department_id == department_id
-    ).all()
+    await db.flush()
+    await apply_task_stats(db, Counter({stat_key(task.department_id, task.assigned_to_id, task.status): 1}))
+    await add_outbox(db, department_events("task", "created", task.id, [task.department_id]))
+    await bump_versions(db, tasks_scope(task.department_id))
+    await db.commit()
+    await outbox_dispatcher.notify()
+    if task.deadline is not None:
+        await deadline_scheduler.notify_changed([task.id])
+    return await get_task(db, task.id)
+
+def filter_tasks(stmt, status=None, assigned_to_id: int | None = None,
+                 deadline_from: datetime | None = None, deadline_to: datetime | None = None):
+    if status is not None:
+        stmt = stmt.filter(Task.status == status)
+    if assigned_to_id is not None:
+        stmt = stmt.filter(Task.assigned_to_id == assigned_to_id)
+    if deadline_from is not None:
+        stmt = stmt.filter(Task.deadline >= deadline_from)
+    if deadline_to is not None:
+        stmt = stmt.filter(Task.deadline < deadline_to)
+    return stmt
+
+def department_tasks(stmt, department_id: int):
+    # company_id sharti: (company_id, department_id, ...) indekslari va bo'limlangan jadvalda bitta bo'lak
+    return stmt.filter(Task.company_id == department_company(department_id), Task.department_id == department_id)
+
+async def read_tasks(db: AsyncSession, department_id: int, page: PageParams, **filters) -> dict:
+    stmt = filter_tasks(department_tasks(task_query(), department_id), **filters)
+    return await paginate(db, stmt, [Task.created_at, Task.id], page)
+
+async def read_task_tree(db: AsyncSession, department_id: int, page: PageParams, **filters) -> dict:
+    stmt = filter_tasks(department_tasks(task_tree_query(), department_id), **filters)
+    return await paginate(db, stmt, [Task.created_at, Task.id], page)
+
+async def read_user_tasks(db: AsyncSession, user_id: int, page: PageParams, **filters) -> dict:
+    stmt = filter_tasks(task_query().filter(Task.assigned_to_id == user_id), **filters)
+    return await paginate(db, stmt, [Task.created_at, Task.id], page)
+
+# tez yo'l: ORM obyektlari o'rniga TaskRead ustunlari tuple sifatida (serialization.json_page uchun)
+def task_rows_query():
+    return (
+        select(*TASK_SHAPE.columns)
+        .select_from(Task)
+        .join(Department, Department.id == Task.department_id)
+        .outerjoin(User, User.id == Task.assigned_to_id)
+    )
 
-def update_task(db: Session, task_id: int, t_in: TaskUpdate) -> Task:
-    task = db.query(Task).get(task_id)
-    for key, value in t_in.dict(exclude_unset=True).items():
+async def read_task_rows(db: AsyncSession, department_id: int, page: PageParams, **filters) -> dict:
+    stmt = filter_tasks(department_tasks(task_rows_query(), department_id), **filters)
+    return await paginate(db, stmt, [Task.created_at, Task.id], page, scalars=False)
+
+async def read_user_task_rows(db: AsyncSession, user_id: int, page: PageParams, **filters) -> dict:
+    stmt = filter_tasks(task_rows_query().filter(Task.assigned_to_id == user_id), **filters)
+    return await paginate(db, stmt, [Task.created_at, Task.id], page, scalars=False)
+
+def search_terms(q: str) -> list[str]:
+    # faqat harf/raqamlar: to_tsquery sintaksisi (& | ! : *) foydalanuvchidan kelmaydi
+    return re.findall(r"\w+", q.lower())
+
+async def search_tasks(db: AsyncSession, q: str, department_scope, page: PageParams) -> dict:
+    """Tasks matching every term of ``q`` as a prefix, best rank first.
+
+    ``department_scope`` is anything ``in_()`` accepts (id set or subquery).
+    Keyset over ``(rank, id)`` descending; on postgres the match is served by
+    the GIN index on ``search_vector``.
+    """
+    terms = search_terms(q)
+    if not terms:
+        return {"items": [], "next_cursor": None}
+    if engine.dialect.name == "postgresql":
+        query = func.to_tsquery("simple", " & ".join(f"{term}:*" for term in terms))
+        match = Task.search_vector.bool_op("@@")(query)
+        rank = func.ts_rank(Task.search_vector, query, type_=Float)
+    else:
+        # sqlite (lokal): indeks va reyting yo'q, oddiy LIKE
+        match = and_(*(
+            or_(
+                Task.title.icontains(term, autoescape=True),
+                Task.description.icontains(term, autoescape=True),
+                Task.subtasks.any(Subtask.title.icontains(term, autoescape=True)),
+            )
+            for term in terms
+        ))
+        rank = literal(0.0, Float)
+    key = [rank, Task.id]
+    stmt = task_query().add_columns(rank).filter(match, Task.department_id.in_(department_scope))
+    if page.cursor:
+        stmt = stmt.filter(tuple_(*key) < tuple_(*decode_cursor(page.cursor, key)))
+    rows = (await db.execute(stmt.order_by(rank.desc(), Task.id.desc()).limit(page.limit + 1))).all()
+    next_cursor = None
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        next_cursor = encode_cursor([rows[-1][1], rows[-1][0].id])
+    return {"items": [row[0] for row in rows], "next_cursor": next_cursor}
+
+async def update_task(db: AsyncSession, task_id: int, t_in: TaskUpdate) -> Task:
+    # FOR UPDATE: parallel o'zgarishda statistika eski qiymatdan hisoblanmasin
+    task = await db.get(Task, task_id, with_for_update=True)
+    before = stat_key(task.department_id, task.assigned_to_id, task.status)
+    old_deadline = task.deadline
+    changes = t_in.dict(exclude_unset=True)
+    for key, value in changes.items():
         setattr(task, key, value)
-    db.commit()
-    db.refresh(task)
+    if "department_id" in changes:
+        task.company_id = department_company(task.department_id)
+    after = stat_key(task.department_id, task.assigned_to_id, task.status)
+    if before != after:
+        await apply_task_stats(db, Counter({before: -1, after: 1}))
+    await add_outbox(db, department_events("task", "updated", task_id, [before[0], after[0]], fields=sorted(changes)))
+    await bump_versions(db, tasks_scope(before[0]), tasks_scope(after[0]))
+    await db.commit()
+    await outbox_dispatcher.notify()
+    if old_deadline is not None or task.deadline is not None:
+        # muddat o'zgardi yoki bajarilgan vazifa qayta ochildi
+        rescheduled = ("deadline" in changes and changes["deadline"] != old_deadline) or reopened(before, after)
+        await deadline_scheduler.notify_changed([task_id], rescheduled=rescheduled)
+    await db.refresh(task)
     return task
 
-def delete_task(db: Session, task_id: int) -> None:
-    db.query(Task).filter(Task.id == task_id).delete()
-    db.commit()
+async def delete_task(db: AsyncSession, task_id: int) -> None:
+    rows = (await db.execute(
+        delete(Task).filter(Task.id == task_id).returning(Task.department_id, Task.assigned_to_id, Task.status, Task.deadline)
+    )).all()
+    await apply_task_stats(db, Counter({stat_key(row.department_id, row.assigned_to_id, row.status): -1 for row in rows}))
+    await add_outbox(db, department_events("task", "deleted", task_id, [row.department_id for row in rows]))
+    await bump_versions(db, *(tasks_scope(row.department_id) for row in rows))
+    await db.commit()
+    await outbox_dispatcher.notify()
+    if any(row.deadline is not None for row in rows):
+        await deadline_scheduler.notify_changed([task_id], rescheduled=False)
+
+# --- Task stats ---
+
+UNASSIGNED = 0
+
+def stat_key(department_id: int, assignee_id: int | None, status) -> tuple:
+    return department_id, assignee_id or UNASSIGNED, TaskStatusEnum(status or TaskStatusEnum.to_do)
+
+def reopened(before: tuple, after: tuple) -> bool:
+    return before[2] == TaskStatusEnum.done and after[2] != TaskStatusEnum.done
+
+async def apply_task_stats(db: AsyncSession, deltas: Counter) -> None:
+    """Add ``deltas`` ({stat_key: +-n}) to task_stats in the caller's transaction.
+
+    Keys are upserted in a fixed order so concurrent writers can't deadlock.
+    """
+    rows = [
+        dict(department_id=d, assignee_id=a, status=s, count=n)
+        for (d, a, s), n in sorted(deltas.items(), key=lambda item: (item[0][0], item[0][1], item[0][2].value))
+        if n
+    ]
+    if not rows:
+        return
+    stmt = dialect_insert(TaskStat)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[TaskStat.department_id, TaskStat.assignee_id, TaskStat.status],
+        set_={"count": TaskStat.count + stmt.excluded.count},
+    )
+    await db.execute(stmt, rows)
+
+async def task_stats_snapshot(db: AsyncSession, task_ids) -> dict:
+    rows = (await db.execute(
+        select(Task.id, Task.department_id, Task.assigned_to_id, Task.status)
+        .filter(Task.id.in_(task_ids))
+        .with_for_update()
+    )).all()
+    return {row.id: stat_key(row.department_id, row.assigned_to_id, row.status) for row in rows}
+
+async def get_department_stats(db: AsyncSession, department_id: int) -> dict:
+    rows = (await db.execute(
+        select(TaskStat.assignee_id, TaskStat.status, TaskStat.count)
+        .filter(TaskStat.department_id == department_id, TaskStat.count > 0)
+    )).all()
+    # overdue vaqtga bog'liq, jadvalda saqlanmaydi: (company_id, department_id, deadline) indeksi bo'yicha sanaladi
+    overdue = await db.scalar(
+        select(func.count()).select_from(Task).filter(
+            Task.company_id == department_company(department_id),
+            Task.department_id == department_id,
+            Task.deadline < func.now(),
+            Task.status != TaskStatusEnum.done,
+        )
+    )
+    by_status = {status.value: 0 for status in TaskStatusEnum}
+    by_assignee: dict[int, dict] = {}
+    for row in rows:
+        by_status[row.status.value] += row.count
+        load = by_assignee.setdefault(row.assignee_id, {status.value: 0 for status in TaskStatusEnum})
+        load[row.status.value] += row.count
+    return {
+        "department_id": department_id,
+        "total": sum(by_status.values()),
+        "by_status": by_status,
+        "overdue": overdue,
+        "by_assignee": [
+            {"assignee_id": assignee_id or None, **counts, "total": sum(counts.values())}
+            for assignee_id, counts in sorted(by_assignee.items())
+        ],
+    }
+
+async def reconcile_task_stats(db: AsyncSession) -> int:
+    """Rebuild task_stats from tasks with one GROUP BY; returns the number of rows written."""
+    if engine.dialect.name == "postgresql":
+        # boshqa worker allaqachon qurayotgan bo'lsa o'tkazib yuboriladi
+        if not await db.scalar(text("SELECT pg_try_advisory_xact_lock(hashtext('task_stats_reconcile'))")):
+            await db.rollback()
+            return 0
+        # rebuild davomida inkremental yozuvlar kutadi, hisob yo'qolmaydi
+        await db.execute(text("LOCK TABLE task_stats IN EXCLUSIVE MODE"))
+    await db.execute(delete(TaskStat))
+    # literal_column: GROUP BY ifodasi SELECT'dagi bilan aynan bir xil bo'lishi kerak (bind parametrsiz)
+    assignee = func.coalesce(Task.assigned_to_id, literal_column(str(UNASSIGNED)))
+    status = func.coalesce(Task.status, literal_column(f"'{TaskStatusEnum.to_do.value}'"))
+    grouped = select(Task.department_id, assignee, status, func.count()).group_by(Task.department_id, assignee, status)
+    result = await db.execute(
+        insert(TaskStat).from_select(["department_id", "assignee_id", "status", "count"], grouped)
+    )
+    await db.commit()
+    return result.rowcount
+
+# --- Bulk ---
+
+BULK_UPDATE_CHUNK_SIZE = 1000
+
+async def bulk_update_rows(db: AsyncSession, model, rows: List[dict]) -> List[int]:
+    """Update many rows by primary key in as few statements as possible.
+
+    Rows are grouped by the set of columns they change; on PostgreSQL each
+    group is one ``UPDATE ... FROM (VALUES ...) RETURNING id`` per chunk,
+    elsewhere it falls back to an ORM bulk UPDATE by primary key.
+    Does not commit.
+    """
+    groups: dict[tuple, List[dict]] = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+
+    table = model.__table__
+    updated: List[int] = []
+    for keys, group in groups.items():
+        if engine.dialect.name != "postgresql":
+            await db.execute(update(model), group)
+            updated += [row["id"] for row in group]
+            continue
+        for start in range(0, len(group), BULK_UPDATE_CHUNK_SIZE):
+            chunk = group[start:start + BULK_UPDATE_CHUNK_SIZE]
+            v = values(*(column(key, table.c[key].type) for key in keys), name="v").data(
+                [tuple(row[key] for key in keys) for row in chunk]
+            )
+            stmt = (
+                update(table)
+                .where(table.c.id == cast(v.c.id, table.c.id.type))
+                .values({key: cast(v.c[key], table.c[key].type) for key in keys if key != "id"})
+                .returning(table.c.id)
+            )
+            updated += (await db.execute(stmt)).scalars().all()
+    return updated
+
+async def get_task_department_ids(db: AsyncSession, task_ids) -> dict:
+    rows = (await db.execute(select(Task.id, Task.department_id).filter(Task.id.in_(task_ids)))).all()
+    return {row.id: row.department_id for row in rows}
+
+async def bulk_create_tasks(db: AsyncSession, items: List[TaskCreate]) -> List[int]:
+    rows = [
+        dict(
+            title=t_in.title,
+            description=t_in.description if t_in.description else None,
+            assigned_to_id=t_in.assigned_to if t_in.assigned_to else None,
+            department_id=t_in.department_id,
+            deadline=t_in.deadline if t_in.deadline else None,
+            status=models.TaskStatusEnum.to_do,
+        )
+        for t_in in items
+    ]
+    companies = await department_companies(db, (r["department_id"] for r in rows))
+    for r in rows:
+        r["company_id"] = companies.get(r["department_id"])
+    # insertmanyvalues: ko'p qatorli INSERT ... RETURNING id
+    ids = (await db.scalars(insert(Task).returning(Task.id, sort_by_parameter_order=True), rows)).all()
+    await apply_task_stats(db, Counter(stat_key(r["department_id"], r["assigned_to_id"], r["status"]) for r in rows))
+    await add_outbox(db, [
+        event for task_id, r in zip(ids, rows) for event in department_events("task", "created", task_id, [r["department_id"]])
+    ])
+    await bump_versions(db, *(tasks_scope(r["department_id"]) for r in rows))
+    await db.commit()
+    await outbox_dispatcher.notify()
+    await deadline_scheduler.notify_changed([task_id for task_id, r in zip(ids, rows) if r["deadline"] is not None])
+    return list(ids)
+
+async def bulk_update_tasks(db: AsyncSession, rows: List[dict]) -> List[int]:
+    before = await task_stats_snapshot(db, [row["id"] for row in rows])
+    companies = await department_companies(db, (row["department_id"] for row in rows if row.get("department_id")))
+    ids = await bulk_update_rows(db, Task, [
+        {**row, "company_id": companies.get(row["department_id"])} if row.get("department_id") else row for row in rows
+    ])
+    deltas = Counter()
+    for row in rows:
+        if row["id"] not in before:
+            continue
+        department_id, assignee_id, status = old = before[row["id"]]
+        new = stat_key(
+            row.get("department_id", department_id),
+            row["assigned_to_id"] if "assigned_to_id" in row else assignee_id,
+            row.get("status") or status,
+        )
+        if new != old:
+            deltas[old] -= 1
+            deltas[new] += 1
+    await apply_task_stats(db, deltas)
+    await add_outbox(db, [
+        event for row in rows if row["id"] in before
+        for event in department_events(
+            "task", "updated", row["id"], [before[row["id"]][0], row.get("department_id")], fields=sorted(set(row) - {"id"}),
+        )
+    ])
+    await bump_versions(db, *(tasks_scope(d) for d, _, _ in before.values()),
+                        *(tasks_scope(row["department_id"]) for row in rows if row.get("department_id")))
+    await db.commit()
+    await outbox_dispatcher.notify()
+    rescheduled = {
+        row["id"] for row in rows
+        if "deadline" in row or (row["id"] in before and reopened(before[row["id"]], stat_key(0, None, row.get("status"))))
+    }
+    await deadline_scheduler.notify_changed(rescheduled)
+    await deadline_scheduler.notify_changed({row["id"] for row in rows} - rescheduled, rescheduled=False)
+    return ids
+
+async def bulk_delete_tasks(db: AsyncSession, task_ids: List[int]) -> List[int]:
+    await db.execute(delete(Subtask).filter(Subtask.task_id.in_(task_ids)))
+    deleted = (await db.execute(
+        delete(Task).filter(Task.id.in_(task_ids)).returning(Task.id, Task.department_id, Task.assigned_to_id, Task.status, Task.deadline)
+    )).all()
+    deltas = Counter()
+    for row in deleted:
+        deltas[stat_key(row.department_id, row.assigned_to_id, row.status)] -= 1
+    await apply_task_stats(db, deltas)
+    await add_outbox(db, [
+        event for row in deleted for event in department_events("task", "deleted", row.id, [row.department_id])
+    ])
+    await bump_versions(db, *(tasks_scope(row.department_id) for row in deleted))
+    await db.commit()
+    await outbox_dispatcher.notify()
+    await deadline_scheduler.notify_changed([row.id for row in deleted if row.deadline is not None], rescheduled=False)
+    return [row.id for row in deleted]
+
+async def bulk_create_subtasks(db: AsyncSession, items: List[SubtaskCreate]) -> List[int]:
+    rows = [
+        dict(title=s_in.title, description=s_in.description, task_id=s_in.task_id, status=models.TaskStatusEnum.to_do)
+        for s_in in items
+    ]
+    companies = await task_companies(db, (r["task_id"] for r in rows))
+    for r in rows:
+        r["company_id"] = companies.get(r["task_id"])
+    ids = (await db.scalars(insert(Subtask).returning(Subtask.id, sort_by_parameter_order=True), rows)).all()
+    await add_outbox(db, await subtask_events(db, "created", zip(ids, (r["task_id"] for r in rows))))
+    await db.commit()
+    await outbox_dispatcher.notify()
+    return list(ids)
+
+async def bulk_update_subtasks(db: AsyncSession, rows: List[dict]) -> List[int]:
+    old = (await db.execute(select(Subtask.id, Subtask.task_id).filter(Subtask.id.in_([row["id"] for row in rows])))).all()
+    companies = await task_companies(db, (row["task_id"] for row in rows if row.get("task_id") is not None))
+    ids = await bulk_update_rows(db, Subtask, [
+        {**row, "company_id": companies.get(row["task_id"])} if row.get("task_id") is not None else row for row in rows
+    ])
+    # task_id o'zgargan bo'lsa ikkala vazifaning bo'limiga ham
+    updated = set(ids)
+    moved = {(row["id"], row["task_id"]) for row in rows if row.get("task_id") is not None and row["id"] in updated}
+    fields = {row["id"]: sorted(set(row) - {"id"}) for row in rows}
+    await add_outbox(db, await subtask_events(db, "updated", {(row.id, row.task_id) for row in old} | moved, fields))
+    await db.commit()
+    await outbox_dispatcher.notify()
+    return ids
+
+async def bulk_delete_subtasks(db: AsyncSession, subtask_ids: List[int]) -> List[int]:
+    deleted = (await db.execute(delete(Subtask).filter(Subtask.id.in_(subtask_ids)).returning(Subtask.id, Subtask.task_id))).all()
+    await add_outbox(db, await subtask_events(db, "deleted", [(row.id, row.task_id) for row in deleted]))
+    await db.commit()
+    await outbox_dispatcher.notify()
+    return [row.id for row in deleted]
 
 # --- Subtask CRUD ---
 
-def read_subtasks(db: Session, task_id: int) -> List[Subtask]:
-    return db.query(Subtask).filter(Subtask.task_id == task_id).all()
+async def read_subtasks(db: AsyncSession, task_id: int, page: PageParams, status=None) -> dict:
+    stmt = select(Subtask).filter(Subtask.task_id == task_id)
+    if status is not None:
+        stmt = stmt.filter(Subtask.status == status)
+    return await paginate(db, stmt, [Subtask.created_at, Subtask.id], page)
 
-def create_subtask(db: Session, s_in: SubtaskCreate) -> Subtask:
+async def create_subtask(db: AsyncSession, s_in: SubtaskCreate) -> Subtask:
     sub = Subtask(
         title=s_in.title,
         description=s_in.description,
-        task_id=s_in.task_id
+        task_id=s_in.task_id,
+        company_id=task_company(s_in.task_id),
     )
     db.add(sub)
-    db.commit()
-    db.refresh(sub)
+    await db.flush()
+    await add_outbox(db, await subtask_events(db, "created", [(sub.id, sub.task_id)]))
+    await db.commit()
+    await outbox_dispatcher.notify()
+    await db.refresh(sub)
     return sub
 
 
-def update_subtask(db: Session, sub_id: int, s_in: SubtaskUpdate) -> Subtask:
-    sub = db.query(Subtask).get(sub_id)
-    for key, value in s_in.dict(exclude_unset=True).items():
+async def update_subtask(db: AsyncSession, sub_id: int, s_in: SubtaskUpdate) -> Subtask:
+    sub = await db.get(Subtask, sub_id)
+    old_task_id = sub.task_id
+    changes = s_in.dict(exclude_unset=True)
+    for key, value in changes.items():
         setattr(sub, key, value)
-    db.commit()
-    db.refresh(sub)
+    if "task_id" in changes:
+        sub.company_id = task_company(sub.task_id)
+    await add_outbox(db, await subtask_events(db, "updated", {(sub_id, old_task_id), (sub_id, sub.task_id)}, {sub_id: sorted(changes)}))
+    await db.commit()
+    await outbox_dispatcher.notify()
+    await db.refresh(sub)
     return sub
 
 
-def delete_subtask(db: Session, sub_id: int) -> None:
-    db.query(Subtask).filter(Subtask.id == sub_id).delete()
-    db.commit()
+async def delete_subtask(db: AsyncSession, sub_id: int) -> None:
+    deleted = (await db.execute(delete(Subtask).filter(Subtask.id == sub_id).returning(Subtask.id, Subtask.task_id))).all()
+    await add_outbox(db, await subtask_events(db, "deleted", [(row.id, row.task_id) for row in deleted]))
+    await db.commit()
+    await outbox_dispatcher.notify()
+
+# --- Sync ---
+
+SYNC_ENTITIES = {"task": "tasks", "subtask": "subtasks", "department": "departments", "department_user": "department_users"}
+
+async def sync_changes(db: AsyncSession, topics: list[str], department_scope, since: int | None, limit: int) -> dict:
+    """Rows changed after outbox offset ``since``, plus ids of deleted (or no longer visible) ones.
+
+    The outbox offset is the change sequence: the dispatcher assigns it in
+    the order changes become visible, so no committed change can appear
+    behind a cursor already handed out. ``reset`` means the client has to
+    reload its lists first (no cursor yet, or its events were retained away).
+    """
+    head = await db.scalar(select(func.max(OutboxEvent.position))) or 0
+    if since is None or since > head or since < await retained_offset(db):
+        return {"cursor": head, "reset": True}
+    if since == head:
+        # yangilangan mijoz: bitta indeks so'rovi
+        return {"cursor": head}
+
+    latest = func.max(OutboxEvent.position).label("latest")
+    changed = (await db.execute(
+        select(OutboxEvent.entity, OutboxEvent.entity_id, latest)
+        .filter(OutboxEvent.topic.in_(topics), OutboxEvent.position > since)
+        .group_by(OutboxEvent.entity, OutboxEvent.entity_id)
+        .order_by(latest)
+        .limit(limit + 1)
+    )).all()
+    has_more = len(changed) > limit
+    changed = changed[:limit]
+    # sahifa oxirgi obyektning oxirgi hodisasida tugaydi: undan keyingi o'zgarishlar keyingi sahifada
+    cursor = changed[-1].latest if has_more else max([head, *(row.latest for row in changed)])
+
+    ids = {entity: set() for entity in SYNC_ENTITIES}
+    for row in changed:
+        if row.entity in ids:
+            ids[row.entity].add(row.entity_id)
+    result = {"cursor": cursor, "has_more": has_more, "deleted": {}}
+    queries = {
+        "task": select(Task).filter(Task.id.in_(ids["task"]), Task.department_id.in_(department_scope)),
+        "subtask": select(Subtask).join(Task, Task.id == Subtask.task_id)
+            .filter(Subtask.id.in_(ids["subtask"]), Task.department_id.in_(department_scope)),
+        "department": select(Department).filter(Department.id.in_(ids["department"]), Department.id.in_(department_scope)),
+        "department_user": select(DepartmentUser)
+            .filter(DepartmentUser.id.in_(ids["department_user"]), DepartmentUser.department_id.in_(department_scope)),
+    }
+    for entity, key in SYNC_ENTITIES.items():
+        rows = (await db.scalars(queries[entity])).all() if ids[entity] else []
+        result[key] = rows
+        result["deleted"][key] = sorted(ids[entity] - {row.id for row in rows})
+    return result
 
 # --- Message CRUD (optional) ---
-def create_message(db: Session, content: str, chat_type, room: str) -> Message:
-    msg = Message(content=content, chat_type=chat_type, room=room)
+async def create_message(db: AsyncSession, content: str, chat_type, room: str, company_id: int | None = None) -> Message:
+    msg = Message(content=content, chat_type=chat_type, room=room, company_id=company_id)
     db.add(msg)
-    db.commit()
-    db.refresh(msg)
+    await db.commit()
+    await db.refresh(msg)
     return msg
 
-def get_department_by_id(db: Session, dept_id: int) -> Department | None:
-    return db.query(Department).filter(Department.id == dept_id).first()
\ No newline at end of file
+async def create_messages(db: AsyncSession, rows: list[dict]) -> list:
+    # group commit: bitta ko'p qatorli INSERT, bitta commit; (id, created_at) qaytadi.
+    # Qatorlarda company_id bor: bo'lim xonasi — bo'limning, shaxsiy xona — yuboruvchining kompaniyasi
+    result = (await db.execute(
+        insert(Message).returning(Message.id, Message.created_at, sort_by_parameter_order=True), rows
+    )).all()
+    await db.commit()
+    return result
+
+async def read_messages(db: AsyncSession, company_id, chat_type, room: str, cursor: str | None, limit: int, direction: str) -> dict:
+    # company_id — qiymat yoki department_company(...) subquery'si
+    stmt = select(Message).filter(Message.company_id == company_id, Message.chat_type == chat_type, Message.room == room)
+    return await paginate_window(db, stmt, [Message.created_at, Message.id], cursor, limit, direction)
+
+async def get_department_by_id(db: AsyncSession, dept_id: int) -> Department | None:
+    return await db.scalar(select(Department).filter(Department.id == dept_id).limit(1))
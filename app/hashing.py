@@ -0,0 +1,108 @@
+import os
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+from starlette.concurrency import run_in_threadpool
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# HASH_WORKERS=0: pool ishlatilmaydi, hash threadpool'da hisoblanadi (benchmark uchun)
+HASH_WORKERS = int(os.getenv("HASH_WORKERS") or max(1, (os.cpu_count() or 2) // 2))
+HASH_MAX_CONCURRENCY = int(os.getenv("HASH_MAX_CONCURRENCY") or max(1, HASH_WORKERS) * 4)
+HASH_QUEUE_TIMEOUT = float(os.getenv("HASH_QUEUE_TIMEOUT", "5"))
+# cost o'zgarsa login paytida hash yangi cost bilan qayta yoziladi
+HASH_REHASH_ON_LOGIN = os.getenv("HASH_REHASH_ON_LOGIN", "1").lower() not in ("0", "false", "no")
+
+_context_kwargs = {"bcrypt__rounds": BCRYPT_ROUNDS}
+if HASH_REHASH_ON_LOGIN:
+    _context_kwargs.update(bcrypt__min_rounds=BCRYPT_ROUNDS, bcrypt__max_rounds=BCRYPT_ROUNDS)
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", **_context_kwargs)
+
+_executor: ProcessPoolExecutor | None = None
+_slots: asyncio.Semaphore | None = None
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(password: str, hashed: str) -> bool:
+    return pwd_context.verify(password, hashed)
+
+
+def _verify_and_update(password: str, hashed: str) -> tuple[bool, str | None]:
+    return pwd_context.verify_and_update(password, hashed)
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+    return _executor
+
+
+async def _run(fn, *args):
+    """Run ``fn`` with admission control: wait at most HASH_QUEUE_TIMEOUT for a slot."""
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(HASH_MAX_CONCURRENCY)
+    try:
+        await asyncio.wait_for(_slots.acquire(), timeout=HASH_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server band, birozdan keyin qayta urinib ko'ring",
+            headers={"Retry-After": "1"},
+        )
+    try:
+        if HASH_WORKERS == 0:
+            return await run_in_threadpool(fn, *args)
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), fn, *args)
+    finally:
+        _slots.release()
+
+
+def _hash_batch(passwords: list[str]) -> list[str]:
+    return [pwd_context.hash(p) for p in passwords]
+
+
+async def hash_password(password: str) -> str:
+    return await _run(_hash, password)
+
+
+async def hash_passwords(passwords: list[str], batch_size: int = 8) -> list[str]:
+    """Hash many passwords (bulk import) without monopolising the pool.
+
+    At most half of the workers are used, in small batches, so logins queued
+    behind an import wait for one batch at most.
+    """
+    parallelism = asyncio.Semaphore(max(1, HASH_WORKERS // 2))
+
+    async def run_batch(batch):
+        async with parallelism:
+            return await _run(_hash_batch, batch)
+
+    batches = [passwords[i:i + batch_size] for i in range(0, len(passwords), batch_size)]
+    results = await asyncio.gather(*(run_batch(batch) for batch in batches))
+    return [hashed for batch in results for hashed in batch]
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await _run(_verify, plain_password, hashed_password)
+
+
+async def verify_and_update(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """Returns ``(ok, new_hash)``; ``new_hash`` is set when the stored cost is outdated."""
+    return await _run(_verify_and_update, plain_password, hashed_password)
+
+
+def shutdown() -> None:
+    global _executor, _slots
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+    _slots = None
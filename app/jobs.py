@@ -0,0 +1,58 @@
+import os
+import asyncio
+import logging
+from dotenv import load_dotenv
+from . import crud
+from .database import db_session, engine
+from .pubsub import WS_BACKEND
+from .reminders import deadline_scheduler, DEADLINE_REMINDERS
+from .outbox import outbox_dispatcher, OUTBOX_DISPATCHER
+from .metrics import worker_metrics, METRICS_ENABLED, METRICS_DIR
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# task_stats jadvalini tasks'dan qayta qurish davri (s); 0 — o'chirilgan (default).
+# Qayta qurish task_stats'ni EXCLUSIVE lock bilan yopadi: task yozuvlari shu vaqt kutadi
+TASK_STATS_RECONCILE_SECONDS = float(os.getenv("TASK_STATS_RECONCILE_SECONDS", "0"))
+
+
+async def reconcile_task_stats_forever(interval: float = TASK_STATS_RECONCILE_SECONDS):
+    # jadvalni 0005 migratsiyasi to'ldiradi: worker ishga tushganda darhol qurilmaydi
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with db_session() as db:
+                rows = await crud.reconcile_task_stats(db)
+            logger.info("task_stats reconciled (%d rows)", rows)
+        except Exception:
+            logger.exception("task_stats reconcile failed")
+
+
+def cross_worker_pubsub(job: str) -> bool:
+    """False (and an error in the log) when pub/sub can't reach the other workers.
+
+    On Postgres several workers may run (leader.py elects one per job), but
+    the default ``memory`` backend delivers only inside the publishing process.
+    """
+    if engine.dialect.name != "postgresql" or WS_BACKEND == "postgres":
+        return True
+    logger.error("%s: WS_BACKEND=%s delivers only inside this worker; set WS_BACKEND=postgres when running several workers", job, WS_BACKEND)
+    return False
+
+
+def start_background_jobs() -> list[asyncio.Task]:
+    tasks = []
+    if TASK_STATS_RECONCILE_SECONDS > 0:
+        tasks.append(asyncio.create_task(reconcile_task_stats_forever()))
+    # egasi boshqa worker'lardagi o'zgarishlarni ko'rmaydi va faqat o'z socketlariga yuboradi: yoqilmaydi
+    if DEADLINE_REMINDERS and cross_worker_pubsub("deadline reminders disabled"):
+        tasks.append(asyncio.create_task(deadline_scheduler.run()))
+    if OUTBOX_DISPATCHER:
+        # /sync offsetlari dispetcherga bog'liq: o'chirilmaydi, faqat log'da xato (jonli push faqat yetakchi worker socketlariga)
+        cross_worker_pubsub("outbox dispatcher: live /events/ws pushes reach only the leader's sockets")
+        tasks.append(asyncio.create_task(outbox_dispatcher.run()))
+    if METRICS_ENABLED and METRICS_DIR:
+        tasks.append(asyncio.create_task(worker_metrics.flush_forever()))
+    return tasks
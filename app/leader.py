@@ -0,0 +1,51 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+from sqlalchemy import text
+from .database import engine, async_engine
+
+logger = logging.getLogger(__name__)
+
+
+async def run_as_leader(name: str, lock_key: int, lead: Callable[[], Awaitable[None]], retry: float):
+    """Runs ``lead()`` on exactly one worker of the cluster, forever.
+
+    On Postgres the worker holding ``pg_try_advisory_lock(lock_key)`` leads;
+    the lock lives on a dedicated connection which is pinged every ``retry``
+    seconds, and ``lead()`` is cancelled as soon as the ping fails (the lock
+    is gone with the connection). The others retry every ``retry`` seconds.
+    sqlite is single-process, so the caller always leads there.
+    """
+    while True:
+        try:
+            if engine.dialect.name == "postgresql":
+                async with async_engine.connect() as conn:
+                    conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                    try:
+                        if await conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": lock_key}):
+                            logger.info("%s: this worker is the leader", name)
+                            await _lead_while_locked(conn, lead, retry)
+                    finally:
+                        # session lock pool'ga qaytganda ham qoladi: ulanish yopiladi
+                        await conn.invalidate()
+            else:
+                await lead()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("%s failed", name)
+        await asyncio.sleep(retry)
+
+
+async def _lead_while_locked(conn, lead: Callable[[], Awaitable[None]], retry: float):
+    task = asyncio.create_task(lead())
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=retry)
+            if done:
+                return task.result()
+            # ulanish uzilgan bo'lsa lock ham yo'qolgan: xato bilan yetakchilikdan chiqiladi
+            await conn.execute(text("SELECT 1"))
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
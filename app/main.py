@@ -1,50 +1,82 @@
-from fastapi import FastAPI, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status, UploadFile, File
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import app.models as models
 import app.schemas as schemas
 import app.crud as crud
 import app.auth as auth
-from app.database import engine, Base, get_db
+import app.hashing as hashing
+import app.user_import as user_import
+from contextlib import asynccontextmanager
+from app.database import engine, async_engine, Base, get_db, get_pool_stats
+from app.cache import invalidate_user, cache_stats
+from app.pagination import PageParams
+from app.conditional import not_modified
+from app.serialization import FAST_LIST_RESPONSES, USER_SHAPE, json_page
+from app.utils import manager
+from app.chat_writer import chat_writer
+from app.jobs import start_background_jobs
+from app.reminders import deadline_scheduler
+from app.outbox import outbox_dispatcher
+from app.metrics import MetricsMiddleware, render_prometheus
+from app.slow_queries import slow_query_log
+from app.utils import require_role, require_debug_token
 from fastapi.security import OAuth2PasswordRequestForm
 from .models import RoleEnum
-from .auth import create_access_token, create_refresh_token, authenticate_user, get_current_user_from_refresh_token, verify_password, get_password_hash
+from .auth import create_access_token, create_refresh_token, token_claims, authenticate_user, get_current_user_from_refresh_token
 
 Base.metadata.create_all(bind=engine)
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await manager.start()
+    await chat_writer.start()
+    jobs = start_background_jobs()
+    yield
+    for job in jobs:
+        job.cancel()
+    await chat_writer.stop()
+    await manager.stop()
+    hashing.shutdown()
+    await async_engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
 
 # Register user
 @app.post("/auth/register", response_model=schemas.Token)
-def register(
+async def register(
     user_in: schemas.UserCreateWithCompany, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    if crud.get_user_by_email(db, user_in.email):
+    if await crud.get_user_by_email(db, user_in.email):
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    if crud.get_company_by_name(db, user_in.company_name):
+    if await crud.get_company_by_name(db, user_in.company_name):
         raise HTTPException(status_code=400, detail="Company already registered")
 
-    user = crud.create_user(db, user_in, role=models.RoleEnum.company_admin)
+    user = await crud.create_user(db, user_in, role=models.RoleEnum.company_admin)
 
     company_data = schemas.CompanyCreate(
         name=user_in.company_name,
         address=user_in.company_address,
         phone=user_in.company_phone
     )
-    crud.create_company(db, company_data, user)
+    await crud.create_company(db, company_data, user)
 
-    access_token = create_access_token(data={"sub": user.id})
-    refresh_token = create_refresh_token(data={"sub": user.id})
+    access_token = create_access_token(data=token_claims(user))
+    refresh_token = create_refresh_token(data={"sub": user.id, "ver": user.token_version})
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
 # Login user
 @app.post("/auth/token", response_model=schemas.Token)
-def login_for_access_token(
+async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -52,8 +84,8 @@ def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    access_token = create_access_token(data={"sub": user.id})
-    refresh_token = create_refresh_token(data={"sub": user.id})
+    access_token = create_access_token(data=token_claims(user))
+    refresh_token = create_refresh_token(data={"sub": user.id, "ver": user.token_version})
 
     return {
         "access_token": access_token,
@@ -67,8 +99,8 @@ def refresh_token(
     current_user: models.User = Depends(get_current_user_from_refresh_token)
 ):
     return {
-        "access_token": create_access_token(data={"sub": current_user.id}),
-        "refresh_token": create_refresh_token(data={"sub": current_user.id}),
+        "access_token": create_access_token(data=token_claims(current_user)),
+        "refresh_token": create_refresh_token(data={"sub": current_user.id, "ver": current_user.token_version}),
         "token_type": "bearer"
     }
 
@@ -80,7 +112,7 @@ def read_users_me(current_user: models.User = Depends(auth.get_current_user)):
 
 # add a new user to the company by admin or department manager
 @app.post("/users/invite", response_model=schemas.UserRead, status_code=status.HTTP_201_CREATED, summary="Invite a new employee to your company")
-def invite_user(user_in: schemas.UserCreateByAdmin,db: Session = Depends(get_db),current_user: models.User = Depends(auth.get_current_user)):
+async def invite_user(user_in: schemas.UserCreateByAdmin,db: AsyncSession = Depends(get_db),current_user: schemas.TokenClaims = Depends(auth.get_current_claims)):
     if current_user.role not in {RoleEnum.company_admin}:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -94,55 +126,77 @@ def invite_user(user_in: schemas.UserCreateByAdmin,db: Session = Depends(get_db)
             detail="Siz hali kompaniya bilan bog'lanmagansiz",
         )
 
-    if crud.get_user_by_email(db, user_in.email):
+    if await crud.get_user_by_email(db, user_in.email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Bu email avval qo'shilgan",
         )
-    if crud.get_user_by_phone(db, user_in.phone):
+    if await crud.get_user_by_phone(db, user_in.phone):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Bu telefon raqam avval qo'shilgan",
         )
 
-    new_user = crud.create_user_for_company(db, user_in, company_id)
+    new_user = await crud.create_user_for_company(db, user_in, company_id)
     return new_user
 
+# CSV (sarlavha: first_name,last_name,email,phone,password,role) yoki NDJSON fayl orqali ko'plab xodim qo'shish
+@app.post("/users/import", response_model=schemas.UserImportReport, summary="Bulk import employees from a CSV or NDJSON file")
+async def import_users(file: UploadFile = File(...), db: AsyncSession = Depends(get_db), current_user: schemas.TokenClaims = Depends(auth.get_current_claims)):
+    if current_user.role != RoleEnum.company_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Sizda bu amalni bajarish huquqi yo'q",
+        )
+    if current_user.company_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Siz hali kompaniya bilan bog'lanmagansiz",
+        )
+    return await user_import.import_users(db, file, current_user.company_id)
+
 @app.post("/users/change-password", response_model=schemas.UserRead)
-def change_password(payload: schemas.ChangePasswordRequest, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
-    if not verify_password(payload.old_password, current_user.hashed_password):
+async def change_password(payload: schemas.ChangePasswordRequest, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+    if not await hashing.verify_password(payload.old_password, current_user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Old password is incorrect"
         )
-    current_user.hashed_password = get_password_hash(payload.new_password)
-    db.commit()
+    current_user.hashed_password = await hashing.hash_password(payload.new_password)
+    current_user.token_version = (current_user.token_version or 0) + 1
+    await db.commit()
+    invalidate_user(current_user.id)
 
     return {"message": "Password changed successfully"}
 
 @app.put("/users/me", response_model=schemas.UserRead)
-def update_user(
+async def update_user(
     user_update: schemas.UserUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user),
 ):
-    if user_update.email and crud.get_user_by_email(db, user_update.email):
+    if user_update.email and await crud.get_user_by_email(db, user_update.email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered",
         )
     
-    if user_update.phone and crud.get_user_by_phone(db, user_update.phone):
+    if user_update.phone and await crud.get_user_by_phone(db, user_update.phone):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Phone number already registered",
         )
 
-    for key, value in user_update.dict(exclude_unset=True).items():
+    changes = user_update.dict(exclude_unset=True)
+    for key, value in changes.items():
         setattr(current_user, key, value)
+    if "role" in changes:
+        current_user.token_version = (current_user.token_version or 0) + 1
 
-    db.commit()
-    db.refresh(current_user)
+    await crud.bump_versions(db, crud.users_scope(current_user.company_id))
+    await db.commit()
+    invalidate_user(current_user.id)
+    await db.refresh(current_user)
     return current_user
 
 
@@ -150,10 +204,13 @@ def update_user(
 from typing import List
 
 
-@app.get("/users/", response_model=List[schemas.UserRead])
-def list_users(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user),
+@app.get("/users/", response_model=schemas.Page[schemas.UserRead])
+async def list_users(
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_db),
+    current_user: schemas.TokenClaims = Depends(auth.get_current_claims),
 ):
     if current_user.role != RoleEnum.company_admin:
         raise HTTPException(
@@ -161,16 +218,52 @@ def list_users(
             detail="Foydalanuvchilar ro'yxatini faqat kompaniya admini ko'ra oladi",
         )
 
-    users = db.query(models.User).filter(
-        models.User.company_id == current_user.company_id,
-        models.User.id != current_user.id  # admin o'zini ko‘rmasligi uchun
-    ).all()
-    return users
+    if cached := await not_modified(db, request, response, [crud.users_scope(current_user.company_id)], current_user.id):
+        return cached
+    # admin o'zini ko‘rmasligi uchun current_user.id chiqarib tashlanadi
+    if FAST_LIST_RESPONSES:
+        return json_page(await crud.get_company_user_rows(db, current_user.company_id, current_user.id, page), USER_SHAPE, response.headers)
+    return await crud.get_company_users(db, current_user.company_id, current_user.id, page)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    # Prometheus: route bo'yicha latency, SQL soni va DB vaqti (METRICS_DIR bo'lsa hamma worker'lar)
+    return Response(render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/debug/pool", tags=["debug"], dependencies=[Depends(require_debug_token)])
+def pool_stats():
+    # faqat shu worker (pid) statistikasi
+    return get_pool_stats()
+
+@app.get("/debug/caches", tags=["debug"], dependencies=[Depends(require_debug_token)])
+def caches():
+    # hit/miss hisoblagichlari, shu worker uchun
+    return cache_stats()
+
+@app.get("/debug/ws", tags=["debug"], dependencies=[Depends(require_debug_token)])
+def ws_stats():
+    # shu worker'dagi websocketlar, navbat va chat yozuvchi statistikasi
+    return {**manager.stats(), "chat_writer": chat_writer.stats(), "deadlines": deadline_scheduler.stats(), "outbox": outbox_dispatcher.stats()}
+
+@app.get("/debug/slow-queries", tags=["debug"], dependencies=[Depends(require_debug_token)])
+async def slow_queries(
+    order_by: str = Query("total_ms", pattern="^(total_ms|count|p95_ms|p99_ms|max_ms)$"),
+    recent: int = Query(50, ge=0, le=1000),
+):
+    # shu worker'ning sekin SQL'lari (SLOW_QUERY_MS); barcha kompaniyalar parametrlari ko'rinadi, shuning uchun faqat operator
+    return slow_query_log.report(order_by, recent)
+
+@app.delete("/debug/slow-queries", tags=["debug"], status_code=status.HTTP_204_NO_CONTENT,
+            dependencies=[Depends(require_debug_token)])
+async def clear_slow_queries():
+    slow_query_log.clear()
 
-from .routers import department, task, chat, sub_task, department_user
+from .routers import department, task, chat, sub_task, department_user, events, sync
 
 app.include_router(department.router)
 app.include_router(task.router)
 app.include_router(chat.router)
 app.include_router(sub_task.router)
-app.include_router(department_user.router)
\ No newline at end of file
+app.include_router(department_user.router)
+app.include_router(events.router)
+app.include_router(sync.router)
@@ -0,0 +1,245 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import Counter
+from contextvars import ContextVar
+from dotenv import load_dotenv
+from sqlalchemy import event
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").lower() not in ("0", "false", "no")
+# uvicorn --workers: har bir worker o'z hisoblagichlarini shu papkaga yozadi, /metrics hammasini qo'shadi.
+# Bo'sh bo'lsa /metrics faqat javob bergan worker'nikini ko'rsatadi. Deploy'da papka tozalanadi.
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+# bitta so'rov shundan ko'p SQL bajarsa log'ga yoziladi (N+1); 0 — o'chirilgan
+SQL_QUERY_LOG_THRESHOLD = int(os.getenv("SQL_QUERY_LOG_THRESHOLD", "20"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def bucket_index(bounds: tuple, value: float) -> int:
+    for i, bound in enumerate(bounds):
+        if value <= bound:
+            return i
+    return len(bounds)
+
+
+class RequestStats:
+    """SQL work of one request; filled by the engine hooks through ``current_request``."""
+
+    __slots__ = ("scope", "queries", "db_seconds", "statements")
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.statements = Counter()
+
+    @property
+    def route(self) -> str:
+        # router scope'ga moslashgan route'ni qo'yadi; topilmagan yo'llar bitta label'da (kardinallik)
+        return getattr(self.scope.get("route"), "path_format", None) or "unmatched"
+
+
+current_request: ContextVar[RequestStats | None] = ContextVar("current_request", default=None)
+
+
+def attach_query_hooks(engine) -> None:
+    """Counts statements and DB time into the current request (sync engine, or ``async_engine.sync_engine``)."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = current_request.get()
+        if stats is not None and context is not None:
+            context._metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = current_request.get()
+        started = getattr(context, "_metrics_started", None)
+        if stats is None or started is None:
+            return
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - started
+        stats.statements[statement] += 1
+
+
+class RouteStats:
+    __slots__ = ("statuses", "latency", "latency_sum", "queries", "queries_sum", "db_seconds", "excessive")
+
+    def __init__(self):
+        self.statuses = Counter()
+        self.latency = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.queries = [0] * (len(QUERY_BUCKETS) + 1)
+        self.queries_sum = 0
+        self.db_seconds = 0.0
+        self.excessive = 0
+
+    def merge(self, data: dict):
+        self.statuses.update({int(code): n for code, n in data["statuses"].items()})
+        self.latency = [a + b for a, b in zip(self.latency, data["latency"])]
+        self.latency_sum += data["latency_sum"]
+        self.queries = [a + b for a, b in zip(self.queries, data["queries"])]
+        self.queries_sum += data["queries_sum"]
+        self.db_seconds += data["db_seconds"]
+        self.excessive += data["excessive"]
+
+    def dump(self) -> dict:
+        return {name: (dict(getattr(self, name)) if name == "statuses" else getattr(self, name)) for name in self.__slots__}
+
+
+class WorkerMetrics:
+    """Per-route counters of this worker; only the event loop thread writes them."""
+
+    def __init__(self):
+        self.routes: dict[tuple[str, str], RouteStats] = {}
+
+    def observe(self, method: str, route: str, status: int, elapsed: float, stats: RequestStats) -> bool:
+        entry = self.routes.get((method, route))
+        if entry is None:
+            entry = self.routes[(method, route)] = RouteStats()
+        entry.statuses[status] += 1
+        entry.latency[bucket_index(LATENCY_BUCKETS, elapsed)] += 1
+        entry.latency_sum += elapsed
+        entry.queries[bucket_index(QUERY_BUCKETS, stats.queries)] += 1
+        entry.queries_sum += stats.queries
+        entry.db_seconds += stats.db_seconds
+        excessive = 0 < SQL_QUERY_LOG_THRESHOLD < stats.queries
+        if excessive:
+            entry.excessive += 1
+        return excessive
+
+    def snapshot(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "routes": [{"method": method, "route": route, **entry.dump()} for (method, route), entry in self.routes.items()],
+        }
+
+    def flush(self) -> None:
+        # atomik: o'qiyotgan worker yarim yozilgan faylni ko'rmaydi
+        path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(path + ".tmp", path)
+
+    async def flush_forever(self, interval: float = METRICS_FLUSH_SECONDS):
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                await asyncio.to_thread(self.flush)
+        finally:
+            # to'xtayotganda oxirgi holat ham qoladi: hisoblagichlar kamaymaydi
+            self.flush()
+
+
+worker_metrics = WorkerMetrics()
+
+
+class MetricsMiddleware:
+    """Latency, status and SQL work per route template (``/tasks/department/{department_id}``).
+
+    Plain ASGI rather than BaseHTTPMiddleware: no extra task per request,
+    and the endpoint runs in this context, so the engine hooks see the
+    request's ``RequestStats``. Websockets are not measured.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats(scope)
+        token = current_request.set(stats)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request.reset(token)
+            route = stats.route
+            if worker_metrics.observe(scope["method"], route, status, elapsed, stats):
+                statement, repeats = stats.statements.most_common(1)[0]
+                logger.warning(
+                    "%s %s issued %d SQL queries (%.1f ms in DB); most repeated x%d: %s",
+                    scope["method"], route, stats.queries, stats.db_seconds * 1000, repeats, " ".join(statement.split())[:300],
+                )
+
+
+def collect() -> tuple[dict[tuple[str, str], RouteStats], int]:
+    """This worker's live counters plus the last flush of every other worker in METRICS_DIR."""
+    merged: dict[tuple[str, str], RouteStats] = {}
+    snapshots = [worker_metrics.snapshot()]
+    if METRICS_DIR and os.path.isdir(METRICS_DIR):
+        for name in os.listdir(METRICS_DIR):
+            if not name.endswith(".json") or name == f"{os.getpid()}.json":
+                continue
+            try:
+                with open(os.path.join(METRICS_DIR, name)) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    for snapshot in snapshots:
+        for data in snapshot["routes"]:
+            key = (data["method"], data["route"])
+            merged.setdefault(key, RouteStats()).merge(data)
+    return merged, len(snapshots)
+
+
+def label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def histogram_lines(name: str, labels: str, bounds: tuple, counts: list, total: float) -> list[str]:
+    lines, cumulative = [], 0
+    for bound, count in zip(bounds + ("+Inf",), counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f"{name}_sum{{{labels}}} {total}")
+    lines.append(f"{name}_count{{{labels}}} {cumulative}")
+    return lines
+
+
+def render_prometheus() -> str:
+    """Prometheus text exposition format (0.0.4)."""
+    routes, workers = collect()
+    sections = {
+        "http_requests_total": ("counter", "Requests by route template, method and status.", []),
+        "http_request_duration_seconds": ("histogram", "Request latency by route template.", []),
+        "http_request_sql_queries": ("histogram", "SQL statements issued per request.", []),
+        "http_request_db_seconds_total": ("counter", "Time spent in SQL statements.", []),
+        "http_requests_excessive_sql_total": ("counter", f"Requests over SQL_QUERY_LOG_THRESHOLD ({SQL_QUERY_LOG_THRESHOLD}) queries.", []),
+    }
+    for (method, route), entry in sorted(routes.items()):
+        labels = f'method="{label(method)}",route="{label(route)}"'
+        for status, count in sorted(entry.statuses.items()):
+            sections["http_requests_total"][2].append(f'http_requests_total{{{labels},status="{status}"}} {count}')
+        sections["http_request_duration_seconds"][2].extend(
+            histogram_lines("http_request_duration_seconds", labels, LATENCY_BUCKETS, entry.latency, entry.latency_sum))
+        sections["http_request_sql_queries"][2].extend(
+            histogram_lines("http_request_sql_queries", labels, QUERY_BUCKETS, entry.queries, entry.queries_sum))
+        sections["http_request_db_seconds_total"][2].append(f"http_request_db_seconds_total{{{labels}}} {entry.db_seconds}")
+        sections["http_requests_excessive_sql_total"][2].append(f"http_requests_excessive_sql_total{{{labels}}} {entry.excessive}")
+    lines = []
+    for name, (kind, help_text, samples) in sections.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", *samples]
+    lines += ["# HELP app_metrics_workers Workers whose counters are included.", "# TYPE app_metrics_workers gauge", f"app_metrics_workers {workers}"]
+    return "\n".join(lines) + "\n"
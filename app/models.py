@@ -1,11 +1,13 @@
-from sqlalchemy import Column, Integer, String, Enum, ForeignKey, DateTime, func
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, String, Text, Enum, ForeignKey, DateTime, Index, DDL, func, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import relationship, deferred
 from .database import Base
 from sqlalchemy import event
 from datetime import datetime
 import enum
 
-
+# Barcha relationship'lar lazy="raise_on_sql": so'rov yuklash strategiyasini o'zi
+# belgilaydi (selectinload/joinedload), handler ichida qatorma-qator lazy load bo'lmaydi.
 
 
 class RoleEnum(str, enum.Enum):
@@ -15,6 +17,9 @@ class RoleEnum(str, enum.Enum):
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        Index("ix_users_company_id_id", "company_id", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     first_name = Column(String, nullable=False)
     last_name = Column(String, nullable=False)
@@ -23,6 +28,8 @@ class User(Base):
     hashed_password = Column(String, nullable=False)
     role = Column(Enum(RoleEnum), default=RoleEnum.company_admin)
     company_id = Column(Integer, ForeignKey("companies.id"), nullable=True)
+    # parol yoki rol o'zgarganda oshiriladi: eski JWT'lar bekor bo'ladi
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(
         DateTime(timezone=True),
         server_default=func.now(), 
@@ -35,10 +42,10 @@ class User(Base):
         nullable=True
     )
     
-    company = relationship("Company", back_populates="users")
-    department_users = relationship("DepartmentUser", back_populates="user")
-    managed_departments = relationship("Department", back_populates="manager")
-    tasks = relationship("Task", back_populates="assigned_to", cascade="all, delete-orphan")
+    company = relationship("Company", back_populates="users", lazy="raise_on_sql")
+    department_users = relationship("DepartmentUser", back_populates="user", lazy="raise_on_sql")
+    managed_departments = relationship("Department", back_populates="manager", lazy="raise_on_sql")
+    tasks = relationship("Task", back_populates="assigned_to", cascade="all, delete-orphan", lazy="raise_on_sql")
 
 
 class Company(Base):
@@ -47,25 +54,33 @@ class Company(Base):
     name = Column(String, unique=True, index=True, nullable=False)
     address = Column(String, nullable=False)
     phone = Column(String, nullable=False)
-    users = relationship("User", back_populates="company")
+    users = relationship("User", back_populates="company", lazy="raise_on_sql")
     
 class Department(Base):
     __tablename__ = "departments"
+    __table_args__ = (
+        Index("ix_departments_company_id_id", "company_id", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False, index=True)
     description = Column(String, nullable=True)
     manager_id = Column(Integer, ForeignKey("users.id"), nullable=True)
-    manager = relationship("User", back_populates="managed_departments")
-    department_users = relationship("DepartmentUser", back_populates="department")
+    # tenant: yaratgan adminning kompaniyasi, menejer almashsa ham o'zgarmaydi
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=True)
+    manager = relationship("User", back_populates="managed_departments", lazy="raise_on_sql")
+    department_users = relationship("DepartmentUser", back_populates="department", lazy="raise_on_sql")
     
 class DepartmentUser(Base):
     __tablename__ = "department_users"
+    __table_args__ = (
+        Index("ix_department_users_department_created", "department_id", "created_at", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     department_id = Column(Integer, ForeignKey("departments.id"), nullable=False)
     
-    user = relationship("User", back_populates="department_users")
-    department = relationship("Department", back_populates="department_users")
+    user = relationship("User", back_populates="department_users", lazy="raise_on_sql")
+    department = relationship("Department", back_populates="department_users", lazy="raise_on_sql")
     
     created_at = Column(
         DateTime(timezone=True),
@@ -86,17 +101,33 @@ class TaskStatusEnum(str, enum.Enum):
     
 class Task(Base):
     __tablename__ = "tasks"
+    # keyset pagination (created_at, id) va filtrlar uchun
+    __table_args__ = (
+        # company_id birinchi: bo'lim so'rovlari ham kompaniya shartini qo'shadi (crud.department_company),
+        # jadval kompaniya bo'yicha bo'lingan bo'lsa faqat bitta bo'lak o'qiladi
+        Index("ix_tasks_company_department_created", "company_id", "department_id", "created_at", "id"),
+        Index("ix_tasks_company_department_status_created", "company_id", "department_id", "status", "created_at", "id"),
+        Index("ix_tasks_assignee_created", "assigned_to_id", "created_at", "id"),
+        Index("ix_tasks_company_department_deadline", "company_id", "department_id", "deadline"),
+        # eslatmalar oynasi: WHERE deadline > :since AND deadline <= :until
+        Index("ix_tasks_deadline", "deadline"),
+        Index("ix_tasks_search_vector", "search_vector", postgresql_using="gin"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, nullable=False)
     description = Column(String, nullable=True)
     assigned_to_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
     department_id = Column(Integer, ForeignKey("departments.id"), nullable=False)
+    # bo'limning kompaniyasi (denormalizatsiya); crud yozadi
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=True)
     status = Column(Enum(TaskStatusEnum), default=TaskStatusEnum.to_do)
     deadline = Column(DateTime(timezone=True), nullable=True)
+    # title (A) + description (B) + subtask sarlavhalari (C); postgres trigger'lari yangilaydi
+    search_vector = deferred(Column(String().with_variant(TSVECTOR(), "postgresql"), nullable=True), raiseload=True)
     
-    assigned_to = relationship("User", back_populates="tasks")
-    department = relationship("Department")
-    subtasks = relationship("Subtask", back_populates="task", cascade="all, delete-orphan")
+    assigned_to = relationship("User", back_populates="tasks", lazy="raise_on_sql")
+    department = relationship("Department", lazy="raise_on_sql")
+    subtasks = relationship("Subtask", back_populates="task", cascade="all, delete-orphan", order_by=lambda: [Subtask.created_at, Subtask.id], lazy="raise_on_sql")
     
     created_at = Column(
         DateTime(timezone=True),
@@ -119,13 +150,20 @@ def set_task_completed_at(mapper, connection, target):
     
 class Subtask(Base):
     __tablename__ = "subtasks"
+    __table_args__ = (
+        Index("ix_subtasks_task_created", "task_id", "created_at", "id"),
+        # tasks bo'lingan bo'lsa FK (company_id, task_id) -> tasks (company_id, id) shu indeksdan foydalanadi
+        Index("ix_subtasks_company_task", "company_id", "task_id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     task_id = Column(Integer, ForeignKey("tasks.id"), nullable=False, index=True)
+    # vazifaning kompaniyasi (denormalizatsiya); crud yozadi
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=True)
     title = Column(String, nullable=False)
     description = Column(String, nullable=True)
     status = Column(Enum(TaskStatusEnum), default=TaskStatusEnum.to_do)
     
-    task = relationship("Task", back_populates="subtasks")
+    task = relationship("Task", back_populates="subtasks", lazy="raise_on_sql")
     
     created_at = Column(
         DateTime(timezone=True),
@@ -146,6 +184,91 @@ def set_subtask_completed_at(mapper, connection, target):
     if target.status == TaskStatusEnum.done and target.completed_at is None:
         target.completed_at = datetime.utcnow()
 
+# tasks.search_vector uchun funksiya va trigger'lar (alembic 0007 bilan bir xil).
+# 'simple' konfiguratsiya: o'zbekcha matn uchun stemming lug'ati yo'q.
+TASK_SEARCH_DDL = """
+CREATE OR REPLACE FUNCTION task_search_document(task_title text, task_description text, target_id integer)
+RETURNS tsvector LANGUAGE sql STABLE AS $$
+    SELECT setweight(to_tsvector('simple', coalesce(task_title, '')), 'A')
+        || setweight(to_tsvector('simple', coalesce(task_description, '')), 'B')
+        || setweight(to_tsvector('simple', coalesce(
+               (SELECT string_agg(s.title, ' ' ORDER BY s.id) FROM subtasks s WHERE s.task_id = target_id), '')), 'C')
+$$;
+
+CREATE OR REPLACE FUNCTION tasks_search_vector_refresh() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.search_vector := task_search_document(NEW.title, NEW.description, NEW.id);
+    RETURN NEW;
+END $$;
+
+CREATE OR REPLACE FUNCTION subtasks_search_vector_refresh() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    -- INSERT'da OLD, DELETE'da NEW NULL bo'ladi
+    UPDATE tasks SET search_vector = task_search_document(title, description, id)
+    WHERE id IN (OLD.task_id, NEW.task_id);
+    RETURN NULL;
+END $$;
+
+DROP TRIGGER IF EXISTS tasks_search_vector ON tasks;
+CREATE TRIGGER tasks_search_vector BEFORE INSERT OR UPDATE OF title, description ON tasks
+    FOR EACH ROW EXECUTE FUNCTION tasks_search_vector_refresh();
+
+DROP TRIGGER IF EXISTS subtasks_search_vector ON subtasks;
+CREATE TRIGGER subtasks_search_vector AFTER INSERT OR DELETE OR UPDATE OF title, task_id ON subtasks
+    FOR EACH ROW EXECUTE FUNCTION subtasks_search_vector_refresh();
+"""
+
+
+def _creates_tasks_table(ddl, target, bind, tables=None, **kw):
+    # create_all faqat jadvalni o'zi yaratganda; mavjud bazaga trigger'ni migratsiya qo'yadi
+    return bind.dialect.name == "postgresql" and tables is not None and Task.__table__ in tables
+
+
+event.listen(Base.metadata, "after_create", DDL(TASK_SEARCH_DDL).execute_if(callable_=_creates_tasks_table))
+
+
+class TaskStat(Base):
+    """Task counts per (department, assignee, status), kept in step by crud.
+
+    ``assignee_id`` is 0 for unassigned tasks (primary key columns can't be NULL).
+    """
+    __tablename__ = "task_stats"
+    department_id = Column(Integer, ForeignKey("departments.id", ondelete="CASCADE"), primary_key=True)
+    assignee_id = Column(Integer, primary_key=True, default=0)
+    status = Column(Enum(TaskStatusEnum), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class ResourceVersion(Base):
+    """Per-scope change counter for ETags; bumped by crud in the writing transaction."""
+    __tablename__ = "resource_versions"
+    scope = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+
+class OutboxEvent(Base):
+    """Change event written by crud in the mutating transaction.
+
+    ``position`` stays NULL until the dispatcher publishes the event; it then
+    gets the next value of one cluster-wide sequence, which clients use as
+    their resume offset.
+    """
+    __tablename__ = "outbox_events"
+    __table_args__ = (
+        Index("ix_outbox_events_pending", "id", postgresql_where=text("position IS NULL"), sqlite_where=text("position IS NULL")),
+        Index("ix_outbox_events_topic_position", "topic", "position"),
+        Index("ix_outbox_events_entity", "entity", "entity_id", "topic", "position"),
+    )
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    position = Column(BigInteger, unique=True, nullable=True)
+    topic = Column(String, nullable=False)
+    entity = Column(String, nullable=False)
+    entity_id = Column(Integer, nullable=False)
+    op = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
 class ChatType(str, enum.Enum):
     private = "private"
     department = "department"
@@ -156,4 +279,20 @@ class Message(Base):
     content = Column(String, nullable=False)
     chat_type = Column(Enum(ChatType), nullable=False)
     room = Column(String, nullable=False, index=True)  # room_id for private or dept_id
+    sender_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    # bo'lim chati — bo'limning, shaxsiy chat — yuboruvchining kompaniyasi
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        # tarix: xona bo'yicha keyset pagination (ikki yo'nalishda)
+        Index("ix_messages_company_type_room_created", "company_id", "chat_type", "room", "created_at", "id"),
+    )
+
+
+class WsPayload(Base):
+    """NOTIFY payload limitidan katta websocket xabarlari (pubsub id bilan uzatadi)."""
+    __tablename__ = "ws_payloads"
+    id = Column(Integer, primary_key=True)
+    payload = Column(String, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
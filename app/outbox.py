@@ -0,0 +1,276 @@
+import os
+import json
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from sqlalchemy import select, update, delete, exists, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+from .database import db_session
+from .leader import run_as_leader
+from .models import OutboxEvent, ResourceVersion
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_DISPATCHER = os.getenv("OUTBOX_DISPATCHER", "1").lower() not in ("0", "false", "no")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+# pub/sub "uyg'otish" xabari yo'qolsa ham shu oraliqda jadval tekshiriladi
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "1"))
+# e'lon qilingan hodisalar shuncha saqlanadi; undan eski offset bilan ulangan mijoz "reset" oladi
+OUTBOX_RETENTION_HOURS = float(os.getenv("OUTBOX_RETENTION_HOURS", "24"))
+# shundan eski hodisalardan bir obyektning faqat oxirgisi qoladi
+OUTBOX_COMPACT_AFTER_MINUTES = float(os.getenv("OUTBOX_COMPACT_AFTER_MINUTES", "10"))
+OUTBOX_MAINTENANCE_SECONDS = float(os.getenv("OUTBOX_MAINTENANCE_SECONDS", "300"))
+# qayta ulanishda ko'pi bilan shuncha hodisa yuboriladi, ko'p bo'lsa "reset"
+OUTBOX_REPLAY_LIMIT = int(os.getenv("OUTBOX_REPLAY_LIMIT", "1000"))
+OUTBOX_LOCK_RETRY_SECONDS = float(os.getenv("OUTBOX_LOCK_RETRY_SECONDS", "30"))
+OUTBOX_LOCK_KEY = 0x5354_4f42  # pg_advisory_lock kaliti (butun klaster bo'yicha bitta)
+OUTBOX_TOPIC = "outbox"
+# resource_versions'da: o'chirilgan eng katta offset
+RETAINED_SCOPE = "outbox:retained"
+
+
+def dept_topic(department_id: int) -> str:
+    return f"dept:{department_id}"
+
+
+def company_topic(company_id: int) -> str:
+    # bo'limlarning o'zi haqidagi hodisalar: kompaniyaning hamma foydalanuvchilariga
+    return f"company:{company_id}"
+
+
+def events_channel(topic: str) -> str:
+    return f"events:{topic}"
+
+
+def ws_manager():
+    # utils -> auth -> crud -> outbox: modul darajasida import qilinsa aylanma bo'ladi
+    from .utils import manager
+    return manager
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def outbox_event(entity: str, op: str, entity_id: int, topic: str, **data) -> dict:
+    """Row for ``OutboxEvent``; the payload says what changed, clients re-read the entity itself."""
+    payload = {"entity": entity, "op": op, "id": entity_id, **data}
+    return dict(topic=topic, entity=entity, entity_id=entity_id, op=op, payload=json.dumps(payload))
+
+
+def event_message(position: int, topic: str, payload: str) -> str:
+    return json.dumps({"offset": position, "topic": topic, **json.loads(payload)})
+
+
+def message_offset(message: str) -> int | None:
+    return json.loads(message).get("offset")
+
+
+class OutboxDispatcher:
+    """Publishes committed outbox rows to websocket subscribers in order.
+
+    Only the leader (see ``leader.run_as_leader``) dispatches. It takes
+    unpublished rows in id order, gives them consecutive offsets, commits,
+    then publishes each on ``events:{topic}``. Offsets are assigned here and
+    not by the writers, so they only ever grow in the order events become
+    visible. crud pings OUTBOX_TOPIC after every commit; polling is the
+    fallback.
+    """
+
+    def __init__(self, batch_size: int = OUTBOX_BATCH_SIZE, poll: float = OUTBOX_POLL_SECONDS,
+                 retention: float = OUTBOX_RETENTION_HOURS * 3600, compact_after: float = OUTBOX_COMPACT_AFTER_MINUTES * 60):
+        self.batch_size = batch_size
+        self.poll = poll
+        self.retention = timedelta(seconds=retention)
+        self.compact_after = timedelta(seconds=compact_after)
+        self.leader = False
+        self.next_position = None
+        self.wakeup = asyncio.Event()
+        self.published = 0
+        self.expired = 0
+        self.compacted = 0
+
+    async def notify(self):
+        """Called by crud after a commit that wrote outbox rows."""
+        await ws_manager().publish(OUTBOX_TOPIC, "1")
+
+    def _on_notify(self, message: str):
+        if self.leader:
+            self.wakeup.set()
+
+    async def run(self):
+        ws_manager().subscribe(OUTBOX_TOPIC, self._on_notify)
+        await run_as_leader("outbox dispatcher", OUTBOX_LOCK_KEY, self._lead, OUTBOX_LOCK_RETRY_SECONDS)
+
+    async def _lead(self):
+        self.leader = True
+        try:
+            async with db_session() as db:
+                last = await db.scalar(select(func.max(OutboxEvent.position))) or 0
+                # oldingi yetakchi oxirgi partiyani commit qilib, e'lon qilmay to'xtagan bo'lishi mumkin:
+                # u qayta yuboriladi, mijoz ko'rgan offsetlarini tashlab yuboradi
+                tail = (await db.execute(
+                    select(OutboxEvent.position, OutboxEvent.topic, OutboxEvent.payload)
+                    .filter(OutboxEvent.position > last - self.batch_size)
+                    .order_by(OutboxEvent.position)
+                )).all()
+            self.next_position = last + 1
+            await self._publish(tail)
+            loop = asyncio.get_running_loop()
+            maintain_at = loop.time()
+            while True:
+                self.wakeup.clear()
+                if await self._dispatch_batch() == self.batch_size:
+                    continue
+                if loop.time() >= maintain_at:
+                    await self._maintain()
+                    maintain_at = loop.time() + OUTBOX_MAINTENANCE_SECONDS
+                try:
+                    async with asyncio.timeout(self.poll):
+                        await self.wakeup.wait()
+                except TimeoutError:
+                    pass
+        finally:
+            self.leader = False
+
+    async def _dispatch_batch(self) -> int:
+        async with db_session() as db:
+            pending = (await db.execute(
+                select(OutboxEvent.id, OutboxEvent.topic, OutboxEvent.payload)
+                .filter(OutboxEvent.position.is_(None))
+                .order_by(OutboxEvent.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )).all()
+            if not pending:
+                return 0
+            start = self.next_position
+            await db.execute(update(OutboxEvent), [dict(id=row.id, position=start + i) for i, row in enumerate(pending)])
+            await db.commit()
+        self.next_position = start + len(pending)
+        await self._publish([(start + i, row.topic, row.payload) for i, row in enumerate(pending)])
+        return len(pending)
+
+    async def _publish(self, rows):
+        for position, topic, payload in rows:
+            await ws_manager().publish(events_channel(topic), event_message(position, topic, payload))
+            self.published += 1
+
+    async def _maintain(self):
+        now = utcnow()
+        try:
+            async with db_session() as db:
+                through = await db.scalar(
+                    select(func.max(OutboxEvent.position)).filter(OutboxEvent.created_at < now - self.retention)
+                )
+                if through is not None:
+                    # avval chegara yoziladi: o'chirish tugamasdan ulangan mijoz ham reset oladi
+                    await mark_retained(db, through)
+                    await db.commit()
+                    self.expired += await delete_batches(db, self.batch_size, OutboxEvent.position <= through)
+                newer = aliased(OutboxEvent)
+                superseded = exists().where(
+                    newer.entity == OutboxEvent.entity,
+                    newer.entity_id == OutboxEvent.entity_id,
+                    newer.topic == OutboxEvent.topic,
+                    newer.position > OutboxEvent.position,
+                )
+                self.compacted += await delete_batches(
+                    db, self.batch_size,
+                    OutboxEvent.position.is_not(None), OutboxEvent.created_at < now - self.compact_after, superseded,
+                )
+        except Exception:
+            logger.exception("outbox maintenance failed")
+
+    def stats(self) -> dict:
+        return {
+            "leader": self.leader,
+            "next_offset": self.next_position,
+            "published": self.published,
+            "expired": self.expired,
+            "compacted": self.compacted,
+        }
+
+
+async def mark_retained(db: AsyncSession, position: int) -> None:
+    from .crud import dialect_insert
+    stmt = dialect_insert(ResourceVersion)
+    stmt = stmt.on_conflict_do_update(index_elements=[ResourceVersion.scope], set_={"version": stmt.excluded.version})
+    await db.execute(stmt, [dict(scope=RETAINED_SCOPE, version=position)])
+
+
+async def delete_batches(db: AsyncSession, batch_size: int, *criteria) -> int:
+    # qisqa tranzaksiyalar: yozuvchilar uzoq kutib qolmasin
+    total = 0
+    while True:
+        batch = select(OutboxEvent.id).filter(*criteria).limit(batch_size).scalar_subquery()
+        result = await db.execute(
+            delete(OutboxEvent).filter(OutboxEvent.id.in_(batch)).execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        total += result.rowcount
+        if result.rowcount < batch_size:
+            return total
+
+
+async def retained_offset(db: AsyncSession) -> int:
+    """Highest offset deleted by retention; resuming from below it can miss events."""
+    return await db.scalar(select(ResourceVersion.version).filter(ResourceVersion.scope == RETAINED_SCOPE)) or 0
+
+
+async def replay(db: AsyncSession, topics: list[str], after: int, limit: int = OUTBOX_REPLAY_LIMIT) -> list[str] | None:
+    """Published events on ``topics`` after offset ``after``, oldest first.
+
+    Returns None when the client has to resync from the REST endpoints:
+    events it hasn't seen were already deleted, or there are more than
+    ``limit`` of them. Compacted rows need no resync, the latest event of
+    every entity is kept.
+    """
+    if after < await retained_offset(db):
+        return None
+    rows = (await db.execute(
+        select(OutboxEvent.position, OutboxEvent.topic, OutboxEvent.payload)
+        .filter(OutboxEvent.topic.in_(topics), OutboxEvent.position > after)
+        .order_by(OutboxEvent.position)
+        .limit(limit + 1)
+    )).all()
+    if len(rows) > limit:
+        return None
+    return [event_message(*row) for row in rows]
+
+
+class ResumingSocket:
+    """Socket wrapper registered with the ConnectionManager while a backlog is replayed.
+
+    Live events are held back until ``release``; then the ones the replay
+    already covered (offset <= the last one sent) are dropped, so the client
+    sees every offset once and in order.
+    """
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.held: list[str] | None = []
+
+    async def send_text(self, message: str):
+        if self.held is not None:
+            self.held.append(message)
+            return
+        await self.ws.send_text(message)
+
+    async def release(self, last_offset: int | None):
+        # yuborish paytida kelganlar ham shu tsiklda navbatga tushadi
+        while self.held:
+            message = self.held.pop(0)
+            if last_offset is None or message_offset(message) > last_offset:
+                await self.ws.send_text(message)
+        self.held = None
+
+    async def close(self, code: int = 1000):
+        await self.ws.close(code=code)
+
+
+outbox_dispatcher = OutboxDispatcher()
@@ -0,0 +1,93 @@
+import base64
+import json
+from datetime import datetime
+from fastapi import HTTPException, Query
+from sqlalchemy import DateTime, Select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+class PageParams:
+    def __init__(
+        self,
+        cursor: str | None = Query(None, description="Oldingi javobdagi next_cursor"),
+        limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    ):
+        self.cursor = cursor
+        self.limit = limit
+
+
+def encode_cursor(values: list) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns: list) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("cursor shape")
+        return [
+            datetime.fromisoformat(v) if isinstance(col.type, DateTime) and v is not None else v
+            for col, v in zip(columns, values)
+        ]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def paginate(db: AsyncSession, stmt: Select, columns: list, page: PageParams, scalars: bool = True) -> dict:
+    """Keyset pagination: ``WHERE (cols) > (cursor) ORDER BY cols LIMIT n``.
+
+    ``columns`` must be unique together (end them with the primary key) and be
+    backed by an index whose trailing columns match, so no OFFSET scan is needed.
+    With ``scalars=False`` items are row tuples; the statement must then select
+    the cursor columns under their own names.
+    """
+    if page.cursor:
+        stmt = stmt.filter(tuple_(*columns) > tuple_(*decode_cursor(page.cursor, columns)))
+    execute = db.scalars if scalars else db.execute
+    rows = (await execute(stmt.order_by(*columns).limit(page.limit + 1))).all()
+    next_cursor = None
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        next_cursor = encode_cursor([getattr(rows[-1], col.key) for col in columns])
+    return {"items": rows, "next_cursor": next_cursor}
+
+
+async def paginate_window(db: AsyncSession, stmt: Select, columns: list, cursor: str | None, limit: int, direction: str) -> dict:
+    """Keyset pagination in both directions over a timeline.
+
+    ``before`` walks back from the cursor (the newest page when there is no
+    cursor), ``after`` walks forward from it. Items always come back oldest
+    first; ``prev_cursor``/``next_cursor`` point at the first/last item so the
+    client can keep going either way.
+    """
+    key = tuple_(*columns)
+    if direction == "before":
+        if cursor:
+            stmt = stmt.filter(key < tuple_(*decode_cursor(cursor, columns)))
+        rows = (await db.scalars(stmt.order_by(*(col.desc() for col in columns)).limit(limit + 1))).all()
+        has_more = len(rows) > limit
+        rows = list(reversed(rows[:limit]))
+    else:
+        if cursor:
+            stmt = stmt.filter(key > tuple_(*decode_cursor(cursor, columns)))
+        rows = (await db.scalars(stmt.order_by(*columns).limit(limit + 1))).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+    return window_page(rows, columns, has_more, cursor)
+
+
+def window_page(rows: list, columns: list, has_more: bool, cursor: str | None = None) -> dict:
+    def key_of(row):
+        return [row[col.key] if isinstance(row, dict) else getattr(row, col.key) for col in columns]
+
+    return {
+        "items": rows,
+        "prev_cursor": encode_cursor(key_of(rows[0])) if rows else cursor,
+        "next_cursor": encode_cursor(key_of(rows[-1])) if rows else cursor,
+        "has_more": has_more,
+    }
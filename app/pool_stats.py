@@ -0,0 +1,119 @@
+import os
+import time
+import threading
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+# checkout kutish vaqti uchun histogram chegaralari (ms)
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class PoolStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.pool = None
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_sum_ms = 0.0
+        self.wait_max_ms = 0.0
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+
+    def observe_wait(self, elapsed_ms: float, timed_out: bool = False):
+        idx = len(WAIT_BUCKETS_MS)
+        for i, bound in enumerate(WAIT_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                idx = i
+                break
+        with self._lock:
+            self.wait_buckets[idx] += 1
+            self.wait_sum_ms += elapsed_ms
+            self.wait_max_ms = max(self.wait_max_ms, elapsed_ms)
+            if timed_out:
+                self.timeouts += 1
+
+    def incr(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def snapshot(self) -> dict:
+        pool = self.pool
+        with self._lock:
+            observed = sum(self.wait_buckets)
+            histogram = {
+                (f"le_{bound}ms" if i < len(WAIT_BUCKETS_MS) else "le_inf"): count
+                for i, (bound, count) in enumerate(zip(WAIT_BUCKETS_MS + (None,), self.wait_buckets))
+            }
+            return {
+                "pool": self.name,
+                "pid": os.getpid(),
+                "size": pool.size() if hasattr(pool, "size") else None,
+                "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+                "checked_in": pool.checkedin() if hasattr(pool, "checkedin") else None,
+                "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "wait_ms": {
+                    "count": observed,
+                    "avg": round(self.wait_sum_ms / observed, 3) if observed else 0.0,
+                    "max": round(self.wait_max_ms, 3),
+                    "histogram": histogram,
+                },
+            }
+
+
+class _TimedGetMixin:
+    """Times how long a caller waits inside the pool for a connection.
+
+    SQLAlchemy has no "checkout started" event, so the wait is measured
+    around ``_do_get``; the rest of the counters come from pool events.
+    """
+
+    stats: PoolStats = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            if self.stats is not None:
+                self.stats.observe_wait((time.perf_counter() - start) * 1000, timed_out=True)
+            raise
+        if self.stats is not None:
+            self.stats.observe_wait((time.perf_counter() - start) * 1000)
+        return conn
+
+    def recreate(self):
+        new_pool = super().recreate()
+        # event listenerlar dispatch bilan birga ko'chadi
+        if self.stats is not None:
+            new_pool.stats = self.stats
+            self.stats.pool = new_pool
+        return new_pool
+
+
+class InstrumentedQueuePool(_TimedGetMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_TimedGetMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def attach(pool, stats: PoolStats) -> PoolStats:
+    stats.pool = pool
+    if isinstance(pool, _TimedGetMixin):
+        pool.stats = stats
+
+    event.listen(pool, "checkout", lambda *args: stats.incr("checkouts"))
+    event.listen(pool, "checkin", lambda *args: stats.incr("checkins"))
+    event.listen(pool, "connect", lambda *args: stats.incr("connects"))
+    event.listen(pool, "invalidate", lambda *args: stats.incr("invalidations"))
+    return stats
@@ -0,0 +1,138 @@
+import os
+import json
+import asyncio
+import logging
+from typing import Awaitable, Callable
+from dotenv import load_dotenv
+from sqlalchemy import text, delete, insert, select
+from sqlalchemy.engine import make_url
+from .database import ASYNC_DATABASE_URL, async_engine
+from .models import WsPayload
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# memory: faqat shu worker ichida; postgres: LISTEN/NOTIFY orqali barcha worker/node'larga
+WS_BACKEND = os.getenv("WS_BACKEND", "memory").lower()
+WS_NOTIFY_CHANNEL = os.getenv("WS_NOTIFY_CHANNEL", "startask_ws")
+# NOTIFY payload chegarasi 8000 bayt; kattaroq xabarlar jadval orqali (id bilan) uzatiladi
+WS_NOTIFY_MAX_BYTES = int(os.getenv("WS_NOTIFY_MAX_BYTES", "7500"))
+WS_PAYLOAD_TTL_SECONDS = int(os.getenv("WS_PAYLOAD_TTL_SECONDS", "300"))
+
+Deliver = Callable[[str, str], Awaitable[None]]
+
+
+class InProcessBackend:
+    """Delivers straight to this worker's sockets (single-worker deployments)."""
+
+    async def start(self, deliver: Deliver):
+        self.deliver = deliver
+
+    async def publish(self, topic: str, message: str):
+        await self.deliver(topic, message)
+
+    async def stop(self):
+        pass
+
+
+class PostgresBackend:
+    """Fan-out across workers and nodes with Postgres LISTEN/NOTIFY.
+
+    Every worker holds one dedicated asyncpg connection that LISTENs on the
+    channel and hands each notification to the local ConnectionManager.
+    Publishing goes through the normal async engine pool, so the publisher's
+    own worker also receives the message through its listener.
+    """
+
+    def __init__(self, channel: str = WS_NOTIFY_CHANNEL, max_bytes: int = WS_NOTIFY_MAX_BYTES):
+        self.channel = channel
+        self.max_bytes = max_bytes
+        self._conn = None
+        self._supervisor: asyncio.Task | None = None
+        self._consumer: asyncio.Task | None = None
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._closing = False
+
+    def _listener_dsn(self) -> str:
+        return make_url(ASYNC_DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+
+    async def start(self, deliver: Deliver):
+        self.deliver = deliver
+        self._closing = False
+        await self._connect()
+        self._supervisor = asyncio.create_task(self._supervise())
+        self._consumer = asyncio.create_task(self._consume())
+
+    async def _connect(self):
+        import asyncpg
+
+        self._conn = await asyncpg.connect(self._listener_dsn())
+        await self._conn.add_listener(self.channel, self._on_notify)
+
+    async def _supervise(self):
+        # listener ulanishi uzilsa qayta ulanadi; uzilish paytidagi xabarlar yo'qoladi
+        delay = 1
+        while not self._closing:
+            await asyncio.sleep(delay)
+            if self._conn is not None and not self._conn.is_closed():
+                delay = 1
+                continue
+            try:
+                await self._connect()
+                logger.warning("pubsub listener reconnected")
+                delay = 1
+            except Exception:
+                logger.exception("pubsub listener reconnect failed")
+                delay = min(delay * 2, 30)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        self._queue.put_nowait(payload)
+
+    async def _consume(self):
+        # bitta iste'molchi: xabarlar NOTIFY tartibida yetkaziladi
+        while True:
+            await self._handle(await self._queue.get())
+
+    async def _handle(self, payload: str):
+        try:
+            envelope = json.loads(payload)
+            message = envelope.get("m")
+            if "ref" in envelope:
+                async with async_engine.connect() as conn:
+                    message = await conn.scalar(select(WsPayload.payload).filter(WsPayload.id == envelope["ref"]))
+                if message is None:
+                    logger.warning("pubsub payload %s already expired", envelope["ref"])
+                    return
+            await self.deliver(envelope["t"], message)
+        except Exception:
+            logger.exception("pubsub delivery failed")
+
+    async def publish(self, topic: str, message: str):
+        envelope = json.dumps({"t": topic, "m": message}, separators=(",", ":"))
+        async with async_engine.begin() as conn:
+            if len(envelope.encode()) > self.max_bytes:
+                ref = (await conn.execute(insert(WsPayload).values(payload=message).returning(WsPayload.id))).scalar_one()
+                envelope = json.dumps({"t": topic, "ref": ref}, separators=(",", ":"))
+                await conn.execute(delete(WsPayload).filter(
+                    WsPayload.created_at < text(f"now() - interval '{WS_PAYLOAD_TTL_SECONDS} seconds'")
+                ))
+            await conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": self.channel, "payload": envelope})
+
+    async def stop(self):
+        self._closing = True
+        for task in (self._supervisor, self._consumer):
+            if task is not None:
+                task.cancel()
+        self._supervisor = self._consumer = None
+        if self._conn is not None and not self._conn.is_closed():
+            await self._conn.close()
+        self._conn = None
+
+
+def create_backend(name: str = WS_BACKEND):
+    if name == "postgres":
+        return PostgresBackend()
+    if name == "memory":
+        return InProcessBackend()
+    raise ValueError(f"Unknown WS_BACKEND: {name}")
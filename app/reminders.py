@@ -0,0 +1,246 @@
+import os
+import json
+import heapq
+import asyncio
+import itertools
+import logging
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from sqlalchemy import select
+from .database import db_session
+from .leader import run_as_leader
+from .models import Task, TaskStatusEnum
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DEADLINE_REMINDERS = os.getenv("DEADLINE_REMINDERS", "1").lower() not in ("0", "false", "no")
+# muddatdan shuncha oldin "due soon" yuboriladi
+DEADLINE_DUE_SOON_MINUTES = float(os.getenv("DEADLINE_DUE_SOON_MINUTES", "60"))
+# heap'da faqat shu oynadagi muddatlar; oyna yarmida keyingi qism yuklanadi
+DEADLINE_HORIZON_HOURS = float(os.getenv("DEADLINE_HORIZON_HOURS", "24"))
+# egasi bo'lmagan worker'lar lock'ni shu oraliqda qayta so'raydi; egasi ulanishni tekshiradi (leader.py)
+DEADLINE_LOCK_RETRY_SECONDS = float(os.getenv("DEADLINE_LOCK_RETRY_SECONDS", "30"))
+DEADLINE_LOCK_KEY = 0x5354_4444  # pg_advisory_lock kaliti (butun klaster bo'yicha bitta)
+DEADLINE_TOPIC = "deadlines"
+
+
+def as_utc(value: datetime) -> datetime:
+    # sqlite naive qaytaradi: UTC deb hisoblanadi
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def ws_manager():
+    # utils -> auth -> crud -> reminders: modul darajasida import qilinsa aylanma bo'ladi
+    from .utils import manager
+    return manager
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class Reminder:
+    __slots__ = ("task_id", "title", "deadline", "assigned_to_id", "department_id")
+
+    def __init__(self, row):
+        self.task_id = row.id
+        self.deadline = as_utc(row.deadline)
+        self.update(row)
+
+    def update(self, row):
+        self.title = row.title
+        self.assigned_to_id = row.assigned_to_id
+        self.department_id = row.department_id
+
+
+class DeadlineScheduler:
+    """Fires "due soon" and "overdue" events from an in-memory min-heap.
+
+    Only the worker holding a Postgres advisory lock owns the heap. It loads
+    deadlines one window ahead and sleeps until the next one is due. crud
+    publishes the ids of changed tasks on DEADLINE_TOPIC; the owner re-reads
+    just those rows and reschedules them. Superseded heap entries are skipped
+    lazily when popped.
+    """
+
+    def __init__(self, lead: float = DEADLINE_DUE_SOON_MINUTES * 60, horizon: float = DEADLINE_HORIZON_HOURS * 3600):
+        self.lead = timedelta(seconds=lead)
+        self.horizon = timedelta(seconds=horizon)
+        self.owner = False
+        self.heap: list = []
+        self.current: dict[int, Reminder] = {}
+        self.loaded_until = utcnow()
+        self.changes: asyncio.Queue = asyncio.Queue()
+        self.wakeup = asyncio.Event()
+        self.seq = itertools.count()
+        self.fired = 0
+
+    async def notify_changed(self, task_ids, rescheduled: bool = True):
+        """Called by crud after commit; reaches the owner whichever worker it runs on.
+
+        ``rescheduled`` means the deadline or status may have changed, so an
+        event that is already due fires right away. Otherwise (title, assignee
+        edits, deletes) only the stored details are refreshed.
+        """
+        if task_ids:
+            await ws_manager().publish(DEADLINE_TOPIC, json.dumps({"ids": sorted(set(task_ids)), "rescheduled": rescheduled}))
+
+    def _on_change(self, message: str):
+        if self.owner:
+            self.changes.put_nowait(json.loads(message))
+
+    async def run(self):
+        ws_manager().subscribe(DEADLINE_TOPIC, self._on_change)
+        await run_as_leader("deadline scheduler", DEADLINE_LOCK_KEY, self._own, DEADLINE_LOCK_RETRY_SECONDS)
+
+    async def _own(self):
+        self.heap, self.current = [], {}
+        self.loaded_until = utcnow()
+        self.changes = asyncio.Queue()
+        self.owner = True
+        refresher = asyncio.create_task(self._refresh_forever())
+        try:
+            reload_at = utcnow()
+            while True:
+                now = utcnow()
+                if now >= reload_at:
+                    await self._load_window(now)
+                    reload_at = now + self.horizon / 2
+                await self._fire_due(now)
+                wake_at = reload_at
+                if self.heap:
+                    wake_at = min(wake_at, self.heap[0][0])
+                self.wakeup.clear()
+                try:
+                    async with asyncio.timeout(max(0.0, (wake_at - utcnow()).total_seconds())):
+                        await self.wakeup.wait()
+                except TimeoutError:
+                    pass
+        finally:
+            self.owner = False
+            refresher.cancel()
+            self.heap, self.current = [], {}
+
+    async def _load_window(self, now: datetime):
+        since, until = self.loaded_until, now + self.horizon + self.lead
+        # oldin: shu orada kelgan o'zgarishlar qabul qilinadi, yuklash ularni bosib ketmaydi
+        self.loaded_until = until
+        async with db_session() as db:
+            rows = (await db.execute(
+                self._rows().filter(Task.deadline > since, Task.deadline <= until)
+            )).all()
+        for row in rows:
+            if row.id not in self.current:
+                self._schedule(row, catch_up=False)
+        logger.info("deadline scheduler: %d deadlines loaded until %s", len(rows), until.isoformat())
+
+    @staticmethod
+    def _rows():
+        return select(
+            Task.id, Task.title, Task.deadline, Task.assigned_to_id, Task.department_id,
+        ).filter(Task.deadline.is_not(None), Task.status != TaskStatusEnum.done)
+
+    async def _refresh_forever(self):
+        # bitta iste'molchi: keyingi o'qish har doim keyingi holatni ko'radi
+        while True:
+            changes = [await self.changes.get()]
+            while not self.changes.empty():
+                changes.append(self.changes.get_nowait())
+            ids = {task_id for change in changes for task_id in change["ids"]}
+            rescheduled = {task_id for change in changes if change["rescheduled"] for task_id in change["ids"]}
+            try:
+                async with db_session() as db:
+                    rows = {row.id: row for row in (await db.execute(self._rows().filter(Task.id.in_(ids)))).all()}
+            except Exception:
+                logger.exception("deadline scheduler: refresh failed for %d tasks", len(ids))
+                continue
+            for task_id in ids:
+                row = rows.get(task_id)
+                if row is None or as_utc(row.deadline) > self.loaded_until:
+                    # bajarilgan, o'chirilgan yoki oynadan tashqarida (keyingi yuklashda keladi)
+                    self.current.pop(task_id, None)
+                else:
+                    self._schedule(row, catch_up=task_id in rescheduled)
+
+    def _schedule(self, row, catch_up: bool):
+        reminder = self.current.get(row.id)
+        if reminder is not None and reminder.deadline == as_utc(row.deadline):
+            # muddat o'zgarmagan: yuborilgan eslatma qayta yuborilmaydi
+            reminder.update(row)
+            return
+        reminder = self.current[row.id] = Reminder(row)
+        now = utcnow()
+        events = [("task_overdue", reminder.deadline)]
+        if reminder.deadline > now:
+            events.append(("task_due_soon", reminder.deadline - self.lead))
+        pending = [(kind, at) for kind, at in events if catch_up or at > now]
+        if not pending:
+            # yuklashda o'tib ketganlar tashlanadi (qayta ishga tushganda takror yubormaslik uchun)
+            del self.current[row.id]
+        for kind, at in pending:
+            heapq.heappush(self.heap, (at, next(self.seq), kind, reminder))
+            if self.heap[0][3] is reminder:
+                self.wakeup.set()
+
+    async def _fire_due(self, now: datetime):
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            _, _, kind, reminder = heapq.heappop(self.heap)
+            if self.current.get(reminder.task_id) is not reminder:
+                continue
+            if kind == "task_overdue":
+                self.current.pop(reminder.task_id, None)
+            due.append((kind, reminder))
+        if not due:
+            return
+        # o'zgarish xabari yo'qolgan bo'lishi mumkin: yuborishdan oldin bitta so'rov bilan qayta tekshiriladi
+        try:
+            async with db_session() as db:
+                rows = {row.id: row for row in (await db.execute(
+                    self._rows().filter(Task.id.in_({reminder.task_id for _, reminder in due}))
+                )).all()}
+        except Exception:
+            logger.exception("deadline scheduler: recheck failed for %d reminders", len(due))
+            return
+        for kind, reminder in due:
+            row = rows.get(reminder.task_id)
+            if row is None or as_utc(row.deadline) != reminder.deadline:
+                # bajarilgan, o'chirilgan yoki muddati o'zgargan: eslatma eskirgan
+                if self.current.get(reminder.task_id) is reminder:
+                    del self.current[reminder.task_id]
+                if row is not None and as_utc(row.deadline) <= self.loaded_until:
+                    self._schedule(row, catch_up=False)
+                continue
+            reminder.update(row)
+            await self._send(kind, reminder)
+
+    async def _send(self, kind: str, reminder: Reminder):
+        message = json.dumps({
+            "event": kind,
+            "task_id": reminder.task_id,
+            "title": reminder.title,
+            "deadline": reminder.deadline.isoformat(),
+            "department_id": reminder.department_id,
+            "assigned_to_id": reminder.assigned_to_id,
+        })
+        try:
+            await ws_manager().broadcast_dept(reminder.department_id, message)
+            if reminder.assigned_to_id is not None:
+                await ws_manager().notify_user(reminder.assigned_to_id, message)
+            self.fired += 1
+        except Exception:
+            logger.exception("deadline scheduler: failed to send %s for task %d", kind, reminder.task_id)
+
+    def stats(self) -> dict:
+        return {
+            "owner": self.owner,
+            "tracked": len(self.current),
+            "heap": len(self.heap),
+            "fired": self.fired,
+            "loaded_until": self.loaded_until.isoformat(),
+        }
+
+
+deadline_scheduler = DeadlineScheduler()
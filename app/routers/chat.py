@@ -1,39 +1,114 @@
-from fastapi import APIRouter, WebSocket, Depends
-from sqlalchemy.orm import Session
-from ..database import get_db
-from ..models import Message, ChatType, RoleEnum
-from ..utils import manager, require_role
-from ..auth import get_current_user
+import asyncio
+from typing import Literal
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, WebSocketException, Depends, HTTPException, Query, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_db, db_session
+from ..models import ChatType, Message, Department
+from ..schemas import MessagePage, TokenClaims
+from ..utils import manager, room_topic
+from ..access import authorize_department, authorize_private_room
+from ..auth import get_current_claims, get_ws_claims
+from ..chat_writer import chat_writer, CHAT_WRITE_STRICT
+from ..crud import read_messages, department_company
+from ..pagination import window_page
 
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
+
+def send_ack(ws: WebSocket, ack: asyncio.Future):
+    if ack.cancelled():
+        return
+    if ack.exception() is not None:
+        manager.send(ws, {"type": "error", "detail": "Xabar saqlanmadi"})
+    else:
+        manager.send(ws, {"type": "ack", "id": ack.result()})
+
+
+async def persist(ws: WebSocket, text: str, chat_type: ChatType, room: str, sender_id: int, company_id: int | None) -> bool:
+    """Queue the message for the group-commit writer; the sender gets an ack once it is durable.
+
+    Only in strict mode does the caller wait for the commit before relaying.
+    """
+    ack = await chat_writer.submit(text, chat_type, room, sender_id, company_id)
+    if not CHAT_WRITE_STRICT:
+        ack.add_done_callback(lambda f: send_ack(ws, f))
+        return True
+    try:
+        await ack
+    except Exception:
+        pass
+    send_ack(ws, ack)
+    return not ack.cancelled() and ack.exception() is None
+
+
 @router.websocket("/private/{room_id}")
-async def ws_private(ws: WebSocket, room_id: str, db: Session = Depends(get_db), user=Depends(get_current_user)):
-    await ws.accept()
+async def ws_private(ws: WebSocket, room_id: str, user=Depends(get_ws_claims)):
+    # xona nomi — ikki ishtirokchining id'lari ("3-7"), ikkalasi bir kompaniyada
+    try:
+        async with db_session() as db:
+            await authorize_private_room(db, user, room_id)
+    except HTTPException as e:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason=str(e.detail))
     await manager.connect_private(ws, room_id)
     try:
         while True:
             text = await ws.receive_text()
-            msg = Message(content=text, chat_type=ChatType.private, room=room_id)
-            db.add(msg); db.commit(); db.refresh(msg)
-            await manager.send_private(room_id, text)
+            # shaxsiy xona yuboruvchining kompaniyasida
+            if await persist(ws, text, ChatType.private, room_id, user.id, user.company_id):
+                await manager.send_private(room_id, text)
+    except WebSocketDisconnect:
+        pass
     finally:
         manager.disconnect(ws)
 
 @router.websocket("/department/{dept_id}")
-async def ws_dept(ws: WebSocket, dept_id: int, db: Session = Depends(get_db), user=Depends(require_role(RoleEnum.company_admin, RoleEnum.department_manager, RoleEnum.employee))):
-    await ws.accept()
+async def ws_dept(ws: WebSocket, dept_id: int, user=Depends(get_ws_claims)):
+    # ruxsat va bo'limning kompaniyasi ulanishda bir marta; sessiya ulanish davomida ushlab turilmaydi
+    try:
+        async with db_session() as db:
+            await authorize_department(db, user, dept_id, detail="Sizda ushbu bo'lim chatini ko'rish huquqi yo'q")
+            company_id = await db.scalar(select(Department.company_id).filter(Department.id == dept_id))
+    except HTTPException as e:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason=str(e.detail))
     await manager.connect_dept(ws, dept_id)
     try:
         while True:
             text = await ws.receive_text()
-            msg = Message(content=text, chat_type=ChatType.department, room=str(dept_id))
-            db.add(msg); db.commit(); db.refresh(msg)
-            await manager.broadcast_dept(dept_id, text)
+            if await persist(ws, text, ChatType.department, str(dept_id), user.id, company_id):
+                await manager.broadcast_dept(dept_id, text)
+    except WebSocketDisconnect:
+        pass
     finally:
         manager.disconnect(ws)
         
+@router.get("/{chat_type}/{room}/messages", response_model=MessagePage)
+async def message_history(
+    chat_type: ChatType,
+    room: str,
+    cursor: str | None = Query(None, description="prev_cursor (eskiroq) yoki next_cursor (yangiroq)"),
+    direction: Literal["before", "after"] = "before",
+    limit: int = Query(50, ge=1, le=200),
+    db: AsyncSession = Depends(get_db),
+    user: TokenClaims = Depends(get_current_claims),
+):
+    """Room history, oldest first. Without a cursor returns the newest page."""
+    if chat_type == ChatType.department:
+        if not room.isdigit():
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Department not found")
+        await authorize_department(db, user, int(room), detail="Sizda ushbu bo'lim chatini ko'rish huquqi yo'q")
+    else:
+        await authorize_private_room(db, user, room)
+    if cursor is None and direction == "before":
+        # qayta ulanish holati: faol xonaning oxirgi xabarlari xotiradan
+        recent = manager.recent(room_topic(chat_type, room), user.company_id, limit)
+        if recent is not None:
+            return window_page(recent, [Message.created_at, Message.id], has_more=True)
+    company_id = department_company(int(room)) if chat_type == ChatType.department else user.company_id
+    return await read_messages(db, company_id, chat_type, room, cursor, limit, direction)
+
+
 @router.get("/ws/chat/info", tags=["WebSocket Info"])
 def websocket_info():
     return {"detail": "See docstring for websocket usage."}
@@ -1,20 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from ..schemas import DepartmentCreate, DepartmentRead, DepartmentUpdate
-from app.crud import create_department, get_departments, update_department, delete_department, get_department_by_id
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..schemas import DepartmentCreate, DepartmentRead, DepartmentUpdate, DepartmentStats, Page
+from app.crud import departments_scope, create_department, get_departments, update_department, delete_department, get_department_by_id, get_department_stats, reconcile_task_stats
 from ..database import get_db
-from ..utils import require_role, manager
+from ..utils import require_role, require_debug_token, manager
+from ..access import authorize_department
+from ..conditional import not_modified
 from ..models import RoleEnum
 from typing import List
-from ..auth import get_current_user
-from ..models import User, DepartmentUser
+from ..auth import get_current_claims
+from ..pagination import PageParams
+from ..schemas import TokenClaims
 
 
 router = APIRouter(prefix="/departments", tags=["departments"])
 
-@router.post("/", response_model=DepartmentRead, dependencies=[Depends(require_role(RoleEnum.company_admin))])
-async def create(dept_in: DepartmentCreate, db: Session = Depends(get_db)):
-    dept = create_department(db, dept_in)
+@router.post("/", response_model=DepartmentRead)
+async def create(dept_in: DepartmentCreate, db: AsyncSession = Depends(get_db), user: TokenClaims = Depends(require_role(RoleEnum.company_admin))):
+    dept = await create_department(db, dept_in, user.company_id)
     import json
     # endpoin­timiz async, shuning uchun await ishlaydi
     await manager.broadcast_tasks(json.dumps({
@@ -26,52 +29,54 @@ async def create(dept_in: DepartmentCreate, db: Session = Depends(get_db)):
 
 
 
-@router.get("/", response_model=List[DepartmentRead])
-def list_all(db: Session = Depends(get_db)):
-    return get_departments(db)
+@router.get("/", response_model=Page[DepartmentRead])
+async def list_all(request: Request, response: Response, page: PageParams = Depends(), db: AsyncSession = Depends(get_db),
+                   current_user: TokenClaims = Depends(get_current_claims)):
+    # faqat o'z kompaniyasining bo'limlari: ETag ham ko'ruvchiga bog'liq
+    if cached := await not_modified(db, request, response, [departments_scope(current_user.company_id)], current_user.id):
+        return cached
+    return await get_departments(db, current_user.company_id, page)
+
+
+
+@router.post("/stats/reconcile", dependencies=[Depends(require_debug_token)])
+async def reconcile_stats(db: AsyncSession = Depends(get_db)):
+    # statistikani tasks jadvalidan qayta quradi (drift bo'lsa); barcha kompaniyalar uchun
+    # task_stats'ni EXCLUSIVE lock bilan yopadi, shuning uchun faqat operator (X-Debug-Token)
+    return {"rows": await reconcile_task_stats(db)}
+
+
+
+@router.get("/{dept_id}/stats", response_model=DepartmentStats)
+async def department_stats(dept_id: int, db: AsyncSession = Depends(get_db), current_user: TokenClaims = Depends(get_current_claims)):
+    await authorize_department(db, current_user, dept_id, detail="Sizda ushbu bo'limni ko'rish huquqi yo'q")
+    return await get_department_stats(db, dept_id)
 
 
 
 @router.get("/{dept_id}", response_model=DepartmentRead, dependencies=[Depends(require_role(RoleEnum.company_admin, RoleEnum.department_manager, RoleEnum.employee))])
-def get_department(dept_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    dept = get_department_by_id(db, dept_id)
+async def get_department(request: Request, response: Response, dept_id: int, db: AsyncSession = Depends(get_db), current_user: TokenClaims = Depends(get_current_claims)):
+    await authorize_department(db, current_user, dept_id, detail="Sizda ushbu bo'limni ko'rish huquqi yo'q")
+    if cached := await not_modified(db, request, response, [departments_scope(current_user.company_id)]):
+        return cached
+    dept = await get_department_by_id(db, dept_id)
     if not dept:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Department not found")
-    
-    if current_user.role == RoleEnum.company_admin:
-        return dept
-    
-    if current_user.role == RoleEnum.department_manager and dept.manager_id == current_user.id:
-        return dept
-
-    membership = (
-        db.query(DepartmentUser)
-          .filter(
-              DepartmentUser.department_id == dept_id,
-              DepartmentUser.user_id == current_user.id
-          )
-          .first()
-    )
-    if current_user.role == RoleEnum.employee and membership:
-        return dept
-
-    raise HTTPException(
-        status_code=status.HTTP_403_FORBIDDEN,
-        detail="Sizda ushbu bo'limni ko'rish huquqi yo'q"
-    )
+    return dept
 
 
 
-@router.patch("/{dept_id}", response_model=DepartmentRead, dependencies=[Depends(require_role(RoleEnum.company_admin))])
-def update(dept_id: int, dept_in: DepartmentUpdate, db: Session = Depends(get_db)):
-    return update_department(db, dept_id, dept_in)
+@router.patch("/{dept_id}", response_model=DepartmentRead)
+async def update(dept_id: int, dept_in: DepartmentUpdate, db: AsyncSession = Depends(get_db), user: TokenClaims = Depends(require_role(RoleEnum.company_admin))):
+    await authorize_department(db, user, dept_id, manage=True)
+    return await update_department(db, dept_id, dept_in)
 
 
 
-@router.delete("/{dept_id}", dependencies=[Depends(require_role(RoleEnum.company_admin))])
-def delete(dept_id: int, db: Session = Depends(get_db)):
-    if not get_department_by_id(db, dept_id):
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Department not found")
-    delete_department(db, dept_id)
+@router.delete("/{dept_id}")
+async def delete(dept_id: int, db: AsyncSession = Depends(get_db), user: TokenClaims = Depends(require_role(RoleEnum.company_admin))):
+    # boshqa kompaniyaning bo'limi — 404
+    await authorize_department(db, user, dept_id, manage=True)
+    await delete_department(db, dept_id)
     return {"detail": "Department deleted successfully"}
 
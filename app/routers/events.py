@@ -0,0 +1,44 @@
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, Query
+from ..database import db_session
+from ..utils import manager
+from ..auth import get_ws_claims
+from ..access import get_access_set, visible_departments
+from ..outbox import ResumingSocket, company_topic, dept_topic, events_channel, message_offset, replay
+
+router = APIRouter(prefix="/events", tags=["events"])
+
+
+@router.websocket("/ws")
+async def ws_events(ws: WebSocket, after: int | None = Query(None, ge=0), user=Depends(get_ws_claims)):
+    """Task, subtask, membership and department change events with offsets.
+
+    Reconnect with ``?after=<last offset>`` to get what was missed first; a
+    ``{"type": "reset"}`` message means that isn't possible and the client
+    should reload its lists.
+    """
+    async with db_session() as db:
+        departments = visible_departments(await get_access_set(db, user))
+    topics = [company_topic(user.company_id), *(dept_topic(d) for d in departments)]
+
+    await ws.accept()
+    # avval obuna, keyin tarix: orada e'lon qilingan hodisa yo'qolmaydi, takrori offset bo'yicha tashlanadi
+    socket = ResumingSocket(ws)
+    for topic in topics:
+        manager.register(socket, events_channel(topic))
+    try:
+        if after is not None:
+            async with db_session() as db:
+                backlog = await replay(db, topics, after)
+            if backlog is None:
+                await ws.send_json({"type": "reset"})
+                after = None
+            for message in backlog or ():
+                await ws.send_text(message)
+                after = message_offset(message)
+        await socket.release(after)
+        while True:
+            await ws.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        manager.disconnect(socket)
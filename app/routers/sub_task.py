@@ -1,52 +1,147 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from ..schemas import SubtaskCreate, SubtaskRead, SubtaskUpdate
-from app.crud import create_subtask, update_subtask, read_subtasks, delete_subtask
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..schemas import SubtaskCreate, SubtaskRead, SubtaskUpdate, Page, SubtaskBulkCreate, SubtaskBulkUpdate, BulkDelete, BulkResult
+from app.crud import create_subtask, update_subtask, read_subtasks, delete_subtask, get_task_department_ids, bulk_create_subtasks, bulk_update_subtasks, bulk_delete_subtasks
 from ..database import get_db
-from ..utils import require_role
-from ..models import RoleEnum, Subtask, Task
-from ..auth import get_current_user
+from ..utils import require_role, manageable_departments, department_error, check_bulk_errors, bulk_update_row
+from ..models import RoleEnum, Subtask, Task, TaskStatusEnum
+from ..pagination import PageParams
+from ..auth import get_current_claims
+from ..access import get_access_set
 from typing import List
 
-def check_subtask_exists(db: Session, subtask_id: int):
-    return db.query(Subtask).filter(Subtask.id == subtask_id).first() is not None
-        
-    
+async def check_task_manager(db: AsyncSession, user, task_id: int, detail: str):
+    task = (await db.execute(select(Task.department_id).filter(Task.id == task_id).limit(1))).first()
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if not (await get_access_set(db, user)).can_manage(task.department_id):
+        raise HTTPException(status_code=403, detail=detail)
+
 
 router = APIRouter(prefix="/subtasks", tags=["subtasks"])
 
+SUBTASK_STATUSES = ("to_do", "doing", "done")
+
+def task_error(task_id: int, task_departments: dict, existing: set, allowed: set) -> str | None:
+    if task_id not in task_departments:
+        return "Task not found"
+    return department_error(task_departments[task_id], existing, allowed)
+
+# /bulk yo'llari /{subtask_id} dan oldin e'lon qilinishi kerak
+@router.post("/bulk", response_model=BulkResult)
+async def bulk_create(payload: SubtaskBulkCreate, all_or_nothing: bool = False, user = Depends(get_current_claims), db: AsyncSession = Depends(get_db)):
+    task_departments = await get_task_department_ids(db, {s_in.task_id for s_in in payload.items})
+    existing, allowed = await manageable_departments(db, user, set(task_departments.values()))
+    results = []
+    for index, s_in in enumerate(payload.items):
+        detail = task_error(s_in.task_id, task_departments, existing, allowed)
+        results.append({"index": index, "id": None, "ok": detail is None, "detail": detail})
+    check_bulk_errors(results, all_or_nothing)
+
+    valid = [r["index"] for r in results if r["ok"]]
+    if valid:
+        ids = await bulk_create_subtasks(db, [payload.items[i] for i in valid])
+        for index, subtask_id in zip(valid, ids):
+            results[index]["id"] = subtask_id
+    return {"results": results}
+
+@router.patch("/bulk", response_model=BulkResult)
+async def bulk_update(payload: SubtaskBulkUpdate, all_or_nothing: bool = False, user = Depends(get_current_claims), db: AsyncSession = Depends(get_db)):
+    targets = {
+        row.id: row
+        for row in (await db.execute(
+            select(Subtask.id, Subtask.task_id, Subtask.completed_at).filter(Subtask.id.in_({item.id for item in payload.items}))
+        )).all()
+    }
+    task_ids = {row.task_id for row in targets.values()} | {item.task_id for item in payload.items if item.task_id is not None}
+    task_departments = await get_task_department_ids(db, task_ids)
+    existing, allowed = await manageable_departments(db, user, set(task_departments.values()))
+
+    results, rows, seen = [], [], set()
+    for index, item in enumerate(payload.items):
+        target = targets.get(item.id)
+        if target is None:
+            detail = "Subtask not found"
+        elif item.id in seen:
+            detail = "Duplicate subtask id in batch"
+        elif item.status is not None and item.status not in SUBTASK_STATUSES:
+            detail = "Invalid status. Must be 'to_do', 'doing', or 'done'."
+        else:
+            detail = task_error(target.task_id, task_departments, existing, allowed)
+            if detail is None and item.task_id is not None:
+                detail = task_error(item.task_id, task_departments, existing, allowed)
+        seen.add(item.id)
+        results.append({"index": index, "id": item.id, "ok": detail is None, "detail": detail})
+        if detail is None:
+            row = bulk_update_row(item, target.completed_at)
+            if len(row) > 1:
+                rows.append(row)
+    check_bulk_errors(results, all_or_nothing)
+
+    if rows:
+        updated = set(await bulk_update_subtasks(db, rows))
+        for missing in {row["id"] for row in rows} - updated:
+            for result in [r for r in results if r["id"] == missing]:
+                result.update(ok=False, detail="Subtask not found")
+    return {"results": results}
+
+@router.delete("/bulk", response_model=BulkResult)
+async def bulk_delete(payload: BulkDelete, all_or_nothing: bool = False, user = Depends(get_current_claims), db: AsyncSession = Depends(get_db)):
+    targets = dict((await db.execute(
+        select(Subtask.id, Subtask.task_id).filter(Subtask.id.in_(set(payload.ids)))
+    )).all())
+    task_departments = await get_task_department_ids(db, set(targets.values()))
+    existing, allowed = await manageable_departments(db, user, set(task_departments.values()))
+    results = []
+    for index, subtask_id in enumerate(payload.ids):
+        if subtask_id not in targets:
+            detail = "Subtask not found"
+        else:
+            detail = task_error(targets[subtask_id], task_departments, existing, allowed)
+        results.append({"index": index, "id": subtask_id, "ok": detail is None, "detail": detail})
+    check_bulk_errors(results, all_or_nothing)
+
+    valid = {r["id"] for r in results if r["ok"]}
+    if valid:
+        deleted = set(await bulk_delete_subtasks(db, list(valid)))
+        for result in results:
+            if result["ok"] and result["id"] not in deleted:
+                result.update(ok=False, detail="Subtask not found")
+    return {"results": results}
+
 @router.post("/", response_model=SubtaskRead)
-def create(subtask_in: SubtaskCreate, user = Depends(get_current_user), db: Session = Depends(get_db)):
-    task = db.query(Task).filter(Task.id == subtask_in.task_id).first()
-    if user.id != task.department.manager_id and user.role != RoleEnum.company_admin:
-        raise HTTPException(status_code=403, detail="You can only create subtasks for your own tasks")
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
-    return create_subtask(db, subtask_in)
+async def create(subtask_in: SubtaskCreate, user = Depends(get_current_claims), db: AsyncSession = Depends(get_db)):
+    await check_task_manager(db, user, subtask_in.task_id, "You can only create subtasks for your own tasks")
+    return await create_subtask(db, subtask_in)
 
-@router.get("/{task_id}", response_model=List[SubtaskRead])
-def list_all(task_id: int, db: Session = Depends(get_db)):
-    if db.query(Subtask).filter(Subtask.task_id == task_id).count() == 0:
+@router.get("/{task_id}", response_model=Page[SubtaskRead])
+async def list_all(task_id: int, page: PageParams = Depends(), status: TaskStatusEnum | None = Query(None), db: AsyncSession = Depends(get_db)):
+    result = await read_subtasks(db, task_id, page, status=status)
+    # alohida COUNT o'rniga: birinchi sahifa bo'sh bo'lsa 404
+    if not result["items"] and not page.cursor and status is None:
         raise HTTPException(status_code=404, detail="No subtasks found for this task")
-    return read_subtasks(db, task_id)
-    
+    return result
+
 @router.put("/{subtask_id}", response_model=SubtaskUpdate)
-def update(subtask_id: int, subtask_in: SubtaskUpdate, user = Depends(get_current_user), db: Session = Depends(get_db)):
-    task = db.query(Task).filter(Task.id == subtask_in.task_id).first()
-    if user.id != task.department.manager_id and user.role != RoleEnum.company_admin:
-        raise HTTPException(status_code=403, detail="You can only update subtasks for your own tasks")
-    if not check_subtask_exists(db, subtask_id):
+async def update(subtask_id: int, subtask_in: SubtaskUpdate, user = Depends(get_current_claims), db: AsyncSession = Depends(get_db)):
+    current_task_id = await db.scalar(select(Subtask.task_id).filter(Subtask.id == subtask_id))
+    if current_task_id is None:
         raise HTTPException(status_code=404, detail="Subtask not found")
+    for task_id in {current_task_id, subtask_in.task_id or current_task_id}:
+        await check_task_manager(db, user, task_id, "You can only update subtasks for your own tasks")
     if not subtask_in.status in ("to_do", "doing", "done"):
         raise HTTPException(status_code=400, detail="Invalid status. Must be 'to_do', 'doing', or 'done'.")
-    return update_subtask(db, subtask_id, subtask_in)
+    return await update_subtask(db, subtask_id, subtask_in)
 
 @router.delete("/{subtask_id}")
-def delete(subtask_id: int, user = Depends(get_current_user), db: Session = Depends(get_db)):
-    subtask_in = db.query(Subtask).filter(Subtask.id == subtask_id).first()
-    if user.id != subtask_in.task.department.manager_id and user.role != RoleEnum.company_admin:
-        raise HTTPException(status_code=403, detail="You can only delete subtasks for your own tasks")
-    if not check_subtask_exists(db, subtask_id):
+async def delete(subtask_id: int, user = Depends(get_current_claims), db: AsyncSession = Depends(get_db)):
+    task = (await db.execute(
+        select(Task.department_id).join(Subtask, Subtask.task_id == Task.id).filter(Subtask.id == subtask_id).limit(1)
+    )).first()
+    if task is None:
         raise HTTPException(status_code=404, detail="Subtask not found")
-    delete_subtask(db, subtask_id)
-    return {"detail": "SubTask deleted successfully"}
\ No newline at end of file
+    if not (await get_access_set(db, user)).can_manage(task.department_id):
+        raise HTTPException(status_code=403, detail="You can only delete subtasks for your own tasks")
+    await delete_subtask(db, subtask_id)
+    return {"detail": "SubTask deleted successfully"}
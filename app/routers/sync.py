@@ -0,0 +1,34 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..schemas import SyncResponse
+from ..crud import sync_changes
+from ..database import get_db
+from ..auth import get_current_claims
+from ..access import get_access_set, visible_departments
+from ..models import OutboxEvent
+from ..outbox import company_topic, dept_topic
+from ..pagination import MAX_LIMIT, encode_cursor, decode_cursor
+
+router = APIRouter(prefix="/sync", tags=["sync"])
+
+
+@router.get("", response_model=SyncResponse)
+async def sync(
+    since: str | None = Query(None, description="Oldingi javobdagi cursor"),
+    limit: int = Query(500, ge=1, le=MAX_LIMIT, description="Ko'pi bilan shuncha o'zgargan obyekt"),
+    user=Depends(get_current_claims),
+    db: AsyncSession = Depends(get_db),
+):
+    """Task, subtask, department and membership changes since ``since``.
+
+    Without ``since`` (or with an expired one) the response has ``reset``:
+    load the lists, then sync from the returned cursor. Repeat while
+    ``has_more``.
+    """
+    after = decode_cursor(since, [OutboxEvent.position])[0] if since else None
+    if after is not None and not isinstance(after, int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    departments = visible_departments(await get_access_set(db, user))
+    topics = [company_topic(user.company_id), *(dept_topic(d) for d in departments)]
+    changes = await sync_changes(db, topics, departments, after, limit)
+    return {**changes, "cursor": encode_cursor([changes["cursor"]])}
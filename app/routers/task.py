@@ -1,52 +1,187 @@
 import json
-from fastapi import APIRouter, Depends, WebSocket, HTTPException
-from sqlalchemy.orm import Session
-from ..schemas import TaskCreate, TaskRead, TaskUpdate
-from app.crud import create_task, update_task, read_tasks, delete_task
+from datetime import datetime
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, HTTPException, Query, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..schemas import TaskCreate, TaskRead, TaskTreeRead, TaskUpdate, Page, TaskBulkCreate, TaskBulkUpdate, BulkDelete, BulkResult
+from app.crud import tasks_scope, users_scope, departments_scope, create_task, update_task, read_tasks, read_task_rows, read_task_tree, read_user_tasks, read_user_task_rows, search_tasks, delete_task, bulk_create_tasks, bulk_update_tasks, bulk_delete_tasks
 from ..database import get_db
-from ..utils import require_role, manager
-from ..models import RoleEnum, Task, User, Department
-from ..auth import get_current_user
+from ..utils import require_role, manager, manageable_departments, department_error, check_bulk_errors, bulk_update_row
+from ..models import RoleEnum, Task, User, Department, DepartmentUser, TaskStatusEnum
+from ..pagination import PageParams
+from ..auth import get_current_claims, get_ws_claims
+from ..access import authorize_department, get_access_set, visible_departments
+from ..conditional import not_modified
+from ..serialization import FAST_LIST_RESPONSES, TASK_SHAPE, json_page
 
-def check_task_exists(db: Session, task_id: int):
-    if db.query(Task).filter(Task.id == task_id).first() is None:
+async def check_task_exists(db: AsyncSession, task_id: int) -> int:
+    department_id = await db.scalar(select(Task.department_id).filter(Task.id == task_id).limit(1))
+    if department_id is None:
         raise HTTPException(status_code=404, detail="Task not found")
+    return department_id
+
+class TaskFilters:
+    def __init__(
+        self,
+        status: TaskStatusEnum | None = Query(None),
+        assigned_to_id: int | None = Query(None),
+        deadline_from: datetime | None = Query(None),
+        deadline_to: datetime | None = Query(None),
+    ):
+        self.status = status
+        self.assigned_to_id = assigned_to_id
+        self.deadline_from = deadline_from
+        self.deadline_to = deadline_to
 
 router = APIRouter(prefix="/tasks", tags=["tasks"])
 
+TASK_STATUSES = ("to_do", "doing", "done")
+
+# /bulk yo'llari /{task_id} dan oldin e'lon qilinishi kerak
+@router.post("/bulk", response_model=BulkResult, dependencies=[Depends(require_role(RoleEnum.company_admin, RoleEnum.department_manager))])
+async def bulk_create(payload: TaskBulkCreate, all_or_nothing: bool = False, user=Depends(get_current_claims), db: AsyncSession = Depends(get_db)):
+    existing, allowed = await manageable_departments(db, user, {t_in.department_id for t_in in payload.items})
+    results = []
+    for index, t_in in enumerate(payload.items):
+        detail = department_error(t_in.department_id, existing, allowed)
+        results.append({"index": index, "id": None, "ok": detail is None, "detail": detail})
+    check_bulk_errors(results, all_or_nothing)
+
+    valid = [r["index"] for r in results if r["ok"]]
+    if valid:
+        ids = await bulk_create_tasks(db, [payload.items[i] for i in valid])
+        for index, task_id in zip(valid, ids):
+            results[index]["id"] = task_id
+    return {"results": results}
+
+@router.patch("/bulk", response_model=BulkResult, dependencies=[Depends(require_role(RoleEnum.company_admin, RoleEnum.department_manager))])
+async def bulk_update(payload: TaskBulkUpdate, all_or_nothing: bool = False, user=Depends(get_current_claims), db: AsyncSession = Depends(get_db)):
+    ids = {item.id for item in payload.items}
+    targets = {
+        row.id: row
+        for row in (await db.execute(
+            select(Task.id, Task.department_id, Task.completed_at).filter(Task.id.in_(ids))
+        )).all()
+    }
+    department_ids = {row.department_id for row in targets.values()}
+    department_ids |= {item.department_id for item in payload.items if item.department_id is not None}
+    existing, allowed = await manageable_departments(db, user, department_ids)
+
+    results, rows, seen = [], [], set()
+    for index, item in enumerate(payload.items):
+        target = targets.get(item.id)
+        if target is None:
+            detail = "Task not found"
+        elif item.id in seen:
+            detail = "Duplicate task id in batch"
+        elif item.status is not None and item.status not in TASK_STATUSES:
+            detail = "Invalid status. Must be 'to_do', 'doing', or 'done'."
+        else:
+            detail = department_error(target.department_id, existing, allowed)
+            if detail is None and item.department_id is not None:
+                detail = department_error(item.department_id, existing, allowed)
+        seen.add(item.id)
+        results.append({"index": index, "id": item.id, "ok": detail is None, "detail": detail})
+        if detail is None:
+            row = bulk_update_row(item, target.completed_at)
+            if len(row) > 1:
+                rows.append(row)
+    check_bulk_errors(results, all_or_nothing)
+
+    if rows:
+        updated = set(await bulk_update_tasks(db, rows))
+        # tekshiruvdan keyin boshqa so'rov o'chirib yuborgan bo'lishi mumkin
+        for missing in {row["id"] for row in rows} - updated:
+            for result in [r for r in results if r["id"] == missing]:
+                result.update(ok=False, detail="Task not found")
+    return {"results": results}
+
+@router.delete("/bulk", response_model=BulkResult, dependencies=[Depends(require_role(RoleEnum.company_admin, RoleEnum.department_manager))])
+async def bulk_delete(payload: BulkDelete, all_or_nothing: bool = False, user=Depends(get_current_claims), db: AsyncSession = Depends(get_db)):
+    targets = dict((await db.execute(
+        select(Task.id, Task.department_id).filter(Task.id.in_(set(payload.ids)))
+    )).all())
+    existing, allowed = await manageable_departments(db, user, set(targets.values()))
+    results = []
+    for index, task_id in enumerate(payload.ids):
+        detail = "Task not found" if task_id not in targets else department_error(targets[task_id], existing, allowed)
+        results.append({"index": index, "id": task_id, "ok": detail is None, "detail": detail})
+    check_bulk_errors(results, all_or_nothing)
+
+    valid = {r["id"] for r in results if r["ok"]}
+    if valid:
+        deleted = set(await bulk_delete_tasks(db, list(valid)))
+        for result in results:
+            if result["ok"] and result["id"] not in deleted:
+                result.update(ok=False, detail="Task not found")
+    return {"results": results}
+
 @router.post("/", response_model=TaskRead, dependencies=[Depends(require_role(RoleEnum.company_admin))])
-def create(t_in: TaskCreate, user=Depends(get_current_user), db: Session = Depends(get_db)):
-    if user.role != RoleEnum.company_admin and user.id != t_in.department.manager_id:
-        raise HTTPException(status_code=403, detail="You can only create tasks for your own department")
-    return create_task(db, t_in)
+async def create(t_in: TaskCreate, user=Depends(get_current_claims), db: AsyncSession = Depends(get_db)):
+    await authorize_department(db, user, t_in.department_id, manage=True, detail="You can only create tasks for your own department")
+    return await create_task(db, t_in)
 
 
 @router.put("/{task_id}", response_model=TaskUpdate, dependencies=[Depends(require_role(RoleEnum.company_admin, RoleEnum.department_manager))])
-def update(task_id: int, t_in: TaskUpdate, db: Session = Depends(get_db)):
-    if check_task_exists(db, task_id):
-        raise HTTPException(status_code=404, detail="Task not found")
+async def update(task_id: int, t_in: TaskUpdate, user=Depends(get_current_claims), db: AsyncSession = Depends(get_db)):
+    department_id = await check_task_exists(db, task_id)
+    for target in {department_id, t_in.department_id or department_id}:
+        await authorize_department(db, user, target, manage=True, detail="You can only manage tasks of your own department")
     if not t_in.status in ("to_do", "doing", "done"):
         raise HTTPException(status_code=400, detail="Invalid status. Must be 'to_do', 'doing', or 'done'.")
-    return update_task(db, task_id, t_in)
-
-@router.get("/department/{department_id}",  response_model=list[TaskRead])
-def list_all(department_id: int,current_user=Depends(get_current_user), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == current_user.id).first()
-    if not department_id in user.department_users and user.role != RoleEnum.company_admin:
-        raise HTTPException(status_code=403, detail="You can only view tasks for your own department")
-    return read_tasks(db, department_id)
-
-@router.get("/user/{user_id}", response_model=list[TaskRead])
-def list_user_tasks(user_id: int, current_user=Depends(get_current_user), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == current_user.id).first()
-    if user.role != RoleEnum.company_admin and user.id != user_id:
+    return await update_task(db, task_id, t_in)
+
+async def check_department_tasks_access(db: AsyncSession, current_user, department_id: int):
+    await authorize_department(db, current_user, department_id, detail="You can only view tasks for your own department")
+
+@router.get("/department/{department_id}",  response_model=Page[TaskRead])
+async def list_all(request: Request, response: Response, department_id: int, page: PageParams = Depends(), filters: TaskFilters = Depends(), current_user=Depends(get_current_claims), db: AsyncSession = Depends(get_db)):
+    await check_department_tasks_access(db, current_user, department_id)
+    # javobda department va assigned_to ham bor, shuning uchun ularning versiyalari ham kiradi
+    scopes = [tasks_scope(department_id), departments_scope(current_user.company_id), users_scope(current_user.company_id)]
+    if cached := await not_modified(db, request, response, scopes, current_user.id):
+        return cached
+    if FAST_LIST_RESPONSES:
+        return json_page(await read_task_rows(db, department_id, page, **vars(filters)), TASK_SHAPE, response.headers)
+    return await read_tasks(db, department_id, page, **vars(filters))
+
+@router.get("/department/{department_id}/tree", response_model=Page[TaskTreeRead])
+async def list_tree(department_id: int, page: PageParams = Depends(), filters: TaskFilters = Depends(), current_user=Depends(get_current_claims), db: AsyncSession = Depends(get_db)):
+    # har bir task uchun /subtasks/{task_id} so'rovi o'rniga
+    await check_department_tasks_access(db, current_user, department_id)
+    return await read_task_tree(db, department_id, page, **vars(filters))
+
+@router.get("/search", response_model=Page[TaskRead])
+async def search(q: str = Query(..., min_length=2, max_length=200), page: PageParams = Depends(), current_user=Depends(get_current_claims), db: AsyncSession = Depends(get_db)):
+    # sarlavha, tavsif va subtask sarlavhalari bo'yicha; faqat ko'rish huquqi bor bo'limlarda
+    access = await get_access_set(db, current_user)
+    return await search_tasks(db, q, visible_departments(access), page)
+
+@router.websocket("/notifications")
+async def ws_notifications(ws: WebSocket, user=Depends(get_ws_claims)):
+    # shaxsiy bildirishnomalar: task_due_soon / task_overdue
+    await manager.connect_user(ws, user.id)
+    try:
+        while True:
+            await ws.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        manager.disconnect(ws)
+
+@router.get("/user/{user_id}", response_model=Page[TaskRead])
+async def list_user_tasks(user_id: int, page: PageParams = Depends(), filters: TaskFilters = Depends(), current_user=Depends(get_current_claims), db: AsyncSession = Depends(get_db)):
+    if current_user.role != RoleEnum.company_admin and current_user.id != user_id:
         raise HTTPException(status_code=403, detail="You can only view your own tasks")
-    return db.query(Task).filter(Task.assigned_to_id == user_id).all()
+    filters.assigned_to_id = None
+    if FAST_LIST_RESPONSES:
+        return json_page(await read_user_task_rows(db, user_id, page, **vars(filters)), TASK_SHAPE)
+    return await read_user_tasks(db, user_id, page, **vars(filters))
 
 
 @router.delete("/{task_id}", dependencies=[Depends(require_role(RoleEnum.company_admin, RoleEnum.department_manager))])
-def delete(task_id: int, db: Session = Depends(get_db)):
-    if not db.query(Task).filter(Task.id == task_id).first():
-        raise HTTPException(status_code=404, detail="Task not found")
-    delete_task(db, task_id)
-    return {"detail": "Task deleted successfully"}
\ No newline at end of file
+async def delete(task_id: int, user=Depends(get_current_claims), db: AsyncSession = Depends(get_db)):
+    department_id = await check_task_exists(db, task_id)
+    await authorize_department(db, user, department_id, manage=True, detail="You can only manage tasks of your own department")
+    await delete_task(db, task_id)
+    return {"detail": "Task deleted successfully"}
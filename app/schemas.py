@@ -1,8 +1,14 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional
+from typing import Dict, Generic, List, Optional, TypeVar
 import enum
 from datetime import datetime
 
+T = TypeVar("T")
+
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None
+
 class RoleEnum(str, enum.Enum):
     company_admin = "company_admin"
     department_manager = "department_manager"
@@ -38,6 +44,12 @@ class RefreshTokenRequest(BaseModel):
 class TokenData(BaseModel):
     user_id: Optional[int]
 
+class TokenClaims(BaseModel):
+    id: int
+    role: RoleEnum
+    company_id: Optional[int] = None
+    token_version: int = 0
+
 class ChangePasswordRequest(BaseModel):
     old_password: str
     new_password: str
@@ -58,6 +70,17 @@ class UserCreateByAdmin(BaseModel):
     password: str = Field(..., min_length=6)
     role: RoleEnum
 
+class UserImportRowResult(BaseModel):
+    row: int
+    ok: bool
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
+class UserImportReport(BaseModel):
+    created: int
+    failed: int
+    results: List[UserImportRowResult]
+
 class UserRead(BaseModel):
     id: int
     first_name: str
@@ -137,7 +160,7 @@ class TaskCreate(BaseModel):
     description: Optional[str] = None
     assigned_to: Optional[int] = None
     department_id: int
-    deadline: Optional[str] = None
+    deadline: Optional[datetime] = None
     
 class TaskRead(BaseModel):
     id: int
@@ -162,10 +185,34 @@ class TaskUpdate(BaseModel):
     status: Optional[str] = None
     assigned_to_id: Optional[int] = None
     department_id: Optional[int] = None
+    deadline: Optional[datetime] = None
     
 class TaskDelete(BaseModel):
     id: int
 
+BULK_MAX_ITEMS = 5000
+
+class TaskBulkCreate(BaseModel):
+    items: List[TaskCreate] = Field(..., min_length=1, max_length=BULK_MAX_ITEMS)
+
+class TaskBulkUpdateItem(TaskUpdate):
+    id: int
+
+class TaskBulkUpdate(BaseModel):
+    items: List[TaskBulkUpdateItem] = Field(..., min_length=1, max_length=BULK_MAX_ITEMS)
+
+class BulkDelete(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=BULK_MAX_ITEMS)
+
+class BulkItemResult(BaseModel):
+    index: int
+    id: Optional[int] = None
+    ok: bool
+    detail: Optional[str] = None
+
+class BulkResult(BaseModel):
+    results: List[BulkItemResult]
+
 class SubtaskCreate(BaseModel):
     title: str
     description: Optional[str] = None
@@ -193,4 +240,109 @@ class SubtaskUpdate(BaseModel):
 
 class SubtaskDelete(BaseModel):
     id: int
-    
+
+class SubtaskBulkCreate(BaseModel):
+    items: List[SubtaskCreate] = Field(..., min_length=1, max_length=BULK_MAX_ITEMS)
+
+class SubtaskBulkUpdateItem(SubtaskUpdate):
+    id: int
+
+class SubtaskBulkUpdate(BaseModel):
+    items: List[SubtaskBulkUpdateItem] = Field(..., min_length=1, max_length=BULK_MAX_ITEMS)
+
+
+
+# sync: ichma-ich obyektlarsiz, faqat ustunlar
+class TaskSyncRead(BaseModel):
+    id: int
+    title: str
+    description: Optional[str] = None
+    status: str
+    assigned_to_id: Optional[int] = None
+    department_id: int
+    deadline: Optional[datetime] = None
+    created_at: datetime
+    updated_at: datetime
+    completed_at: Optional[datetime] = None
+    class Config:
+        from_attributes = True
+
+class DepartmentUserSyncRead(BaseModel):
+    id: int
+    user_id: int
+    department_id: int
+    created_at: datetime
+    updated_at: datetime
+    class Config:
+        from_attributes = True
+
+class SyncDeleted(BaseModel):
+    tasks: List[int] = []
+    subtasks: List[int] = []
+    departments: List[int] = []
+    department_users: List[int] = []
+
+class SyncResponse(BaseModel):
+    cursor: str
+    reset: bool = False
+    has_more: bool = False
+    tasks: List[TaskSyncRead] = []
+    subtasks: List[SubtaskRead] = []
+    departments: List[DepartmentRead] = []
+    department_users: List[DepartmentUserSyncRead] = []
+    deleted: SyncDeleted = Field(default_factory=SyncDeleted)
+
+class MessageRead(BaseModel):
+    id: int
+    content: str
+    chat_type: str
+    room: str
+    sender_id: Optional[int] = None
+    created_at: datetime
+    class Config:
+        from_attributes = True
+
+class MessagePage(BaseModel):
+    items: List[MessageRead]
+    prev_cursor: Optional[str] = None
+    next_cursor: Optional[str] = None
+    has_more: bool = False
+
+
+class AssigneeLoad(BaseModel):
+    assignee_id: Optional[int] = None
+    to_do: int = 0
+    doing: int = 0
+    done: int = 0
+    total: int = 0
+
+class DepartmentStats(BaseModel):
+    department_id: int
+    total: int
+    by_status: Dict[str, int]
+    overdue: int
+    by_assignee: List[AssigneeLoad]
+
+
+class AssigneeSummary(BaseModel):
+    id: int
+    first_name: str
+    last_name: str
+    class Config:
+        from_attributes = True
+
+class TaskTreeRead(BaseModel):
+    id: int
+    title: str
+    description: Optional[str] = None
+    status: str
+    department_id: int
+    assigned_to_id: Optional[int] = None
+    assigned_to: Optional[AssigneeSummary] = None
+    deadline: Optional[datetime] = None
+    created_at: datetime
+    updated_at: datetime
+    completed_at: Optional[datetime] = None
+    subtasks: List[SubtaskRead] = []
+    class Config:
+        from_attributes = True
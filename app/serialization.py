@@ -0,0 +1,54 @@
+import os
+from fastapi import Response
+from pydantic import BaseModel
+from pydantic_core import to_json
+from .models import Task, User, Department
+from .schemas import TaskRead, UserRead, DepartmentRead
+
+# 1 bo'lsa katta ro'yxatlar ORM obyektlarisiz, ustun tuple'laridan to'g'ridan-to'g'ri JSON qilinadi
+FAST_LIST_RESPONSES = os.getenv("FAST_LIST_RESPONSES", "0").lower() not in ("0", "false", "no")
+
+
+class RowShape:
+    """Column plan for serializing a response schema straight from row tuples.
+
+    Flat fields come from ``model`` by name; ``nested`` maps a field to
+    ``(schema, entity)`` for joined objects (None when the joined id is NULL).
+    Rows are already typed by the database, so nothing is validated again.
+    """
+
+    def __init__(self, schema: type[BaseModel], model, **nested):
+        self.columns = []
+        self.plan = []
+        for field in schema.model_fields:
+            if field in nested:
+                sub_schema, entity = nested[field]
+                names = list(sub_schema.model_fields)
+                self.plan.append((field, len(self.columns), names))
+                self.columns += [getattr(entity, name).label(f"{field}__{name}") for name in names]
+            else:
+                self.plan.append((field, len(self.columns), None))
+                self.columns.append(getattr(model, field).label(field))
+
+    def build(self, rows) -> list[dict]:
+        items = []
+        for row in rows:
+            item = {}
+            for field, start, names in self.plan:
+                if names is None:
+                    item[field] = row[start]
+                elif row[start] is None:
+                    item[field] = None
+                else:
+                    item[field] = dict(zip(names, row[start:start + len(names)]))
+            items.append(item)
+        return items
+
+
+TASK_SHAPE = RowShape(TaskRead, Task, assigned_to=(UserRead, User), department=(DepartmentRead, Department))
+USER_SHAPE = RowShape(UserRead, User)
+
+
+def json_page(page: dict, shape: RowShape, headers=None) -> Response:
+    # response_model validatsiyasi va jsonable_encoder chetlab o'tiladi: bitta o'tishda bytes
+    return Response(to_json({**page, "items": shape.build(page["items"])}), media_type="application/json", headers=headers)
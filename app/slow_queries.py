@@ -0,0 +1,250 @@
+import os
+import re
+import sys
+import time
+import random
+import logging
+import threading
+from collections import OrderedDict, Counter, deque
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from greenlet import getcurrent
+from sqlalchemy import event
+from .metrics import current_request
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# shundan sekin SQL yoziladi (ms); 0 — o'chirilgan (opt-in)
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+# sekin SELECT'ning shu ulushi uchun EXPLAIN (ANALYZE, BUFFERS) olinadi...
+SLOW_QUERY_EXPLAIN_SAMPLE = float(os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE", "0.1"))
+# ...lekin bitta so'rov uchun shu oraliqda ko'pi bilan bir marta (s)
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "300"))
+SLOW_QUERY_STATEMENTS = int(os.getenv("SLOW_QUERY_STATEMENTS", "200"))
+SLOW_QUERY_RING_SIZE = int(os.getenv("SLOW_QUERY_RING_SIZE", "500"))
+# persentillar oxirgi shuncha o'lchovdan
+SLOW_QUERY_SAMPLES = 256
+PARAM_REPR_LIMIT = 64
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w$.])-?\d+(?:\.\d+)?\b")
+_PARAM = re.compile(r"%\(\w+\)s|\$\d+|\?")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_READ_ONLY = re.compile(r"^\s*(SELECT|WITH)\b", re.I)
+# EXPLAIN ANALYZE so'rovni qayta bajaradi: yozadigan yoki yon ta'sirli so'rovlar tushmaydi
+_SIDE_EFFECTS = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|nextval|setval|pg_advisory\w*|pg_try_advisory\w*|pg_notify)\b", re.I)
+_PG_SEQ_SCAN = re.compile(r"Seq Scan on (\w+)")
+_SQLITE_SCAN = re.compile(r"\bSCAN (\w+)(?! USING)")
+# freymlari chaqiruvchi deb hisoblanmaydigan modullar
+_PLUMBING = ("app.database", "app.metrics", "app.slow_queries", "app.pool_stats", "app.pagination")
+
+
+def normalize(statement: str) -> str:
+    """SQL with literals and bind parameters as ``?`` and IN lists as ``(?...)``."""
+    sql = _WHITESPACE.sub(" ", statement).strip()
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _PARAM.sub("?", sql)
+    return _LIST.sub("(?...)", sql)
+
+
+def short_params(parameters, executemany: bool):
+    if executemany:
+        return {"rows": len(parameters), "first": short_params(parameters[0], False) if parameters else None}
+    if isinstance(parameters, dict):
+        return {key: repr(value)[:PARAM_REPR_LIMIT] for key, value in parameters.items()}
+    return [repr(value)[:PARAM_REPR_LIMIT] for value in parameters or ()]
+
+
+def caller() -> str | None:
+    """Innermost ``app.*`` function (crud or router) that issued the statement.
+
+    With the async engine the hooks run in SQLAlchemy's greenlet, so the walk
+    continues in the parent greenlet where the awaiting coroutines are.
+    """
+    frame, glet = sys._getframe(2), getcurrent()
+    while True:
+        while frame is not None:
+            module = frame.f_globals.get("__name__", "")
+            if module.startswith("app.") and not module.startswith(_PLUMBING):
+                return f"{module}.{frame.f_code.co_name}"
+            frame = frame.f_back
+        glet = glet.parent
+        if glet is None:
+            return None
+        frame = glet.gr_frame
+
+
+def percentile(ordered: list, q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class SlowStatement:
+    __slots__ = ("sql", "count", "total_ms", "max_ms", "durations", "first_seen", "last_seen",
+                 "endpoints", "callers", "params", "plan", "plan_at", "seq_scans")
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.durations: deque = deque(maxlen=SLOW_QUERY_SAMPLES)
+        self.first_seen = self.last_seen = None
+        self.endpoints = Counter()
+        self.callers = Counter()
+        self.params = None
+        self.plan = None
+        self.plan_at = 0.0
+        self.seq_scans: list[str] = []
+
+    def dump(self) -> dict:
+        ordered = sorted(self.durations)
+        return {
+            "sql": self.sql,
+            "count": self.count,
+            "total_ms": round(self.total_ms, 2),
+            "p50_ms": round(percentile(ordered, 0.50), 2),
+            "p95_ms": round(percentile(ordered, 0.95), 2),
+            "p99_ms": round(percentile(ordered, 0.99), 2),
+            "max_ms": round(self.max_ms, 2),
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+            "endpoints": dict(self.endpoints.most_common(5)),
+            "callers": dict(self.callers.most_common(5)),
+            "last_params": self.params,
+            "seq_scans": self.seq_scans,
+            "plan": self.plan,
+        }
+
+
+class SlowQueryLog:
+    """Slow statements of this worker: a ring of recent hits and per-statement aggregates.
+
+    Aggregates are keyed by normalized SQL and bounded LRU-style; hooks may
+    run in threadpool threads (DB_ASYNC=0), hence the lock.
+    """
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_MS):
+        self.threshold_ms = threshold_ms
+        self.lock = threading.Lock()
+        self.statements: OrderedDict[str, SlowStatement] = OrderedDict()
+        self.recent: deque = deque(maxlen=SLOW_QUERY_RING_SIZE)
+        self.explained = 0
+
+    def record(self, conn, cursor, statement: str, parameters, executemany: bool, elapsed_ms: float):
+        sql = normalize(statement)
+        request = current_request.get()
+        endpoint = f'{request.scope["method"]} {request.route}' if request is not None else None
+        source = caller()
+        params = short_params(parameters, executemany)
+        now = datetime.now(timezone.utc).isoformat()
+        with self.lock:
+            entry = self.statements.get(sql)
+            if entry is None:
+                entry = self.statements[sql] = SlowStatement(sql)
+                entry.first_seen = now
+                if len(self.statements) > SLOW_QUERY_STATEMENTS:
+                    self.statements.popitem(last=False)
+            self.statements.move_to_end(sql)
+            entry.count += 1
+            entry.total_ms += elapsed_ms
+            entry.max_ms = max(entry.max_ms, elapsed_ms)
+            entry.durations.append(elapsed_ms)
+            entry.last_seen = now
+            entry.endpoints[endpoint] += 1
+            entry.callers[source] += 1
+            entry.params = params
+            self.recent.append({"at": now, "ms": round(elapsed_ms, 2), "sql": sql, "endpoint": endpoint, "caller": source, "params": params})
+            explain = self._should_explain(entry, statement, executemany)
+            if explain:
+                entry.plan_at = time.monotonic()
+        if explain:
+            plan = explain_plan(conn, statement, parameters)
+            if plan is not None:
+                with self.lock:
+                    entry.plan = plan
+                    entry.seq_scans = sorted(set((_PG_SEQ_SCAN if conn.dialect.name == "postgresql" else _SQLITE_SCAN).findall(plan)))
+                    self.explained += 1
+        logger.info("slow query %.1f ms [%s | %s]: %s", elapsed_ms, endpoint, source, sql[:300])
+
+    @staticmethod
+    def _should_explain(entry: SlowStatement, statement: str, executemany: bool) -> bool:
+        if executemany or not _READ_ONLY.match(statement) or _SIDE_EFFECTS.search(statement):
+            return False
+        if entry.plan is not None and time.monotonic() - entry.plan_at < SLOW_QUERY_EXPLAIN_INTERVAL:
+            return False
+        return random.random() < SLOW_QUERY_EXPLAIN_SAMPLE
+
+    def report(self, order_by: str = "total_ms", recent: int = 0) -> dict:
+        with self.lock:
+            statements = [entry.dump() for entry in self.statements.values()]
+            ring = list(self.recent)[-recent:] if recent else []
+        statements.sort(key=lambda s: s[order_by], reverse=True)
+        return {
+            "pid": os.getpid(),
+            "threshold_ms": self.threshold_ms,
+            "explained": self.explained,
+            "statements": statements,
+            "recent": ring,
+        }
+
+    def clear(self):
+        with self.lock:
+            self.statements.clear()
+            self.recent.clear()
+
+
+def explain_plan(conn, statement: str, parameters) -> str | None:
+    """Plan of a statement that just ran, on a separate DBAPI cursor of the same connection.
+
+    Same transaction and parameters, so the plan matches what was executed.
+    On Postgres it runs inside a SAVEPOINT: a failing EXPLAIN must not abort
+    the caller's transaction. The raw cursor bypasses the engine events.
+    """
+    cursor = conn.connection.cursor()
+    try:
+        if conn.dialect.name == "postgresql":
+            cursor.execute("SAVEPOINT slow_query_explain")
+            try:
+                cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters)
+                plan = "\n".join(row[0] for row in cursor.fetchall())
+            except Exception:
+                cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                raise
+            finally:
+                cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+            return plan
+        cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+        return "\n".join(str(row[-1]) for row in cursor.fetchall())
+    except Exception:
+        logger.debug("slow query: EXPLAIN failed", exc_info=True)
+        return None
+    finally:
+        cursor.close()
+
+
+slow_query_log = SlowQueryLog()
+
+
+def attach_slow_query_log(engine) -> None:
+    """Times every statement on ``engine`` and records those over SLOW_QUERY_MS."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._slow_query_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_slow_query_started", None)
+        if started is None:
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if elapsed_ms >= slow_query_log.threshold_ms:
+            try:
+                slow_query_log.record(conn, cursor, statement, parameters, executemany, elapsed_ms)
+            except Exception:
+                logger.exception("slow query log failed")
@@ -0,0 +1,152 @@
+import csv
+import io
+import json
+from typing import Iterator
+from fastapi import HTTPException, UploadFile
+from pydantic import ValidationError
+from sqlalchemy import select, insert, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from . import hashing
+from .models import User
+from .crud import bump_versions, users_scope
+from .schemas import UserCreateByAdmin
+
+IMPORT_CHUNK_SIZE = 500
+
+CSV_TYPES = {"text/csv", "application/csv", "application/vnd.ms-excel"}
+NDJSON_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl", "application/json-lines"}
+
+
+def detect_format(upload: UploadFile) -> str:
+    name = (upload.filename or "").lower()
+    if upload.content_type in NDJSON_TYPES or name.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    if upload.content_type in CSV_TYPES or name.endswith(".csv"):
+        return "csv"
+    raise HTTPException(status_code=415, detail="Faqat CSV yoki NDJSON fayl qabul qilinadi")
+
+
+def iter_rows(upload: UploadFile, fmt: str) -> Iterator[tuple[int, dict | None, str | None]]:
+    """Yields ``(row_number, data, parse_error)`` reading the upload line by line."""
+    text = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        for row_number, row in enumerate(csv.DictReader(text), start=2):
+            yield row_number, row, None
+        return
+    for row_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            yield row_number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(data, dict):
+            yield row_number, None, "Row must be a JSON object"
+            continue
+        yield row_number, data, None
+
+
+def next_chunk(rows: Iterator, size: int) -> list:
+    chunk = []
+    for item in rows:
+        chunk.append(item)
+        if len(chunk) >= size:
+            break
+    return chunk
+
+
+async def existing_emails_phones(db: AsyncSession, emails: set, phones: set) -> tuple[set, set]:
+    # bitta set-based so'rov: har bir qator uchun ikki so'rov o'rniga
+    if not emails and not phones:
+        return set(), set()
+    rows = (await db.execute(
+        select(User.email, User.phone).filter(or_(User.email.in_(emails), User.phone.in_(phones)))
+    )).all()
+    return {row.email for row in rows}, {row.phone for row in rows}
+
+
+async def import_users(db: AsyncSession, upload: UploadFile, company_id: int) -> dict:
+    fmt = detect_format(upload)
+    rows = iter_rows(upload, fmt)
+    results = []
+    seen_emails, seen_phones = set(), set()
+
+    while True:
+        # fayl o'qish bloklovchi (SpooledTemporaryFile), threadpool'da
+        chunk = await run_in_threadpool(next_chunk, rows, IMPORT_CHUNK_SIZE)
+        if not chunk:
+            break
+
+        pending = []
+        for row_number, data, error in chunk:
+            if error is None:
+                try:
+                    user_in = UserCreateByAdmin.model_validate(data)
+                except ValidationError as e:
+                    error = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            if error is None and user_in.email in seen_emails:
+                error = "Email faylda takrorlangan"
+            elif error is None and user_in.phone in seen_phones:
+                error = "Telefon raqam faylda takrorlangan"
+            if error is not None:
+                results.append({"row": row_number, "ok": False, "id": None, "detail": error})
+                continue
+            seen_emails.add(user_in.email)
+            seen_phones.add(user_in.phone)
+            pending.append((row_number, user_in))
+
+        emails, phones = await existing_emails_phones(
+            db, {u.email for _, u in pending}, {u.phone for _, u in pending}
+        )
+        valid = []
+        for row_number, user_in in pending:
+            if user_in.email in emails:
+                results.append({"row": row_number, "ok": False, "id": None, "detail": "Bu email avval qo'shilgan"})
+            elif user_in.phone in phones:
+                results.append({"row": row_number, "ok": False, "id": None, "detail": "Bu telefon raqam avval qo'shilgan"})
+            else:
+                valid.append((row_number, user_in))
+        if not valid:
+            continue
+
+        try:
+            hashes = await hashing.hash_passwords([u.password for _, u in valid])
+        except HTTPException as e:
+            results.extend({"row": row_number, "ok": False, "id": None, "detail": e.detail} for row_number, _ in valid)
+            continue
+
+        values = [
+            dict(
+                first_name=u.first_name,
+                last_name=u.last_name,
+                email=u.email,
+                phone=u.phone,
+                hashed_password=hashed,
+                role=u.role.value,
+                company_id=company_id,
+            )
+            for (_, u), hashed in zip(valid, hashes)
+        ]
+        try:
+            ids = (await db.scalars(insert(User).returning(User.id, sort_by_parameter_order=True), values)).all()
+            await bump_versions(db, users_scope(company_id))
+            await db.commit()
+        except IntegrityError:
+            # tekshiruvdan keyin parallel so'rov shu email/telefonni qo'shgan
+            await db.rollback()
+            results.extend(
+                {"row": row_number, "ok": False, "id": None, "detail": "Email yoki telefon raqam band, qayta yuboring"}
+                for row_number, _ in valid
+            )
+            continue
+        results.extend({"row": row_number, "ok": True, "id": user_id, "detail": None} for (row_number, _), user_id in zip(valid, ids))
+
+    results.sort(key=lambda r: r["row"])
+    return {
+        "created": sum(1 for r in results if r["ok"]),
+        "failed": sum(1 for r in results if not r["ok"]),
+        "results": results,
+    }
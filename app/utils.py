@@ -1,55 +1,289 @@
-from fastapi import WebSocket, WebSocketDisconnect, Depends, HTTPException, status
-from typing import List, Dict
-from .models import RoleEnum, DepartmentUser, User
-from sqlalchemy.orm import Session
+import os
+import json
+import secrets
+import asyncio
+from collections import deque
+from fastapi import WebSocket, WebSocketDisconnect, Depends, Header, HTTPException, status
+from starlette.websockets import WebSocketState
+from typing import List, Dict, Callable
+from datetime import datetime
+from sqlalchemy import select
+from .models import RoleEnum, ChatType, DepartmentUser, User, Department
+from sqlalchemy.ext.asyncio import AsyncSession
 from .database import get_db
-from .auth import get_current_user
+from .auth import get_current_claims
+from .schemas import TokenClaims
+from .pubsub import create_backend
+from .access import get_access_set
+
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+# navbat to'lsa: drop_oldest — eng eski xabar tashlanadi; disconnect — socket yopiladi
+WS_SLOW_CONSUMER_POLICY = os.getenv("WS_SLOW_CONSUMER_POLICY", "drop_oldest")
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+# faol xonalar uchun oxirgi N ta saqlangan xabar (qayta ulanganda DB'ga bormaslik uchun)
+WS_HISTORY_SIZE = int(os.getenv("WS_HISTORY_SIZE", "100"))
+# /debug/* uchun operator tokeni (X-Debug-Token sarlavhasi); bo'sh bo'lsa endpointlar 404
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN", "")
+
+
+def room_topic(chat_type, room: str) -> str:
+    return f"private:{room}" if ChatType(chat_type) == ChatType.private else f"dept:{room}"
+
+
+class Connection:
+    """One socket with its own bounded outbound queue and writer task."""
+
+    __slots__ = ("ws", "queue", "writer", "rooms", "dropped")
+
+    def __init__(self, ws: WebSocket, maxsize: int):
+        self.ws = ws
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.writer: asyncio.Task | None = None
+        self.rooms: set[str] = set()
+        self.dropped = 0
+
 
 # WebSocket connection manager
 class ConnectionManager:
-    def __init__(self):
-        self.active: Dict[str, List[WebSocket]] = {"tasks": [], "private": {}, "dept": {}}
+    """Local sockets per topic; broadcasts go through a pub/sub backend.
+
+    With the postgres backend every worker receives every message and fans it
+    out to its own sockets, so a client sees messages no matter which worker
+    it is connected to. Delivery only enqueues: each socket has a writer task,
+    so one slow client never delays the others.
+    """
+
+    def __init__(self, backend=None, queue_size: int = WS_SEND_QUEUE_SIZE,
+                 policy: str = WS_SLOW_CONSUMER_POLICY, send_timeout: float = WS_SEND_TIMEOUT):
+        if policy not in ("drop_oldest", "disconnect"):
+            raise ValueError(f"Unknown WS_SLOW_CONSUMER_POLICY: {policy}")
+        self.rooms: Dict[str, set[Connection]] = {}
+        self.history: Dict[str, deque] = {}
+        self.connections: Dict[WebSocket, Connection] = {}
+        self.listeners: Dict[str, Callable[[str], None]] = {}
+        self.backend = backend or create_backend()
+        self.queue_size = queue_size
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.sent = 0
+        self.dropped = 0
+        self.evicted = 0
+
+    async def start(self):
+        await self.backend.start(self.deliver)
+
+    async def stop(self):
+        await self.backend.stop()
+        for ws in list(self.connections):
+            self.disconnect(ws)
+
+    def register(self, ws: WebSocket, topic: str) -> Connection:
+        conn = self.connections.get(ws)
+        if conn is None:
+            conn = self.connections[ws] = Connection(ws, self.queue_size)
+            conn.writer = asyncio.create_task(self._writer(conn))
+        conn.rooms.add(topic)
+        if topic not in self.rooms:
+            self.rooms[topic] = set()
+            if topic.startswith(("private:", "dept:")):
+                self.history[topic] = deque(maxlen=WS_HISTORY_SIZE)
+        self.rooms[topic].add(conn)
+        return conn
+
+    async def connect(self, ws: WebSocket, topic: str):
+        if getattr(ws, "client_state", None) == WebSocketState.CONNECTING:
+            await ws.accept()
+        self.register(ws, topic)
+
+    async def _writer(self, conn: Connection):
+        try:
+            while True:
+                message = await conn.queue.get()
+                async with asyncio.timeout(self.send_timeout):
+                    await conn.ws.send_text(message)
+                self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # yopilgan yoki osilib qolgan socket
+            self.disconnect(conn.ws)
+
+    async def deliver(self, topic: str, message: str):
+        # backend chaqiradi: faqat shu worker'dagi socketlar navbatiga qo'yadi
+        if topic.startswith("history:"):
+            self._remember(topic[len("history:"):], message)
+            return
+        listener = self.listeners.get(topic)
+        if listener is not None:
+            listener(message)
+            return
+        for conn in list(self.rooms.get(topic, ())):
+            self._enqueue(conn, message)
+
+    def subscribe(self, topic: str, listener: Callable[[str], None]):
+        """Hand every message on ``topic`` to an in-process listener instead of sockets."""
+        self.listeners[topic] = listener
+
+    def send(self, ws: WebSocket, message: str | dict):
+        """Queue a message for one local socket only (acks, errors)."""
+        conn = self.connections.get(ws)
+        if conn is not None:
+            self._enqueue(conn, message if isinstance(message, str) else json.dumps(message))
+
+    def _enqueue(self, conn: Connection, message: str):
+        try:
+            conn.queue.put_nowait(message)
+            return
+        except asyncio.QueueFull:
+            pass
+        if self.policy == "drop_oldest":
+            conn.queue.get_nowait()
+            conn.queue.put_nowait(message)
+            conn.dropped += 1
+            self.dropped += 1
+        else:
+            self.evicted += 1
+            self.disconnect(conn.ws)
+            asyncio.create_task(self._close(conn.ws, code=1013))
+
+    async def _close(self, ws: WebSocket, code: int):
+        try:
+            await ws.close(code=code)
+        except Exception:
+            pass
+
+    async def publish(self, topic: str, message: str | dict):
+        # payload bir marta serialize qilinadi, keyin hamma socketga shu satr yuboriladi
+        if not isinstance(message, str):
+            message = json.dumps(message)
+        await self.backend.publish(topic, message)
 
     async def connect_tasks(self, ws: WebSocket):
-        await ws.accept()
-        self.active["tasks"].append(ws)
+        await self.connect(ws, "tasks")
 
-    async def broadcast_tasks(self, message: str):
-        for ws in self.active["tasks"]:
-            await ws.send_text(message)
+    async def broadcast_tasks(self, message: str | dict):
+        await self.publish("tasks", message)
 
     async def connect_private(self, ws: WebSocket, room_id: str):
-        await ws.accept()
-        self.active["private"].setdefault(room_id, []).append(ws)
+        await self.connect(ws, room_topic(ChatType.private, room_id))
 
-    async def send_private(self, room_id: str, message: str):
-        for ws in self.active["private"].get(room_id, []):
-            await ws.send_text(message)
+    async def send_private(self, room_id: str, message: str | dict):
+        await self.publish(room_topic(ChatType.private, room_id), message)
 
     async def connect_dept(self, ws: WebSocket, dept_id: int):
-        await ws.accept()
-        key = f"dept_{dept_id}"
-        self.active["dept"].setdefault(key, []).append(ws)
+        await self.connect(ws, room_topic(ChatType.department, str(dept_id)))
+
+    async def broadcast_dept(self, dept_id: int, message: str | dict):
+        await self.publish(room_topic(ChatType.department, str(dept_id)), message)
+
+    async def connect_user(self, ws: WebSocket, user_id: int):
+        await self.connect(ws, f"user:{user_id}")
 
-    async def broadcast_dept(self, dept_id: int, message: str):
-        key = f"dept_{dept_id}"
-        for ws in self.active["dept"].get(key, []):
-            await ws.send_text(message)
+    async def notify_user(self, user_id: int, message: str | dict):
+        await self.publish(f"user:{user_id}", message)
 
     def disconnect(self, ws: WebSocket):
-        for conns in self.active.values():
-            if isinstance(conns, dict):
-                for lst in conns.values():
-                    if ws in lst: lst.remove(ws)
-            else:
-                if ws in conns: conns.remove(ws)
+        # teskari indeks: faqat shu socket a'zo bo'lgan xonalar ko'riladi
+        conn = self.connections.pop(ws, None)
+        if conn is None:
+            return
+        for topic in conn.rooms:
+            members = self.rooms.get(topic)
+            if members is not None:
+                members.discard(conn)
+                if not members:
+                    del self.rooms[topic]
+                    self.history.pop(topic, None)
+        if conn.writer is not None and conn.writer is not asyncio.current_task():
+            conn.writer.cancel()
+
+    async def publish_history(self, records: list[dict]):
+        """Fan committed chat messages out to every worker's room buffers, one publish per room."""
+        by_topic: Dict[str, list] = {}
+        for record in records:
+            by_topic.setdefault(room_topic(record["chat_type"], record["room"]), []).append(record)
+        for topic, items in by_topic.items():
+            await self.publish(f"history:{topic}", json.dumps(items, default=str))
+
+    def _remember(self, topic: str, message: str):
+        buffer = self.history.get(topic)
+        if buffer is None:
+            return
+        for record in json.loads(message):
+            record["created_at"] = datetime.fromisoformat(record["created_at"])
+            buffer.append(record)
+
+    def recent(self, topic: str, company_id: int | None, limit: int) -> list[dict] | None:
+        """Last ``limit`` messages of an active room in ``company_id``, oldest first, or None if the buffer can't tell."""
+        buffer = self.history.get(topic)
+        if buffer is None or company_id is None:
+            return None
+        # boshqa kompaniya yozuvlari hech qachon qaytarilmaydi
+        records = [r for r in buffer if r.get("company_id") == company_id]
+        if len(records) < limit:
+            return None
+        return sorted(records, key=lambda r: (r["created_at"], r["id"]))[-limit:]
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self.connections),
+            "rooms": len(self.rooms),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "evicted": self.evicted,
+            "policy": self.policy,
+            "queue_size": self.queue_size,
+        }
 
 manager = ConnectionManager()
 
 # Role-based dependency
 def require_role(*roles: RoleEnum):
-    def dep(user: User = Depends(get_current_user)):
+    # token claim'laridan tekshiriladi, users jadvaliga so'rov yo'q
+    def dep(user: TokenClaims = Depends(get_current_claims)):
         if user.role not in roles:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough privileges")
         return user
-    return dep
\ No newline at end of file
+    return dep
+
+def require_debug_token(x_debug_token: str = Header("")):
+    # kompaniya rollari emas, operator: ichki holat va SQL parametrlari hamma tenant'lar bo'yicha
+    if not DEBUG_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not secrets.compare_digest(x_debug_token.encode(), DEBUG_TOKEN.encode()):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough privileges")
+
+async def manageable_departments(db: AsyncSession, user: TokenClaims, department_ids: set) -> tuple[set, set]:
+    """Returns ``(existing, allowed)`` department ids with one query.
+
+    company_admin may manage every department of their company; a
+    department_manager only the ones where they are the manager.
+    """
+    if not department_ids:
+        return set(), set()
+    existing = set((await db.scalars(select(Department.id).filter(Department.id.in_(department_ids)))).all())
+    access = await get_access_set(db, user)
+    return existing, {department_id for department_id in existing if access.can_manage(department_id)}
+
+
+def check_bulk_errors(results: list, all_or_nothing: bool) -> None:
+    # yozishdan oldin chaqiriladi: all_or_nothing bo'lsa hech narsa yozilmaydi
+    if all_or_nothing and any(not r["ok"] for r in results):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=results)
+
+
+def department_error(department_id: int, existing: set, allowed: set) -> str | None:
+    if department_id not in existing:
+        return "Department not found"
+    if department_id not in allowed:
+        return "You can only manage tasks of your own department"
+    return None
+
+
+def bulk_update_row(item, current_completed_at=None) -> dict:
+    row = item.dict(exclude_unset=True)
+    if row.get("status") is not None:
+        # before_update listener bulk UPDATE'da ishlamaydi
+        if row["status"] == "done" and current_completed_at is None:
+            row["completed_at"] = datetime.utcnow()
+    return row
@@ -0,0 +1,100 @@
+"""Login storm benchmark for /auth/token.
+
+Registers one throwaway company admin, then fires ``--requests`` logins with
+``--concurrency`` in flight and, in parallel, polls ``/users/me`` to show how
+much the rest of the API suffers. Run it against a server started once with
+``HASH_WORKERS=0`` (inline hashing) and once with the process pool::
+
+    HASH_WORKERS=0 uvicorn app.main:app --workers 4 &
+    python -m benchmarks.login --base-url http://127.0.0.1:8000
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import httpx
+
+from benchmarks.report import summarize
+
+
+async def register(client: httpx.AsyncClient, password: str) -> tuple[str, str]:
+    suffix = uuid.uuid4().hex[:10]
+    email = f"bench-{suffix}@example.com"
+    r = await client.post("/auth/register", json={
+        "first_name": "Bench",
+        "last_name": "User",
+        "email": email,
+        "phone": f"+998{int(suffix, 16) % 10**9:09d}",
+        "password": password,
+        "company_name": f"bench-{suffix}",
+        "company_address": "-",
+        "company_phone": "-",
+    })
+    r.raise_for_status()
+    return email, r.json()["access_token"]
+
+
+async def run(base_url: str, total: int, concurrency: int) -> dict:
+    password = "bench-password"
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        email, token = await register(client, password)
+        queue: asyncio.Queue = asyncio.Queue()
+        for _ in range(total):
+            queue.put_nowait(None)
+
+        login_samples, login_errors = [], 0
+        other_samples, other_errors = [], 0
+        done = asyncio.Event()
+
+        async def login_worker():
+            nonlocal login_errors
+            while not queue.empty():
+                queue.get_nowait()
+                start = time.perf_counter()
+                r = await client.post("/auth/token", data={"username": email, "password": password})
+                if r.status_code == 200:
+                    login_samples.append((time.perf_counter() - start) * 1000)
+                else:
+                    login_errors += 1
+
+        async def poller():
+            # login bo'ronida boshqa endpointlar qanchalik sekinlashadi
+            nonlocal other_errors
+            headers = {"Authorization": f"Bearer {token}"}
+            while not done.is_set():
+                start = time.perf_counter()
+                r = await client.get("/users/me", headers=headers)
+                if r.status_code == 200:
+                    other_samples.append((time.perf_counter() - start) * 1000)
+                else:
+                    other_errors += 1
+                await asyncio.sleep(0.01)
+
+        started = time.perf_counter()
+        poll_task = asyncio.create_task(poller())
+        await asyncio.gather(*(login_worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await poll_task
+
+    return {
+        "base_url": base_url,
+        "concurrency": concurrency,
+        "/auth/token": summarize(login_samples, login_errors, elapsed),
+        "/users/me": summarize(other_samples, other_errors, elapsed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.base_url, args.requests, args.concurrency)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
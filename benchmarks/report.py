@@ -0,0 +1,81 @@
+"""Latency summaries and baseline comparison shared by the benchmarks.
+
+A report is plain JSON: ``{"endpoints": {label: summary, ...}, ...}`` where
+every summary has p50/p95/p99, throughput and error counts. A baseline is a
+report saved earlier on the same machine (``--save-baseline``); a run fails
+when an endpoint got slower or lost throughput beyond the tolerance.
+"""
+import json
+import os
+import statistics
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[idx]
+
+
+def summarize(samples: list[float], errors: int, elapsed: float) -> dict:
+    return {
+        "count": len(samples),
+        "errors": errors,
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(samples, 50), 2),
+        "p95_ms": round(percentile(samples, 95), 2),
+        "p99_ms": round(percentile(samples, 99), 2),
+        "mean_ms": round(statistics.fmean(samples), 2) if samples else 0.0,
+    }
+
+
+def baseline_path(profile: str, directory: str = BASELINE_DIR) -> str:
+    return os.path.join(directory, f"{profile}.json")
+
+
+def load_baseline(path: str) -> dict | None:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path: str, report: dict) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def error_rate(summary: dict) -> float:
+    total = summary["count"] + summary["errors"]
+    return summary["errors"] / total if total else 0.0
+
+
+def compare(report: dict, baseline: dict, tolerance: float, slack_ms: float) -> list[str]:
+    """Regressions of ``report`` against ``baseline``, one line each.
+
+    Latency may grow by ``tolerance`` (0.2 = 20%) plus ``slack_ms`` (noise on
+    sub-millisecond endpoints), throughput may drop by ``tolerance``, and the
+    error rate may grow by at most one percentage point.
+    """
+    regressions = []
+    for label, base in sorted(baseline["endpoints"].items()):
+        current = report["endpoints"].get(label)
+        if current is None:
+            regressions.append(f"{label}: not measured in this run")
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            limit = base[key] * (1 + tolerance) + slack_ms
+            if current[key] > limit:
+                regressions.append(f"{label}: {key} {current[key]} > {round(limit, 2)} (baseline {base[key]})")
+        floor = base["throughput_rps"] * (1 - tolerance)
+        if current["throughput_rps"] < floor:
+            regressions.append(
+                f"{label}: throughput_rps {current['throughput_rps']} < {round(floor, 2)} (baseline {base['throughput_rps']})")
+        if error_rate(current) > error_rate(base) + 0.01:
+            regressions.append(f"{label}: error rate {error_rate(current):.2%} (baseline {error_rate(base):.2%})")
+    return regressions
@@ -0,0 +1,139 @@
+"""List serialization micro-benchmark: ORM + response_model vs row tuples.
+
+For each list schema in ``app.schemas`` builds ``--rows`` items in memory
+and times two ways of turning one ``Page`` into response bytes:
+
+* ``orm``  — ORM objects through FastAPI's own ``serialize_response``
+  (validation with ``from_attributes``) and ``JSONResponse``, as the
+  endpoints do by default;
+* ``fast`` — column tuples through ``RowShape.build`` and pydantic-core
+  ``to_json`` (``FAST_LIST_RESPONSES=1``).
+
+No database is involved, so ORM hydration is not counted; the real gap is
+wider than reported here.
+
+    python -m benchmarks.serialization --rows 10000 --repeat 5
+"""
+import argparse
+import asyncio
+import gc
+import json
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from app.models import Department, Task, User, RoleEnum, TaskStatusEnum
+from app.schemas import DepartmentRead, Page, TaskRead, UserRead
+from app.serialization import TASK_SHAPE, USER_SHAPE, RowShape, json_page
+
+NOW = datetime(2026, 1, 1)
+
+
+def user_values(i: int) -> dict:
+    return dict(id=i, first_name=f"first{i}", last_name=f"last{i}", email=f"user{i}@example.com",
+                phone=f"+99890{i:07d}", role=RoleEnum.employee, company_id=1)
+
+
+def department_values(i: int) -> dict:
+    return dict(id=i, name=f"department {i}", description="x" * 40, manager_id=1)
+
+
+def task_values(i: int) -> dict:
+    return dict(id=i, title=f"task {i}", description="y" * 80, status=TaskStatusEnum.doing,
+                assigned_to_id=i if i % 4 else None, department_id=i % 50,
+                deadline=NOW + timedelta(days=i % 30), created_at=NOW, updated_at=NOW, completed_at=None)
+
+
+def make_user(i):
+    return User(**user_values(i)), tuple(user_values(i).values())
+
+
+def make_department(i):
+    return Department(**department_values(i)), tuple(department_values(i).values())
+
+
+def make_task(i):
+    task = Task(**task_values(i))
+    task.department = Department(**department_values(task.department_id))
+    task.assigned_to = User(**user_values(task.assigned_to_id)) if task.assigned_to_id else None
+    values = task_values(i)
+    row = []
+    for field, start, names in TASK_SHAPE.plan:
+        if field == "assigned_to":
+            row += user_values(values["assigned_to_id"]).values() if values["assigned_to_id"] else [None] * len(names)
+        elif field == "department":
+            row += department_values(values["department_id"]).values()
+        else:
+            row.append(values[field])
+    return task, tuple(row)
+
+
+CASES = {
+    "TaskRead": (TaskRead, TASK_SHAPE, make_task),
+    "UserRead": (UserRead, USER_SHAPE, make_user),
+    "DepartmentRead": (DepartmentRead, RowShape(DepartmentRead, Department), make_department),
+}
+
+
+async def orm_path(field, objects: list) -> bytes:
+    content = await serialize_response(field=field, response_content={"items": objects, "next_cursor": None}, is_coroutine=True)
+    return JSONResponse(content).body
+
+
+def fast_path(shape: RowShape, rows: list) -> bytes:
+    return json_page({"items": rows, "next_cursor": None}, shape).body
+
+
+async def bench(name: str, rows: int, repeat: int) -> dict:
+    schema, shape, make = CASES[name]
+    objects, tuples = zip(*(make(i) for i in range(1, rows + 1)))
+    objects, tuples = list(objects), list(tuples)
+    field = create_model_field(name="Response_" + name, type_=Page[schema], mode="serialization")
+
+    orm_body = await orm_path(field, objects)
+    fast_body = fast_path(shape, tuples)
+    same = json.loads(orm_body) == json.loads(fast_body)
+
+    timings = {"orm": [], "fast": []}
+    for _ in range(repeat):
+        # oldingi yo'l qoldirgan axlat keyingisining o'lchoviga tushmasin
+        gc.collect()
+        started = time.perf_counter()
+        await orm_path(field, objects)
+        timings["orm"].append(time.perf_counter() - started)
+        gc.collect()
+        started = time.perf_counter()
+        fast_path(shape, tuples)
+        timings["fast"].append(time.perf_counter() - started)
+
+    orm_ms, fast_ms = (statistics.median(timings[k]) * 1000 for k in ("orm", "fast"))
+    return {
+        "schema": name,
+        "rows": rows,
+        "identical_output": same,
+        "orm_ms": round(orm_ms, 2),
+        "fast_ms": round(fast_ms, 2),
+        "speedup": round(orm_ms / fast_ms, 1) if fast_ms else None,
+        "bytes": len(fast_body),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--schema", choices=sorted(CASES), action="append")
+    args = parser.parse_args()
+
+    async def run():
+        return [await bench(name, args.rows, args.repeat) for name in args.schema or CASES]
+
+    print(json.dumps(asyncio.run(run()), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""Workload profiles against a running server: per-endpoint latency, throughput and baselines.
+
+Logs in as users from the ``benchmarks.seed`` manifest and runs one or all
+profiles, each for ``--warmup`` + ``--duration`` seconds with
+``--concurrency`` requests in flight (closed loop):
+
+* ``login`` — login storm on ``POST /auth/token`` (bcrypt on every request);
+* ``board`` — board polling on ``GET /tasks/department/{id}``, with
+  ``If-None-Match`` like a real client (``--no-etag`` to always miss);
+* ``bulk``  — ``POST``, ``PATCH`` and ``DELETE /tasks/bulk`` on ``--batch``
+  tasks per round, so the data set does not grow;
+* ``chat``  — ``--sockets`` websockets on ``/chat/department/{id}`` over the
+  ``--rooms`` busiest departments; ``--senders`` of them send ``--rate``
+  messages a second, ack and fan-out delivery latency are measured.
+
+The report is JSON with p50/p95/p99 and throughput per endpoint. It is
+compared with ``baselines/<profile>.json`` and the process exits with 1 when
+something regressed beyond ``--tolerance``; record the baselines once on
+the reference machine with ``--save-baseline``::
+
+    python -m benchmarks.workload --profile all --manifest bench-seed.json --save-baseline
+    python -m benchmarks.workload --profile all --manifest bench-seed.json --output run.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import Counter, defaultdict, deque
+from dataclasses import dataclass
+
+import httpx
+
+from benchmarks.report import BASELINE_DIR, baseline_path, compare, load_baseline, save_baseline, summarize
+
+PROFILES = ("login", "board", "bulk", "chat")
+MANAGING_ROLES = ("company_admin", "department_manager")
+LOGIN_CONCURRENCY = 8
+
+
+@dataclass
+class Session:
+    email: str
+    role: str
+    departments: list[int]
+    token: str
+
+    @property
+    def headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.token}"}
+
+
+class Recorder:
+    """Latencies per endpoint label; nothing is kept before ``start`` (warm-up)."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = Counter()
+        self.statuses = defaultdict(Counter)
+        self.started = None
+        self.elapsed = 0.0
+
+    @property
+    def measuring(self) -> bool:
+        return self.started is not None and not self.elapsed
+
+    def start(self):
+        self.started = time.perf_counter()
+
+    def stop(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    def add(self, label: str, ms: float, status, ok: bool):
+        if not self.measuring:
+            return
+        self.statuses[label][str(status)] += 1
+        if ok:
+            self.samples[label].append(ms)
+        else:
+            self.errors[label] += 1
+
+    def endpoints(self) -> dict:
+        return {
+            label: {**summarize(self.samples[label], self.errors[label], self.elapsed), "statuses": dict(self.statuses[label])}
+            for label in sorted(set(self.samples) | set(self.errors))
+        }
+
+
+async def timed(recorder: Recorder, label: str, send, ok=(200,)) -> httpx.Response | None:
+    started = time.perf_counter()
+    try:
+        response = await send
+    except httpx.HTTPError as e:
+        recorder.add(label, 0.0, type(e).__name__, False)
+        return None
+    recorder.add(label, (time.perf_counter() - started) * 1000, response.status_code, response.status_code in ok)
+    return response
+
+
+async def closed_loop(recorder: Recorder, step, args):
+    loop = asyncio.get_running_loop()
+    stop_at = loop.time() + args.warmup + args.duration
+    loop.call_later(args.warmup, recorder.start)
+
+    async def worker(index: int):
+        while loop.time() < stop_at:
+            await step(index)
+
+    await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+    recorder.stop()
+
+
+async def login_sessions(client: httpx.AsyncClient, manifest: dict, count: int, rng: random.Random, roles=None) -> list[Session]:
+    pool = [u for u in manifest["users"] if u["departments"] and (roles is None or u["role"] in roles)]
+    if not pool:
+        raise SystemExit(f"manifest has no users with departments for roles {roles}")
+    chosen = rng.sample(pool, min(count, len(pool)))
+    slots = asyncio.Semaphore(LOGIN_CONCURRENCY)
+
+    async def login(user: dict) -> Session:
+        async with slots:
+            r = await client.post("/auth/token", data={"username": user["email"], "password": manifest["password"]})
+        r.raise_for_status()
+        return Session(user["email"], user["role"], user["departments"], r.json()["access_token"])
+
+    return list(await asyncio.gather(*(login(user) for user in chosen)))
+
+
+async def login_profile(client, manifest, args, recorder, rng):
+    users = manifest["users"]
+
+    async def step(index: int):
+        user = rng.choice(users)
+        await timed(recorder, "POST /auth/token",
+                    client.post("/auth/token", data={"username": user["email"], "password": manifest["password"]}))
+
+    await closed_loop(recorder, step, args)
+
+
+async def board_profile(client, manifest, args, recorder, rng):
+    sessions = await login_sessions(client, manifest, args.sessions, rng)
+    etags: dict[tuple[int, int], str] = {}
+
+    async def step(index: int):
+        session = sessions[index % len(sessions)]
+        department_id = rng.choice(session.departments)
+        headers = session.headers
+        if args.etag and (index, department_id) in etags:
+            headers = {**headers, "If-None-Match": etags[(index, department_id)]}
+        r = await timed(recorder, "GET /tasks/department/{department_id}",
+                        client.get(f"/tasks/department/{department_id}", params={"limit": args.page_size}, headers=headers),
+                        ok=(200, 304))
+        if r is not None and "etag" in r.headers:
+            etags[(index, department_id)] = r.headers["etag"]
+        if args.think_ms:
+            await asyncio.sleep(args.think_ms / 1000)
+
+    await closed_loop(recorder, step, args)
+
+
+async def bulk_profile(client, manifest, args, recorder, rng):
+    sessions = await login_sessions(client, manifest, args.sessions, rng, roles=MANAGING_ROLES)
+
+    async def step(index: int):
+        session = sessions[index % len(sessions)]
+        department_id = rng.choice(session.departments)
+        items = [{"title": f"bench {index}-{i}", "department_id": department_id} for i in range(args.batch)]
+        r = await timed(recorder, "POST /tasks/bulk", client.post("/tasks/bulk", json={"items": items}, headers=session.headers))
+        ids = [result["id"] for result in r.json()["results"] if result["ok"]] if r is not None and r.status_code == 200 else []
+        if not ids:
+            return
+        await timed(recorder, "PATCH /tasks/bulk", client.patch(
+            "/tasks/bulk", json={"items": [{"id": task_id, "status": "doing"} for task_id in ids]}, headers=session.headers))
+        await timed(recorder, "DELETE /tasks/bulk", client.request(
+            "DELETE", "/tasks/bulk", json={"ids": ids}, headers=session.headers))
+
+    await closed_loop(recorder, step, args)
+
+
+async def chat_profile(client, manifest, args, recorder, rng):
+    import websockets
+
+    sessions = await login_sessions(client, manifest, args.sessions, rng)
+    # eng ko'p a'zoli bo'limlar: seed'dagi notekislik chat'da ham "issiq" xonalar beradi
+    rooms = [d for d, _ in Counter(d for s in sessions for d in s.departments).most_common(args.rooms)]
+    ws_url = args.base_url.replace("http", "ws", 1)
+    slots = asyncio.Semaphore(LOGIN_CONCURRENCY * 4)
+
+    async def connect(index: int):
+        room = rooms[index % len(rooms)]
+        session = rng.choice([s for s in sessions if room in s.departments])
+        async with slots:
+            ws = await websockets.connect(f"{ws_url}/chat/department/{room}?token={session.token}", max_queue=None)
+        return room, ws
+
+    sockets = await asyncio.gather(*(connect(i) for i in range(args.sockets)))
+    room_size = Counter(room for room, _ in sockets)
+    pending = [deque() for _ in sockets]
+    expected = delivered = 0
+
+    async def reader(index: int, ws):
+        nonlocal delivered
+        async for raw in ws:
+            message = json.loads(raw) if raw.startswith("{") else {}
+            if message.get("type") in ("ack", "error") and pending[index]:
+                sent = pending[index].popleft()
+                recorder.add("WS /chat/department/{dept_id} ack", (time.perf_counter() - sent) * 1000,
+                             message["type"], message["type"] == "ack")
+            elif "bench" in message and message["from"] != index and recorder.measuring and message["sent"] >= recorder.started:
+                delivered += 1
+                recorder.add("WS /chat/department/{dept_id} fanout", (time.perf_counter() - message["sent"]) * 1000, "ok", True)
+
+    async def sender(index: int, room: int, ws, stop_at: float):
+        nonlocal expected
+        seq = 0
+        loop = asyncio.get_running_loop()
+        while loop.time() < stop_at:
+            sent = time.perf_counter()
+            pending[index].append(sent)
+            await ws.send(json.dumps({"bench": seq, "from": index, "sent": sent}))
+            if recorder.measuring:
+                expected += room_size[room] - 1
+            seq += 1
+            await asyncio.sleep(1 / args.rate)
+
+    readers = [asyncio.create_task(reader(i, ws)) for i, (_, ws) in enumerate(sockets)]
+    loop = asyncio.get_running_loop()
+    stop_at = loop.time() + args.warmup + args.duration
+    loop.call_later(args.warmup, recorder.start)
+    senders = rng.sample(range(len(sockets)), min(args.senders, len(sockets)))
+    await asyncio.gather(*(sender(i, *sockets[i], stop_at) for i in senders))
+    # yo'ldagi xabarlar yetib kelsin
+    await asyncio.sleep(args.drain)
+    recorder.stop()
+    # javobsiz qolgan va yetib kelmagan xabarlar xato sifatida
+    recorder.errors["WS /chat/department/{dept_id} ack"] += sum(len(p) for p in pending)
+    recorder.errors["WS /chat/department/{dept_id} fanout"] += max(0, expected - delivered)
+    for task in readers:
+        task.cancel()
+    await asyncio.gather(*(ws.close() for _, ws in sockets), *readers, return_exceptions=True)
+
+
+PROFILE_RUNNERS = {"login": login_profile, "board": board_profile, "bulk": bulk_profile, "chat": chat_profile}
+
+
+async def run(args, manifest: dict) -> dict:
+    reports = {}
+    limits = httpx.Limits(max_connections=args.concurrency + LOGIN_CONCURRENCY, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60, limits=limits) as client:
+        for profile in (PROFILES if args.profile == "all" else (args.profile,)):
+            recorder = Recorder()
+            await PROFILE_RUNNERS[profile](client, manifest, args, recorder, random.Random(args.seed))
+            reports[profile] = {
+                "profile": profile,
+                "base_url": args.base_url,
+                "duration_s": round(recorder.elapsed, 2),
+                "params": {key: value for key, value in vars(args).items() if key not in ("output", "save_baseline", "profile")},
+                "endpoints": recorder.endpoints(),
+            }
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--manifest", default="bench-seed.json", help="written by benchmarks.seed")
+    parser.add_argument("--profile", choices=(*PROFILES, "all"), default="all")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--sessions", type=int, default=64, help="users logged in up front (board, bulk, chat)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--think-ms", type=float, default=0, help="pause between polls of one client")
+    parser.add_argument("--no-etag", dest="etag", action="store_false")
+    parser.add_argument("--batch", type=int, default=100, help="tasks per bulk request")
+    parser.add_argument("--rooms", type=int, default=10)
+    parser.add_argument("--sockets", type=int, default=200)
+    parser.add_argument("--senders", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=2, help="messages per second per sender")
+    parser.add_argument("--drain", type=float, default=2, help="seconds to wait for in-flight messages")
+    parser.add_argument("--baseline-dir", default=BASELINE_DIR)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--slack-ms", type=float, default=1.0, help="allowed absolute latency growth")
+    parser.add_argument("--output", help="also write the JSON report here")
+    args = parser.parse_args()
+
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+    reports = asyncio.run(run(args, manifest))
+    regressions = {}
+    for profile, report in reports.items():
+        path = baseline_path(profile, args.baseline_dir)
+        if args.save_baseline:
+            save_baseline(path, report)
+            continue
+        baseline = load_baseline(path)
+        if baseline is not None:
+            regressions[profile] = compare(report, baseline, args.tolerance, args.slack_ms)
+    result = {"profiles": reports, "regressions": regressions}
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    if any(regressions.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
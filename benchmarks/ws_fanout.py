@@ -0,0 +1,88 @@
+"""In-process websocket fan-out benchmark.
+
+Registers ``--sockets`` fake websockets in one department room (a
+``--slow`` fraction of them take ``--slow-ms`` per send) and broadcasts
+``--messages`` messages through the memory backend. Reports how long the
+fast sockets take to receive everything and what the slow-consumer policy
+did with the rest.
+
+    python -m benchmarks.ws_fanout --sockets 10000 --policy drop_oldest
+"""
+import argparse
+import asyncio
+import json
+import time
+
+DEPT_ID = 1
+
+
+class FakeSocket:
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.received = 0
+
+    async def send_text(self, message: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.received += 1
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+async def run(args) -> dict:
+    from app.pubsub import InProcessBackend
+    from app.utils import ConnectionManager
+
+    manager = ConnectionManager(InProcessBackend(), queue_size=args.queue_size, policy=args.policy)
+    await manager.start()
+    slow_every = int(1 / args.slow) if args.slow else 0
+    fast, slow = [], []
+    for i in range(args.sockets):
+        is_slow = slow_every and i % slow_every == 0
+        ws = FakeSocket(args.slow_ms / 1000 if is_slow else 0)
+        (slow if is_slow else fast).append(ws)
+        manager.register(ws, f"dept:{DEPT_ID}")
+
+    started = time.perf_counter()
+    for seq in range(args.messages):
+        await manager.broadcast_dept(DEPT_ID, {"seq": seq, "text": "x" * args.size})
+        # haqiqiy publisher (DB/tarmoq) shu yerda event loop'ga navbat beradi
+        await asyncio.sleep(0)
+    publish_s = time.perf_counter() - started
+    deadline = started + args.timeout
+    while time.perf_counter() < deadline and any(ws.received < args.messages for ws in fast):
+        await asyncio.sleep(0.005)
+    delivered_s = time.perf_counter() - started
+
+    stats = manager.stats()
+    await manager.stop()
+    return {
+        "sockets": args.sockets,
+        "slow_sockets": len(slow),
+        "messages": args.messages,
+        "publish_s": round(publish_s, 4),
+        "fast_delivered_s": round(delivered_s, 4),
+        "sends_per_s": round(len(fast) * args.messages / delivered_s),
+        "fast_received_min": min((ws.received for ws in fast), default=None),
+        "slow_received_min": min((ws.received for ws in slow), default=None),
+        "manager": stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sockets", type=int, default=10000)
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--size", type=int, default=200, help="payload text length")
+    parser.add_argument("--slow", type=float, default=0.01, help="fraction of slow sockets")
+    parser.add_argument("--slow-ms", type=float, default=50)
+    parser.add_argument("--queue-size", type=int, default=16)
+    parser.add_argument("--policy", choices=["drop_oldest", "disconnect"], default="drop_oldest")
+    parser.add_argument("--timeout", type=float, default=30)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()